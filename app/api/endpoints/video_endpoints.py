@@ -1,6 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List
 
 from app.api import deps
 from app.schemas.api import (
@@ -8,22 +7,23 @@ from app.schemas.api import (
     VideoTaskResponse,
     GenerationResponse,
     ProgressResponse,
-    ErrorResponse,
-    VideoGenerationData
+    ErrorResponse
 )
+from app.services.admission import AdmissionControl, estimate_cost
+from app.services.profiles import PREVIEW_PROFILE
 from app.services.video_generation import VideoGenerationService
 from app.core.auth import get_api_key
+from app.models.user import User
 from app.api.deps import verify_api_key, check_rate_limit, verify_quota
 from app.services.video import VideoService
 
 router = APIRouter()
 
 @router.post("/generate", response_model=VideoTaskResponse)
-async def generate_video(
+def generate_video(
     request: VideoGenerationRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(deps.get_db),
-    user_id: str = Depends(get_api_key)
+    user: User = Depends(get_api_key)
 ):
     """
     Generate a video montage with background audio.
@@ -33,27 +33,62 @@ async def generate_video(
     - If duration is specified:
         - If shorter than total video length: videos will be scaled proportionally
         - If longer than total video length: last video will loop to fill the time
+    - An optional encoding profile trades render speed for quality
+    - With preview set, a low-resolution proxy is rendered as a separate task
+    - Renditions lists extra output heights, encoded in the same render
+    - With output_format "hls", playlist_url can be played before the task is done
+    - All clips are converted to one frame rate, fps if given
+    - The task is rendered by a worker process; poll its progress
+    - When the render backlog is full the request is refused with 429 or
+      503 and a Retry-After header
     """
+    # A plain def like /metrics: costing, admission and enqueueing all query
+    # the database, so FastAPI runs this in its threadpool
     service = VideoGenerationService(db)
+    background_url = str(request.data.background_url)
+    media_list = [str(url) for url in request.data.media_list]
+
+    cost = estimate_cost(db, media_list, request.data.duration, request.data.profile, request.data.renditions)
+    preview_cost = estimate_cost(db, media_list, request.data.duration, PREVIEW_PROFILE) if request.data.preview else 0.0
+    AdmissionControl(db).admit(user, cost + preview_cost)
+
+    # The preview is its own task in the priority lane, created first so
+    # workers pick it up first; it reuses the final render's downloads
+    # through the shared cache
+    preview = None
+    if request.data.preview:
+        preview = service.create_task(
+            user_id=user.id,
+            background_url=background_url,
+            media_list=media_list,
+            duration=request.data.duration,
+            profile=PREVIEW_PROFILE,
+            fps=request.data.fps,
+            cost=preview_cost
+        )
     
     # Create task
     task = service.create_task(
-        user_id=user_id,
-        background_url=request.background_url,
-        media_list=request.media_list,
-        duration=request.duration
+        user_id=user.id,
+        background_url=background_url,
+        media_list=media_list,
+        duration=request.data.duration,
+        profile=request.data.profile,
+        preview_task_id=preview.id if preview else None,
+        renditions=request.data.renditions,
+        output_format=request.data.output_format,
+        fps=request.data.fps,
+        cost=cost
     )
-    
-    # Start video generation in background
-    background_tasks.add_task(service.generate_video, task.id)
-    
+
+    # Workers claim pending tasks; rendering never runs in the API process
     return task
 
 @router.get("/progress/{task_id}", response_model=VideoTaskResponse)
 async def get_progress(
     task_id: str,
     db: Session = Depends(deps.get_db),
-    user_id: str = Depends(get_api_key)
+    user: User = Depends(get_api_key)
 ):
     """
     Get the progress of a video generation task.
@@ -61,6 +96,7 @@ async def get_progress(
     - Task status (pending, processing, done, error)
     - Progress percentage (0.0 to 1.0)
     - Output URL when complete
+    - HLS playlist URL once the first segment is ready, for HLS tasks
     - Error message if failed
     """
     service = VideoGenerationService(db)
@@ -69,7 +105,7 @@ async def get_progress(
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    if task.user_id != user_id:
+    if task.user_id != user.id:
         raise HTTPException(status_code=403, detail="Not authorized to access this task")
     
     return task
@@ -95,18 +131,24 @@ async def get_progress(
             "model": ErrorResponse
         },
         429: {
-            "description": "Rate limit or quota exceeded",
+            "description": "Rate limit or quota exceeded, or the render backlog is full and the user holds more than their share of it",
+            "model": ErrorResponse
+        },
+        503: {
+            "description": "Render backlog full; Retry-After says when to try again",
             "model": ErrorResponse
         }
     },
     summary="Generate Loop Video",
     description="Start a new video generation task that combines multiple videos with background music"
 )
-async def generate_loop_video(
+def generate_loop_video(
     request: VideoGenerationRequest,
     api_key: str = Depends(verify_api_key),
     _: None = Depends(check_rate_limit),
-    __: None = Depends(verify_quota)
+    __: None = Depends(verify_quota),
+    user: User = Depends(get_api_key),
+    db: Session = Depends(deps.get_db)
 ):
     """
     Generate a loop video by combining multiple videos with background music.
@@ -117,14 +159,26 @@ async def generate_loop_video(
     - **data.duration**: Optional duration in seconds for the final video
 
     The API will return a video ID that can be used to check the generation progress.
+    While the render backlog is full, 429 or 503 is returned with a Retry-After header.
     """
-    video_service = VideoService()
-    video_id = await video_service.start_generation(request.data)
-    
+    media_list = [str(url) for url in request.data.media_list]
+    cost = estimate_cost(db, media_list, request.data.duration)
+    AdmissionControl(db).admit(user, cost)
+
+    # Queued for the workers like /generate, so the cost just admitted is
+    # the cost the backlog counts
+    task = VideoGenerationService(db).create_task(
+        user_id=user.id,
+        background_url=str(request.data.background_url),
+        media_list=media_list,
+        duration=request.data.duration,
+        cost=cost
+    )
+
     return {
         "success": True,
         "message": "Video generation started",
-        "data": {"id": video_id}
+        "data": {"id": task.id}
     }
 
 @router.get(
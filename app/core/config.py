@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 
 class Settings(BaseSettings):
     # API Settings
@@ -19,9 +19,80 @@ class Settings(BaseSettings):
     
     # Storage
     STORAGE_DIR: str = "/app/storage"
+
+    # Downloads
+    DOWNLOAD_MAX_CONCURRENCY: int = 16  # Parallel downloads across all tasks in a process
+    DOWNLOAD_TASK_CONCURRENCY: int = 6  # Parallel downloads within a single task
+    DOWNLOAD_MIN_CHUNK_SIZE: int = 64 * 1024
+    DOWNLOAD_MAX_CHUNK_SIZE: int = 4 * 1024 * 1024
+    DOWNLOAD_TIMEOUT: float = 60.0  # Seconds without progress before a download fails
+    DOWNLOAD_RETRIES: int = 5
+    DOWNLOAD_BACKOFF_BASE: float = 0.5  # Seconds, doubled per attempt
+    DOWNLOAD_BACKOFF_MAX: float = 8.0
+    DOWNLOAD_SEGMENTS: int = 4  # Parallel byte ranges for large files
+    DOWNLOAD_SEGMENT_MIN_SIZE: int = 32 * 1024 * 1024  # Smaller files use one stream
+    DOWNLOAD_PREFIX_ENABLED: bool = True  # Fetch only the needed part of clips that get shortened
+    DOWNLOAD_PREFIX_MARGIN: float = 1.0  # Extra seconds fetched past the cut for reordered frames
+
+    # Download cache (shared by all tasks on a node)
+    DOWNLOAD_CACHE_ENABLED: bool = True
+    DOWNLOAD_CACHE_DIR: Optional[str] = None  # Defaults to STORAGE_DIR/cache
+    DOWNLOAD_CACHE_MAX_BYTES: int = 20 * 1024 ** 3
+    DOWNLOAD_CACHE_FRESH_SECONDS: int = 300  # Serve without revalidating for this long
+
+    # Media metadata index (probe results by content hash, shared by all nodes)
+    MEDIA_METADATA_CACHE_ENABLED: bool = True
+
+    # Background audio cache (decoded PCM and fitted AAC encodes, shared by all tasks on a node)
+    AUDIO_CACHE_ENABLED: bool = True
+    AUDIO_CACHE_DIR: Optional[str] = None  # Defaults to STORAGE_DIR/audio_cache
+    AUDIO_CACHE_MAX_BYTES: int = 5 * 1024 ** 3
+    AUDIO_SAMPLE_RATE: int = 44100
+    AUDIO_CHANNELS: int = 2
+
+    # FFmpeg
+    FFMPEG_BINARY: str = "ffmpeg"
+    FFPROBE_BINARY: str = "ffprobe"
+
+    # Rendering
+    RENDER_BACKEND: str = "ffmpeg"  # "ffmpeg" filtergraph, "segmented" parallel pieces, or "moviepy" as the reference
+    RENDER_SEGMENT_WORKERS: int = 0  # Encoders running at once for "segmented", 0 means one per core
+    RENDER_SEGMENT_THREADS: int = 2  # Threads per segment encoder
+    RENDER_SEGMENT_SECONDS: float = 0  # Longest piece rendered by one encoder, 0 means one piece per clip
+    STREAM_COPY_ENABLED: bool = True  # Remux instead of re-encoding when all clips match
+    SMART_RENDER_ENABLED: bool = True  # When clips match but cuts split GOPs, re-encode only those GOPs
+    SMART_RENDER_SNAP_SECONDS: float = 0  # Move cuts up to this far to a keyframe instead, 0 keeps durations exact
+    DEFAULT_ENCODING_PROFILE: str = "standard"
+    ENCODING_PROFILES_ALLOWED: List[str] = ["draft", "standard", "archive"]  # Profiles clients may request
+    OUTPUT_FPS_POLICY: str = "dominant"  # Montage frame rate: "dominant" (most timeline seconds), "max", "min" or "first" clip's
+    OUTPUT_PIX_FMT: str = "yuv420p"  # Pixel format every clip is converted to
+    RENDER_MAX_OPEN_READERS: int = 16  # Clip decoders open at once per process, 0 means unbounded
+    HLS_SEGMENT_SECONDS: int = 4  # Length of each HLS segment; the playlist is published after the first
+
+    # Render workers (python -m app.worker)
+    WORKER_CONCURRENCY: int = 4  # Tasks one worker process renders at once
+    WORKER_POLL_SECONDS: float = 1.0  # How often an idle worker looks for pending tasks
+    JOB_LEASE_SECONDS: float = 60  # A claimed job is hidden from other workers this long per heartbeat
+    JOB_HEARTBEAT_SECONDS: float = 15  # How often a worker renews the lease of each job it renders
+    JOB_MAX_ATTEMPTS: int = 3  # Claims before a job whose workers keep dying is failed
+    JOB_REAP_SECONDS: float = 30  # How often a worker requeues jobs whose lease ran out
+    JOB_MAX_RUNNING_PER_USER: int = 2  # Renders one user may have running across all workers, 0 means no cap
+    JOB_PRIORITY_MAX_SECONDS: int = 15  # Montages up to this long are scheduled with previews, ahead of longer ones
+
+    # Admission control at /generate and /loop-video, costs in megapixel-seconds of output
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_BACKLOG_SECONDS: float = 1800  # Queued work the fleet may be behind before requests are turned away
+    ADMISSION_THROUGHPUT_WINDOW_SECONDS: float = 900  # Finished jobs over this window measure fleet throughput
+    ADMISSION_MIN_THROUGHPUT: float = 4.0  # Throughput assumed at least, per second, about two 1080p streams in real time
+    ADMISSION_DEFAULT_SIZE: List[int] = [1920, 1080]  # Assumed size of clips never probed before
+    ADMISSION_DEFAULT_CLIP_SECONDS: float = 10  # Assumed length of such clips when the request gives no duration
+
+    # Ingest pipeline
+    INGEST_QUEUE_SIZE: int = 4  # Clips waiting between two stages
+    INGEST_LOAD_WORKERS: int = 2  # Clips opened/probed concurrently
     
     class Config:
         env_file = ".env"
         case_sensitive = True
 
-settings = Settings() 
\ No newline at end of file
+settings = Settings()
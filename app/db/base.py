@@ -1,28 +1,8 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-
-from app.core.config import settings
 from app.db.base_class import Base
+from app.db.session import SessionLocal, engine, get_db
+
+# Import all models here that should be included in 'create_all'
 from app.models.video_task import VideoTask
+from app.models.render_job import RenderJob
+from app.models.media_metadata import MediaMetadata
 from app.models.user import User
-
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_pre_ping=True,
-    pool_size=5,
-    max_overflow=10
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-Base = declarative_base()
-
-# Dependency
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-# Import all models here that should be included in 'create_all' 
\ No newline at end of file
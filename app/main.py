@@ -5,7 +5,11 @@ from fastapi.openapi.docs import get_swagger_ui_html, get_redoc_html
 from fastapi.openapi.utils import get_openapi
 from app.api.endpoints import video_endpoints, auth
 from app.core.config import settings
-from app.db.base import Base, engine
+from app.db.base import Base, SessionLocal, engine
+from app.utils.audio_cache import get_audio_cache
+from app.utils.download_cache import get_download_cache
+from app.services.admission import AdmissionControl
+from app.services.job_queue import JobQueue
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
@@ -103,6 +107,29 @@ async def root():
         "redoc_url": "/redoc"
     }
 
+@app.get("/metrics", tags=["Root"])
+def get_metrics():
+    """
+    Operational counters, e.g. download and audio cache hits, misses and bytes
+    saved, the render queue with the scheduler's recent decisions, and the
+    backlog admission control weighs against fleet throughput.
+    """
+    # A plain def: FastAPI runs it in its threadpool, keeping these
+    # blocking database reads off the event loop
+    cache = get_download_cache()
+    audio_cache = get_audio_cache()
+    db = SessionLocal()
+    try:
+        admission = AdmissionControl(db).stats()
+    finally:
+        db.close()
+    return {
+        "download_cache": cache.stats() if cache else None,
+        "audio_cache": audio_cache.stats() if audio_cache else None,
+        "render_queue": JobQueue().stats(),
+        "admission": admission
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
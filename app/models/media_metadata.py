@@ -0,0 +1,67 @@
+from sqlalchemy import Column, Integer, String, Float, DateTime, JSON
+from sqlalchemy.sql import func
+from app.db.base_class import Base
+from app.utils.ffmpeg import MediaInfo
+
+class MediaMetadata(Base):
+    __tablename__ = "media_metadata"
+
+    content_hash = Column(String, primary_key=True)  # SHA-256 of the downloaded bytes
+    url = Column(String, nullable=True, index=True)  # Where the bytes were first downloaded from
+    etag = Column(String, nullable=True)
+    duration = Column(Float, nullable=False)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    fps = Column(String, nullable=True)  # Rational string, e.g. "30000/1001"
+    codec = Column(String, nullable=True)
+    profile = Column(String, nullable=True)
+    pix_fmt = Column(String, nullable=True)
+    time_base = Column(String, nullable=True)
+    audio_codec = Column(String, nullable=True)
+    rotation = Column(Integer, nullable=False, default=0)
+    keyframes = Column(JSON, nullable=True)  # Keyframe times in seconds
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    @classmethod
+    def from_media_info(
+        cls,
+        content_hash: str,
+        info: MediaInfo,
+        url: str = None,
+        etag: str = None
+    ) -> "MediaMetadata":
+        return cls(
+            content_hash=content_hash,
+            url=url,
+            etag=etag,
+            duration=info.duration,
+            width=info.width,
+            height=info.height,
+            fps=info.fps,
+            codec=info.codec,
+            profile=info.profile,
+            pix_fmt=info.pix_fmt,
+            time_base=info.time_base,
+            audio_codec=info.audio_codec,
+            rotation=info.rotation,
+            keyframes=info.keyframes
+        )
+
+    def to_media_info(self) -> MediaInfo:
+        return MediaInfo(
+            duration=self.duration,
+            width=self.width,
+            height=self.height,
+            fps=self.fps,
+            codec=self.codec,
+            profile=self.profile,
+            pix_fmt=self.pix_fmt,
+            time_base=self.time_base,
+            audio_codec=self.audio_codec,
+            rotation=self.rotation,
+            keyframes=self.keyframes,
+            content_hash=self.content_hash
+        )
+
+    def __repr__(self):
+        return f"<MediaMetadata(hash={self.content_hash[:12]}, {self.width}x{self.height}, {self.duration:.3f}s)>"
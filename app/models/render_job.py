@@ -0,0 +1,30 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Index
+from app.db.base_class import Base
+
+class RenderJob(Base):
+    __tablename__ = "render_jobs"
+
+    task_id = Column(String, ForeignKey("video_tasks.id"), primary_key=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)  # Owner of the task, whose share the job counts against
+    lane = Column(String, nullable=False, default="standard")  # "priority" for previews and short montages, else "standard"
+    state = Column(String, nullable=False, default="queued")  # queued, leased, done, failed
+    # Queued jobs may be claimed from this time on; for leased ones it is
+    # when the lease runs out and the job is reaped back into the queue
+    visible_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    lease_owner = Column(String, nullable=True)  # Worker holding the lease, set anew on every claim
+    heartbeat_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)  # Claims so far, including the current one
+    claim_reason = Column(String, nullable=True)  # Why the scheduler picked it: "priority" or "fair_share"
+    queued_seconds = Column(Float, nullable=True)  # Wait from enqueue to first claim
+    cost = Column(Float, nullable=True)  # Estimated render cost in megapixel-seconds of output
+    finished_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_render_jobs_claim", "state", "visible_at"),
+        Index("ix_render_jobs_user", "user_id", "state"),
+    )
+
+    def __repr__(self):
+        return f"<RenderJob(task={self.task_id}, state={self.state}, attempts={self.attempts})>"
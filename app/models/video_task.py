@@ -7,14 +7,23 @@ class VideoTask(Base):
     __tablename__ = "video_tasks"
 
     id = Column(String, primary_key=True, index=True)
-    user_id = Column(String, ForeignKey("user.id"), nullable=False)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
     status = Column(String, nullable=False, default="pending")  # pending, processing, done, error
     progress = Column(Float, nullable=False, default=0.0)
     background_url = Column(String, nullable=False)  # URL for background audio track
     media_list = Column(JSON, nullable=False)  # List of video URLs
     duration = Column(Integer, nullable=True)  # Target duration in seconds (optional)
+    profile = Column(String, nullable=True)  # Encoding profile name, None uses the server default
+    preview_task_id = Column(String, nullable=True)  # Low-resolution proxy rendered alongside this task
+    renditions = Column(JSON, nullable=True)  # Extra output heights requested, e.g. ["720p", "480p"]
+    output_format = Column(String, nullable=True)  # "mp4" or "hls", None means mp4
+    fps = Column(Float, nullable=True)  # Output frame rate requested, None picks one by OUTPUT_FPS_POLICY
     output_url = Column(String, nullable=True)  # URL of the generated video
+    playlist_url = Column(String, nullable=True)  # HLS playlist, set once its first segment exists
+    rendition_urls = Column(JSON, nullable=True)  # URL per requested rendition
     error = Column(String, nullable=True)
+    stage_timings = Column(JSON, nullable=True)  # Start/end seconds per generation stage
+    checkpoints = Column(JSON, nullable=True)  # What each completed stage left behind, so a retry resumes there
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
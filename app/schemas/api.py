@@ -1,6 +1,8 @@
-from typing import List, Optional
-from pydantic import BaseModel, EmailStr, HttpUrl, conint, Field
+from typing import Dict, List, Optional
+from pydantic import BaseModel, EmailStr, HttpUrl, confloat, conint, Field, field_validator
 from datetime import datetime
+from app.services.hls import OUTPUT_FORMATS
+from app.services.profiles import RENDITION_HEIGHTS, available_profiles
 
 # Auth Schemas
 class CreateUserRequest(BaseModel):
@@ -33,6 +35,57 @@ class VideoGenerationData(BaseModel):
         description="Optional duration in seconds for the final video",
         example=60
     )
+    profile: Optional[str] = Field(
+        None,
+        description="Encoding profile trading speed for quality, e.g. 'draft', 'standard' or 'archive'",
+        example="standard"
+    )
+
+    preview: bool = Field(
+        False,
+        description="Also render a fast low-resolution proxy of the same montage as a separate task",
+        example=False
+    )
+    renditions: Optional[List[str]] = Field(
+        None,
+        description="Extra output sizes by frame height, all encoded from a single decode of the clips",
+        example=["720p", "480p"]
+    )
+    output_format: str = Field(
+        "mp4",
+        description="'hls' also writes segments and a playlist that can be played while the render runs",
+        example="mp4"
+    )
+    fps: Optional[confloat(gt=0, le=120)] = Field(
+        None,
+        description="Output frame rate; by default the rate covering most of the montage, capped by the profile",
+        example=30
+    )
+
+    @field_validator("profile")
+    @classmethod
+    def check_profile(cls, profile: Optional[str]) -> Optional[str]:
+        if profile is not None and profile not in available_profiles():
+            raise ValueError(f"Unknown encoding profile, expected one of {available_profiles()}")
+        return profile
+
+    @field_validator("renditions")
+    @classmethod
+    def check_renditions(cls, renditions: Optional[List[str]]) -> Optional[List[str]]:
+        if renditions is None:
+            return None
+        unknown = [name for name in renditions if name not in RENDITION_HEIGHTS]
+        if unknown:
+            raise ValueError(f"Unknown renditions {unknown}, expected any of {list(RENDITION_HEIGHTS)}")
+        # Keep the first occurrence of each, in request order
+        return list(dict.fromkeys(renditions))
+
+    @field_validator("output_format")
+    @classmethod
+    def check_output_format(cls, output_format: str) -> str:
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format, expected one of {OUTPUT_FORMATS}")
+        return output_format
 
 class VideoGenerationRequest(BaseModel):
     type: str = Field(
@@ -47,10 +100,27 @@ class VideoTaskResponse(BaseModel):
     user_id: str = Field(..., description="User ID who created the task")
     status: str = Field(..., description="Task status (pending, processing, done, error)")
     progress: float = Field(..., description="Progress percentage (0.0 to 1.0)")
+    profile: Optional[str] = Field(None, description="Encoding profile, unset means the server default")
+    preview_task_id: Optional[str] = Field(None, description="Task rendering the low-resolution preview, if one was requested")
     output_url: Optional[str] = Field(None, description="URL to the generated video")
+    playlist_url: Optional[str] = Field(
+        None,
+        description="HLS playlist, available once its first segment is written and growing until the task is done",
+        example="/storage/videos/hls_123/playlist.m3u8"
+    )
+    rendition_urls: Optional[Dict[str, str]] = Field(
+        None,
+        description="URL of each requested rendition; ones at or above the montage's height share output_url",
+        example={"720p": "/storage/videos/output_123_720p.mp4"}
+    )
     error: Optional[str] = Field(None, description="Error message if task failed")
+    stage_timings: Optional[dict] = Field(
+        None,
+        description="Start/end offsets and duration in seconds of each generation stage",
+        example={"ingest": {"start": 0.2, "end": 3.1, "seconds": 2.9}}
+    )
     created_at: datetime = Field(..., description="Task creation timestamp")
-    updated_at: datetime = Field(..., description="Last update timestamp")
+    updated_at: Optional[datetime] = Field(None, description="Last update timestamp, None until the task first changes")
 
     class Config:
         from_attributes = True
@@ -0,0 +1,138 @@
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.media_metadata import MediaMetadata
+from app.models.render_job import RenderJob
+from app.models.user import User
+from app.models.video_task import VideoTask
+from app.services.profiles import RENDITION_HEIGHTS, get_profile, rendition_size
+
+def estimate_cost(
+    db: Session,
+    media_list: List[str],
+    duration: Optional[float] = None,
+    profile: Optional[str] = None,
+    renditions: Optional[List[str]] = None
+) -> float:
+    """
+    Render cost of a montage in megapixel-seconds: the pixels of every
+    output it writes, renditions included, times its duration.
+
+    Clips probed before are looked up by URL in the media metadata cache;
+    the others are assumed to be ADMISSION_DEFAULT_SIZE and, when no
+    duration is given, ADMISSION_DEFAULT_CLIP_SECONDS long.
+    """
+    rows = db.execute(
+        select(MediaMetadata).where(MediaMetadata.url.in_(media_list)).order_by(MediaMetadata.created_at)
+    ).scalars().all()
+    # The latest probe of a URL wins
+    known = {row.url: row.to_media_info() for row in rows}
+
+    default_size = tuple(settings.ADMISSION_DEFAULT_SIZE)
+    base = next((known[url] for url in media_list if url in known), None)
+    output_size = get_profile(profile).output_size(base.size if base and base.width else default_size)
+
+    if not duration:
+        duration = sum(
+            known[url].duration if url in known else settings.ADMISSION_DEFAULT_CLIP_SECONDS
+            for url in media_list
+        )
+
+    pixels = output_size[0] * output_size[1]
+    for name in renditions or []:
+        height = RENDITION_HEIGHTS[name]
+        # Renditions at or above the montage's height are the main output
+        if height < output_size[1]:
+            width, height = rendition_size(output_size, height)
+            pixels += width * height
+    return pixels * duration / 1_000_000
+
+class AdmissionControl:
+    """
+    Turns work away at the API once the render queue holds more than the
+    fleet can finish within ADMISSION_MAX_BACKLOG_SECONDS.
+
+    The backlog is the estimated cost of every queued job plus what is
+    left of the running ones. Throughput is the cost of the jobs finished
+    over the last ADMISSION_THROUGHPUT_WINDOW_SECONDS, per second, and
+    never taken below ADMISSION_MIN_THROUGHPUT so an idle fleet, which
+    finished nothing lately, still accepts work. Dividing one by the
+    other says how long new work would wait.
+
+    A rejected user holding more than their fair share of the backlog,
+    by monthly_quota, gets 429 as they are the ones to slow down; anyone
+    else gets 503. Both carry Retry-After, the time until the backlog is
+    expected to drain below the threshold.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def throughput(self) -> float:
+        """Megapixel-seconds rendered per second across all workers"""
+        window = settings.ADMISSION_THROUGHPUT_WINDOW_SECONDS
+        finished = self.db.execute(
+            select(func.sum(RenderJob.cost))
+            .where(RenderJob.state == "done", RenderJob.finished_at >= datetime.utcnow() - timedelta(seconds=window))
+        ).scalar() or 0.0
+        return max(finished / window, settings.ADMISSION_MIN_THROUGHPUT)
+
+    def backlog(self) -> Dict[str, Tuple[float, int]]:
+        """Outstanding cost and weight per user with queued or running jobs"""
+        rows = self.db.execute(
+            select(RenderJob.user_id, RenderJob.state, RenderJob.cost, VideoTask.progress, User.monthly_quota)
+            .join(VideoTask, VideoTask.id == RenderJob.task_id)
+            .join(User, User.id == RenderJob.user_id)
+            .where(RenderJob.state.in_(("queued", "leased")), RenderJob.cost.is_not(None))
+        ).all()
+        users: Dict[str, Tuple[float, int]] = {}
+        for user_id, state, cost, progress, weight in rows:
+            # A running job only has what it has not rendered yet left
+            remaining = cost * (1.0 - progress) if state == "leased" else cost
+            users[user_id] = (users.get(user_id, (0.0, 0))[0] + remaining, max(weight or 1, 1))
+        return users
+
+    def admit(self, user: User, cost: float):
+        """Raise 429 or 503 with Retry-After if cost would take the backlog past the threshold"""
+        if not settings.ADMISSION_ENABLED:
+            return
+        users = self.backlog()
+        total = sum(outstanding for outstanding, _ in users.values())
+        throughput = self.throughput()
+        capacity = throughput * settings.ADMISSION_MAX_BACKLOG_SECONDS
+        # An empty queue takes anything, however large, so work always moves
+        if not total or total + cost <= capacity:
+            return
+
+        # Only what the user already has outstanding counts: a user with
+        # nothing queued is not the one filling the backlog
+        users.setdefault(user.id, (0.0, max(user.monthly_quota or 1, 1)))
+        fair_share = users[user.id][1] / sum(weight for _, weight in users.values())
+        over_share = users[user.id][0] > fair_share * capacity
+
+        retry_after = max(1, math.ceil((total + cost - capacity) / throughput))
+        raise HTTPException(
+            status_code=429 if over_share else 503,
+            detail=(
+                "Render backlog full; you hold more than your share of it"
+                if over_share else
+                "Render backlog full, try again later"
+            ),
+            headers={"Retry-After": str(retry_after)}
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Backlog, throughput and how many seconds of work are queued"""
+        total = sum(outstanding for outstanding, _ in self.backlog().values())
+        throughput = self.throughput()
+        return {
+            "enabled": settings.ADMISSION_ENABLED,
+            "backlog_cost": round(total, 3),
+            "throughput": round(throughput, 3),
+            "backlog_seconds": round(total / throughput, 1),
+            "max_backlog_seconds": settings.ADMISSION_MAX_BACKLOG_SECONDS
+        }
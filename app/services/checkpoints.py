@@ -0,0 +1,57 @@
+import os
+import threading
+from typing import Any, List, Optional
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
+from app.models.video_task import VideoTask
+
+# Stages of a render that leave something a retry can reuse, in order
+STAGES = ("downloads", "metadata", "encoded")
+
+class TaskCheckpoints:
+    """
+    Stage checkpoints of one task, stored in VideoTask.checkpoints.
+
+    A worker that dies mid-render leaves its files behind; the checkpoints
+    say which of them are complete, so the worker that claims the job next
+    skips every stage whose output is still there. Files are always
+    written under a temporary name and renamed once complete, so a
+    recorded path is never a partial file. Part files need no checkpoint
+    of their own: they are named after what they hold, so one that exists
+    is complete and the render reuses it.
+
+    Stages are recorded from the render's threads, which share the
+    session with the task's progress updates. Every write commits under
+    lock, which should be the one those other writers hold as well.
+    """
+
+    def __init__(self, db: Session, task: VideoTask, lock: Optional[threading.Lock] = None):
+        self.db = db
+        self.task = task
+        self._lock = lock or threading.Lock()
+
+    def get(self, stage: str, default: Any = None) -> Any:
+        return (self.task.checkpoints or {}).get(stage, default)
+
+    def record(self, stage: str, value: Any):
+        """Store a stage's checkpoint, replacing the previous one"""
+        with self._lock:
+            self._store(stage, value)
+
+    def append(self, stage: str, path: str):
+        """Add one more completed file to a list-valued stage"""
+        with self._lock:
+            self._store(stage, self.get(stage, []) + [path])
+
+    def complete(self, stage: str, paths: List[str]) -> bool:
+        """Whether stage was recorded for exactly these files and they all still exist"""
+        return self.get(stage) == paths and all(os.path.exists(path) for path in paths)
+
+    def _store(self, stage: str, value: Any):
+        checkpoints = dict(self.task.checkpoints or {})
+        checkpoints[stage] = value
+        self.task.checkpoints = checkpoints
+        # Reassigned as a new dict, but flagged anyway in case the JSON
+        # column compares equal to what it held
+        flag_modified(self.task, "checkpoints")
+        self.db.commit()
@@ -0,0 +1,106 @@
+import os
+import shutil
+from typing import List
+from app.utils.ffmpeg import run_ffmpeg
+
+PLAYLIST_NAME = "playlist.m3u8"
+OUTPUT_FORMATS = ["mp4", "hls"]
+
+class HLSOutput:
+    """
+    An HLS event playlist written while the montage renders.
+    ffmpeg rewrites the playlist after every finished segment, so a player
+    can start from the first segment while later ones are still encoding;
+    the end tag is only added once the render completes.
+    """
+
+    def __init__(self, directory: str, audio_path: str, segment_seconds: float):
+        self.directory = directory
+        self.audio_path = audio_path  # Fitted background track, copied into the segments
+        self.segment_seconds = segment_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def playlist_path(self) -> str:
+        return os.path.join(self.directory, PLAYLIST_NAME)
+
+    def output_args(self, audio_input: int) -> List[str]:
+        """
+        ffmpeg output options writing the mapped video plus input
+        audio_input's audio as segments and the growing playlist
+        """
+        return [
+            # Keyframes on every segment boundary keep segments the same length
+            "-force_key_frames", f"expr:gte(t,n_forced*{self.segment_seconds})",
+            "-map", f"{audio_input}:a:0", "-c:a", "copy",
+            *self.muxer_args()
+        ]
+
+    def muxer_args(self) -> List[str]:
+        return [
+            "-f", "hls",
+            "-hls_time", str(self.segment_seconds),
+            "-hls_playlist_type", "event",
+            # Fragmented MP4 segments remux into the MP4 download without
+            # rewriting the AAC bitstream as MPEG-TS segments would need
+            "-hls_segment_type", "fmp4",
+            # Players never see a half-written playlist or segment
+            "-hls_flags", "independent_segments+temp_file",
+            "-hls_segment_filename", os.path.join(self.directory, "segment_%05d.m4s"),
+            self.playlist_path
+        ]
+
+    def has_segment(self) -> bool:
+        """Whether the playlist lists at least one finished segment"""
+        try:
+            with open(self.playlist_path) as f:
+                return "#EXTINF" in f.read()
+        except FileNotFoundError:
+            return False
+
+    def files(self) -> List[str]:
+        """
+        The playlist and every file it lists, the fMP4 init segment
+        included; empty until the playlist is written
+        """
+        try:
+            with open(self.playlist_path) as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return []
+        files = [self.playlist_path]
+        for line in lines:
+            if line.startswith("#EXT-X-MAP:") and 'URI="' in line:
+                files.append(os.path.join(self.directory, line.split('URI="', 1)[1].split('"', 1)[0]))
+            elif line and not line.startswith("#"):
+                files.append(os.path.join(self.directory, line))
+        return files
+
+    def clear(self):
+        """Remove the playlist and segments an earlier attempt wrote"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def segment(self, video_path: str, duration: float):
+        """
+        Cut an already rendered video-only file and the background track
+        into segments without re-encoding, for renders that cannot write
+        HLS as they go. Segments then break at the existing keyframes.
+        """
+        run_ffmpeg([
+            "-i", video_path,
+            "-i", self.audio_path,
+            "-map", "0:v:0", "-c:v", "copy",
+            "-map", "1:a:0", "-c:a", "copy",
+            "-t", f"{duration:.6f}",
+            *self.muxer_args()
+        ])
+
+    def remux(self, output_path: str):
+        """Join the finished segments into a progressive MP4 download"""
+        run_ffmpeg([
+            "-i", self.playlist_path,
+            "-c", "copy",
+            "-movflags", "+faststart",
+            output_path
+        ])
@@ -0,0 +1,223 @@
+import asyncio
+import os
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+from app.core.config import settings
+from app.utils.download import downloader, task_file_path
+
+class ClipDownloadPlan:
+    """How much of a media URL needs to be downloaded"""
+
+    def __init__(self, url: str, duration: Optional[float] = None, byte_limit: Optional[int] = None):
+        self.url = url
+        self.duration = duration  # From container metadata, if it could be read
+        self.byte_limit = byte_limit  # None means the whole file
+
+async def plan_clip_downloads(urls: List[str], target_duration: Optional[float]) -> List[ClipDownloadPlan]:
+    """
+    Read the container index of every clip before downloading anything.
+    When the montage is shorter than the clips combined, each clip only
+    contributes its first duration * scale_factor seconds, so for files
+    that allow it only the bytes covering that prefix are fetched.
+    """
+    plans = [ClipDownloadPlan(url) for url in urls]
+    if not (settings.DOWNLOAD_PREFIX_ENABLED and target_duration):
+        return plans
+
+    indexes = await asyncio.gather(*(downloader.fetch_movie_index(url) for url in urls))
+    if any(index is None or not index.duration for index in indexes):
+        # Without every duration the scale factor is unknown
+        return plans
+
+    total_duration = sum(index.duration for index in indexes)
+    scale_factor = min(1.0, target_duration / total_duration)
+    for plan, index in zip(plans, indexes):
+        plan.duration = index.duration
+        if scale_factor < 1.0:
+            plan.byte_limit = index.prefix_size(
+                index.duration * scale_factor + settings.DOWNLOAD_PREFIX_MARGIN
+            )
+    return plans
+
+class IngestPipeline:
+    """
+    Streams media clips through download -> load -> normalize.
+
+    Each clip enters the next stage as soon as the previous one is done
+    with it, so network I/O overlaps with opening and normalizing clips.
+    Bounded queues between stages cap how many clips are in flight, and
+    progress is reported from the number of clips each stage has finished.
+
+    load(path, url) opens a downloaded file and normalize(clip, base_clip)
+    conforms a clip to the first clip of the montage; both run in threads.
+
+    Files in downloaded, completed by an earlier attempt at the task, are
+    not fetched again; on_downloaded is told of every file that completes.
+    on_progress and on_downloaded run in threads too, as they usually
+    write to the database.
+    """
+
+    STAGES = ("download", "load", "normalize")
+
+    def __init__(
+        self,
+        task_id: str,
+        media_list: List[str],
+        load: Callable[[str, str], Any],
+        normalize: Callable[[Any, Any], Any],
+        target_duration: Optional[float] = None,
+        on_progress: Optional[Callable[[float], None]] = None,
+        downloaded: Iterable[str] = (),
+        on_downloaded: Optional[Callable[[str], None]] = None
+    ):
+        self.task_id = task_id
+        self.media_list = media_list
+        self.load = load
+        self.normalize = normalize
+        self.target_duration = target_duration
+        self.on_progress = on_progress
+        self.downloaded = set(downloaded)
+        self.on_downloaded = on_downloaded
+        self._completed = {stage: 0 for stage in self.STAGES}
+        self._progress_lock = asyncio.Lock()
+
+    async def _advance(self, stage: str):
+        """Record one clip finishing a stage and report overall progress"""
+        self._completed[stage] += 1
+        if self.on_progress:
+            # One report at a time, so they reach on_progress in order
+            async with self._progress_lock:
+                total = len(self.STAGES) * len(self.media_list)
+                await asyncio.to_thread(self.on_progress, sum(self._completed.values()) / total)
+
+    async def _download(self, url: str, local_path: str, byte_limit: Optional[int] = None) -> Optional[str]:
+        """Download url to local_path unless an earlier attempt already did"""
+        if local_path in self.downloaded and os.path.exists(local_path):
+            return local_path
+        path = await downloader.download(url, local_path, byte_limit)
+        if path and self.on_downloaded:
+            await asyncio.to_thread(self.on_downloaded, path)
+        return path
+
+    async def run(self, background_url: str) -> Tuple[Optional[str], List[Any]]:
+        """
+        Run the pipeline for every media clip while the background track
+        downloads alongside.
+        Returns the audio path and the normalized clips in input order, with
+        None for each clip that failed to download.
+        """
+        audio_task = asyncio.create_task(
+            self._download(background_url, task_file_path(self.task_id, 0, background_url))
+        )
+        plans = await plan_clip_downloads(self.media_list, self.target_duration)
+
+        downloaded: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+        loaded: asyncio.Queue = asyncio.Queue(maxsize=settings.INGEST_QUEUE_SIZE)
+        results: List[Any] = [None] * len(self.media_list)
+        media_paths: List[Optional[str]] = [None] * len(self.media_list)
+
+        async def download_stage():
+            task_semaphore = asyncio.Semaphore(downloader.task_concurrency)
+
+            async def fetch(i: int, url: str):
+                async with task_semaphore:
+                    media_paths[i] = await self._download(
+                        url,
+                        task_file_path(self.task_id, i + 1, url),
+                        plans[i].byte_limit
+                    )
+                await self._advance("download")
+                await downloaded.put((i, media_paths[i]))
+
+            await asyncio.gather(*(fetch(i, url) for i, url in enumerate(self.media_list)))
+            for _ in range(settings.INGEST_LOAD_WORKERS):
+                await downloaded.put(None)
+
+        async def load_worker():
+            while (item := await downloaded.get()) is not None:
+                i, path = item
+                clip = await asyncio.to_thread(self.load, path, self.media_list[i]) if path else None
+                await self._advance("load")
+                await loaded.put((i, clip))
+            await loaded.put(None)
+
+        async def normalize_stage():
+            resolved = [False] * len(self.media_list)
+            base_index = None
+            waiting: List[int] = []
+            workers_left = settings.INGEST_LOAD_WORKERS
+
+            while workers_left:
+                item = await loaded.get()
+                if item is None:
+                    workers_left -= 1
+                    continue
+                i, results[i] = item
+                resolved[i] = True
+
+                if base_index is None:
+                    # The first clip that loaded, in input order, sets the
+                    # dimensions; hold the others back until it is known
+                    base_index = _first_loaded(results, resolved)
+                    waiting.append(i)
+                    if base_index is None:
+                        continue
+                    ready, waiting = waiting, []
+                else:
+                    ready = [i]
+
+                for j in ready:
+                    if results[j] is not None and j != base_index:
+                        results[j] = await asyncio.to_thread(self.normalize, results[j], results[base_index])
+                    await self._advance("normalize")
+
+            for _ in waiting:
+                await self._advance("normalize")
+
+        try:
+            async with asyncio.TaskGroup() as group:
+                group.create_task(download_stage())
+                for _ in range(settings.INGEST_LOAD_WORKERS):
+                    group.create_task(load_worker())
+                group.create_task(normalize_stage())
+        except ExceptionGroup as errors:
+            # Surface the stage's own error rather than the group wrapper
+            audio_task.cancel()
+            raise errors.exceptions[0]
+
+        await self._refetch_shortened(plans, media_paths, results)
+        return await audio_task, results
+
+    async def _refetch_shortened(self, plans: List[ClipDownloadPlan], media_paths: List[Optional[str]], results: List[Any]):
+        """
+        Prefixes were sized for every clip taking part; with one missing the
+        others are stretched further, so fetch the shortened ones in full.
+        """
+        if not any(path is None for path in media_paths):
+            return
+        limited = [i for i, plan in enumerate(plans) if plan.byte_limit and media_paths[i]]
+        if not limited:
+            return
+
+        paths = await downloader.download_files(
+            [self.media_list[i] for i in limited],
+            f"{self.task_id}/full"
+        )
+        base_index = _first_loaded(results, [True] * len(results))
+        for i, path in zip(limited, paths):
+            if not path:
+                continue
+            clip = await asyncio.to_thread(self.load, path, self.media_list[i])
+            if i != base_index:
+                clip = await asyncio.to_thread(self.normalize, clip, results[base_index])
+            if hasattr(results[i], "close"):
+                results[i].close()
+            results[i] = clip
+
+def _first_loaded(results: List[Any], resolved: List[bool]) -> Optional[int]:
+    """Index of the first loaded clip once every clip before it is resolved"""
+    for i, clip in enumerate(results):
+        if not resolved[i]:
+            return None
+        if clip is not None:
+            return i
+    return None
@@ -0,0 +1,265 @@
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.render_job import RenderJob
+from app.models.user import User
+from app.models.video_task import VideoTask
+from app.services.scheduler import FairShareScheduler, QueueHead, queue_lane
+
+# Claims counted in the scheduling decisions reported by stats()
+DECISION_WINDOW = timedelta(hours=1)
+
+class JobQueue:
+    """
+    Durable queue of render jobs, one row per task in render_jobs, shared
+    by any number of workers on any number of nodes.
+
+    A worker claims a job by leasing it: the lease hides the job from other
+    workers until visible_at, and heartbeats keep pushing that forward while
+    the render runs. A worker that dies stops heartbeating and its lease
+    runs out; reap() puts such jobs back in the queue, up to
+    JOB_MAX_ATTEMPTS claims, and the next claim resumes the task from its
+    checkpoints. Which queued job a claim takes is up to the scheduler.
+
+    On Postgres candidates are read with SELECT ... FOR UPDATE SKIP LOCKED,
+    so concurrent claims pass over each other's rows instead of waiting.
+    SQLite, the local stand-in, has no row locks; there every claim is a
+    compare-and-set on the row as it was read, and a worker that loses
+    the race moves on to the next job.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        lease_seconds: float = None,
+        max_attempts: int = None,
+        scheduler: Optional[FairShareScheduler] = None
+    ):
+        self.session_factory = session_factory
+        self.lease_seconds = lease_seconds or settings.JOB_LEASE_SECONDS
+        self.max_attempts = max_attempts or settings.JOB_MAX_ATTEMPTS
+        self.scheduler = scheduler or FairShareScheduler()
+
+    @staticmethod
+    def enqueue(db: Session, task: VideoTask, cost: Optional[float] = None):
+        """
+        Add a task's job to db's transaction, so both are stored or neither
+        is; cost is the estimate admission control counts it at
+        """
+        db.add(RenderJob(
+            task_id=task.id,
+            user_id=task.user_id,
+            lane=queue_lane(task),
+            state="queued",
+            visible_at=datetime.utcnow(),
+            attempts=0,
+            cost=cost
+        ))
+
+    def claim(self, owner: str) -> Optional[str]:
+        """
+        Lease the job the scheduler picks for owner and mark its task
+        processing. Returns the task id, or None when no job can be taken.
+        """
+        db = self.session_factory()
+        # Users and lanes whose jobs were all locked by other claims; the
+        # scheduler would pick them again for as long as those claims run
+        skipped = set()
+        try:
+            while True:
+                now = datetime.utcnow()
+                heads = [head for head in self._queue_heads(db, now) if (head.user_id, head.lane) not in skipped]
+                picked = self.scheduler.pick(heads, self._running(db))
+                if picked is None:
+                    db.commit()
+                    return None
+                head, reason = picked
+
+                job = db.execute(
+                    select(RenderJob.task_id, RenderJob.attempts, RenderJob.created_at)
+                    .where(
+                        RenderJob.state == "queued",
+                        RenderJob.visible_at <= now,
+                        RenderJob.user_id == head.user_id,
+                        RenderJob.lane == head.lane
+                    )
+                    .order_by(RenderJob.created_at, RenderJob.task_id)
+                    .limit(1)
+                    .with_for_update(skip_locked=True)
+                ).first()
+                if job is None:
+                    # Taken or locked by another worker since the queue was read
+                    skipped.add((head.user_id, head.lane))
+                    db.commit()
+                    continue
+
+                values = dict(
+                    state="leased",
+                    lease_owner=owner,
+                    visible_at=now + timedelta(seconds=self.lease_seconds),
+                    heartbeat_at=now,
+                    attempts=job.attempts + 1,
+                    claim_reason=reason
+                )
+                if not job.attempts:
+                    values["queued_seconds"] = (now - job.created_at).total_seconds()
+                claimed = db.execute(
+                    update(RenderJob)
+                    .where(
+                        RenderJob.task_id == job.task_id,
+                        RenderJob.state == "queued",
+                        RenderJob.attempts == job.attempts
+                    )
+                    .values(**values)
+                ).rowcount
+                if claimed:
+                    db.execute(update(VideoTask).where(VideoTask.id == job.task_id).values(status="processing"))
+                db.commit()
+                if claimed:
+                    return job.task_id
+                # Another worker claimed it between the read and the update
+        finally:
+            db.close()
+
+    def _queue_heads(self, db: Session, now: datetime) -> List[QueueHead]:
+        """The oldest visible queued job per user and lane, with the user's weight"""
+        rows = db.execute(
+            select(RenderJob.user_id, RenderJob.lane, func.min(RenderJob.created_at), User.monthly_quota)
+            .join(User, User.id == RenderJob.user_id)
+            .where(RenderJob.state == "queued", RenderJob.visible_at <= now)
+            .group_by(RenderJob.user_id, RenderJob.lane, User.monthly_quota)
+        ).all()
+        return [QueueHead(user_id, lane, oldest, weight) for user_id, lane, oldest, weight in rows]
+
+    def _running(self, db: Session) -> Dict[str, int]:
+        """Leased jobs per user"""
+        return dict(db.execute(
+            select(RenderJob.user_id, func.count())
+            .where(RenderJob.state == "leased")
+            .group_by(RenderJob.user_id)
+        ).all())
+
+    def reap(self) -> List[str]:
+        """
+        Requeue every job whose lease ran out, its worker having died or
+        stalled, and fail the ones out of attempts.
+        Returns the ids of the tasks put back in the queue.
+        """
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            expired = db.execute(
+                select(RenderJob.task_id, RenderJob.visible_at, RenderJob.attempts)
+                .where(RenderJob.state == "leased", RenderJob.visible_at <= now)
+                .with_for_update(skip_locked=True)
+            ).all()
+
+            requeued = []
+            for job in expired:
+                # Skipped if the lease was renewed or reaped since the read
+                unchanged = (
+                    RenderJob.task_id == job.task_id,
+                    RenderJob.state == "leased",
+                    RenderJob.visible_at == job.visible_at
+                )
+                if job.attempts >= self.max_attempts:
+                    # Every worker that took it so far died or stalled
+                    if db.execute(update(RenderJob).where(*unchanged).values(state="failed")).rowcount:
+                        db.execute(
+                            update(VideoTask)
+                            .where(VideoTask.id == job.task_id)
+                            .values(status="error", error=f"Render abandoned after {job.attempts} attempts")
+                        )
+                    continue
+                if db.execute(
+                    update(RenderJob).where(*unchanged).values(state="queued", lease_owner=None, visible_at=now)
+                ).rowcount:
+                    db.execute(update(VideoTask).where(VideoTask.id == job.task_id).values(status="pending"))
+                    requeued.append(job.task_id)
+            db.commit()
+            return requeued
+        finally:
+            db.close()
+
+    def heartbeat(self, task_id: str, owner: str) -> bool:
+        """Extend owner's lease; False if the lease was lost to another worker"""
+        now = datetime.utcnow()
+        return self._update_lease(
+            task_id, owner,
+            visible_at=now + timedelta(seconds=self.lease_seconds),
+            heartbeat_at=now
+        )
+
+    def finish(self, task_id: str, owner: str, state: str = "done") -> bool:
+        """Close owner's lease with a final state, "done" or "failed" """
+        return self._update_lease(task_id, owner, state=state, finished_at=datetime.utcnow())
+
+    def _update_lease(self, task_id: str, owner: str, **values) -> bool:
+        db = self.session_factory()
+        try:
+            updated = db.execute(
+                update(RenderJob)
+                .where(RenderJob.task_id == task_id, RenderJob.lease_owner == owner, RenderJob.state == "leased")
+                .values(**values)
+            ).rowcount
+            db.commit()
+            return bool(updated)
+        finally:
+            db.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Queue depth and running renders per lane and per user, each user's
+        weight and fair share, and the scheduler's decisions over the last
+        hour: claims per reason and how long those jobs waited
+        """
+        db = self.session_factory()
+        try:
+            counts = db.execute(
+                select(RenderJob.user_id, RenderJob.lane, RenderJob.state, func.count(), User.monthly_quota)
+                .join(User, User.id == RenderJob.user_id)
+                .where(RenderJob.state.in_(("queued", "leased")))
+                .group_by(RenderJob.user_id, RenderJob.lane, RenderJob.state, User.monthly_quota)
+            ).all()
+            decisions = db.execute(
+                select(
+                    RenderJob.claim_reason,
+                    func.count(),
+                    func.avg(RenderJob.queued_seconds),
+                    func.max(RenderJob.queued_seconds)
+                )
+                .where(RenderJob.claim_reason.is_not(None), RenderJob.created_at >= datetime.utcnow() - DECISION_WINDOW)
+                .group_by(RenderJob.claim_reason)
+            ).all()
+        finally:
+            db.close()
+
+        lanes = {state: {} for state in ("queued", "running")}
+        users: Dict[str, Dict[str, Any]] = {}
+        for user_id, lane, state, count, weight in counts:
+            state = "running" if state == "leased" else state
+            lanes[state][lane] = lanes[state].get(lane, 0) + count
+            user = users.setdefault(user_id, {"weight": max(weight or 1, 1), "queued": 0, "running": 0})
+            user[state] += count
+
+        total_weight = sum(user["weight"] for user in users.values())
+        total_running = sum(user["running"] for user in users.values())
+        running = {user_id: user["running"] for user_id, user in users.items()}
+        for user_id, user in users.items():
+            user["fair_share"] = round(user["weight"] / total_weight, 3)
+            user["running_share"] = round(user["running"] / total_running, 3) if total_running else 0.0
+            user["capped"] = self.scheduler.capped(user_id, running)
+
+        return {
+            **lanes,
+            "max_running_per_user": self.scheduler.max_running,
+            "capped_users": sum(1 for user in users.values() if user["capped"] and user["queued"]),
+            "users": users,
+            "decisions": {
+                reason: {"claims": claims, "mean_wait_seconds": round(mean or 0.0, 3), "max_wait_seconds": round(longest or 0.0, 3)}
+                for reason, claims, mean, longest in decisions
+            }
+        }
@@ -0,0 +1,93 @@
+import os
+from typing import List, Optional, Tuple
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.media_metadata import MediaMetadata
+from app.utils.download_cache import get_download_cache, hash_file
+from app.utils.ffmpeg import MediaInfo, keyframe_times, probe
+
+def content_key(path: str, url: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """
+    Content hash and ETag of a downloaded file.
+    A file linked from the download cache is already known by its hash;
+    anything else (a prefix, a copy, the cache disabled) is hashed.
+    """
+    cache = get_download_cache()
+    if cache and url:
+        entry = cache.lookup(url)
+        if entry and os.path.exists(path) and os.path.samefile(entry["path"], path):
+            return entry["content_hash"], entry["etag"]
+    return hash_file(path), None
+
+def probe_media(path: str) -> MediaInfo:
+    """
+    Stream parameters, straight from the file. Keyframes take a scan of
+    every packet, so they are left to media_keyframes, for the renders
+    that need them.
+    """
+    return probe(path)
+
+def lookup_media(path: str, url: Optional[str] = None) -> MediaInfo:
+    """
+    Metadata of a downloaded file from the media_metadata table, probing
+    and recording it the first time its content is seen. Clips reused
+    across tasks are then planned without starting any ffmpeg process.
+    The table only saves work: if it cannot be reached the file is probed.
+    """
+    if not settings.MEDIA_METADATA_CACHE_ENABLED:
+        return probe_media(path)
+
+    content_hash, etag = content_key(path, url)
+    db = SessionLocal()
+    try:
+        try:
+            row = db.get(MediaMetadata, content_hash)
+        except SQLAlchemyError as e:
+            print(f"Error reading media metadata for {url or path}: {str(e)}")
+            return probe_media(path)
+        if row:
+            return row.to_media_info()
+
+        info = probe_media(path)
+        info.content_hash = content_hash
+        try:
+            db.add(MediaMetadata.from_media_info(content_hash, info, url=url, etag=etag))
+            db.commit()
+        except IntegrityError:
+            # Another task probed the same content meanwhile
+            db.rollback()
+        except SQLAlchemyError as e:
+            db.rollback()
+            print(f"Error storing media metadata for {url or path}: {str(e)}")
+        return info
+    finally:
+        db.close()
+
+def media_keyframes(path: str, info: MediaInfo) -> List[float]:
+    """
+    Keyframe times of a file, scanned the first time a render asks for
+    them and kept in info and, if it came from the index, in its
+    media_metadata row, so reusing the clip skips the scan
+    """
+    if info.keyframes is not None:
+        return info.keyframes
+    info.keyframes = keyframe_times(path) if info.codec else []
+    if not (settings.MEDIA_METADATA_CACHE_ENABLED and info.content_hash):
+        return info.keyframes
+
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(MediaMetadata)
+            .where(MediaMetadata.content_hash == info.content_hash)
+            .values(keyframes=info.keyframes)
+        )
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        print(f"Error storing keyframes for {path}: {str(e)}")
+    finally:
+        db.close()
+    return info.keyframes
@@ -0,0 +1,124 @@
+from fractions import Fraction
+from typing import List, Optional, Tuple
+
+class NormalizationPlan:
+    """
+    How to conform a clip to the montage frame size.
+
+    The crop rectangle is worked out in source pixels first, keeping the
+    centered region with the target's aspect ratio; a single scale then
+    brings it to exactly the target size. Scaling only the kept region
+    avoids resampling pixels the crop would throw away.
+    """
+
+    def __init__(self, source_size: Tuple[int, int], target_size: Tuple[int, int]):
+        self.source_size = source_size
+        self.target_size = target_size
+
+        source_width, source_height = source_size
+        target_width, target_height = target_size
+        if source_width * target_height > source_height * target_width:
+            # Source is wider than the target ratio, trim the sides
+            crop_width = min(source_width, max(1, round(source_height * target_width / target_height)))
+            crop_height = source_height
+        else:
+            # Source is taller (or equal), trim top and bottom
+            crop_width = source_width
+            crop_height = min(source_height, max(1, round(source_width * target_height / target_width)))
+
+        self.crop = (
+            (source_width - crop_width) // 2,
+            (source_height - crop_height) // 2,
+            crop_width,
+            crop_height
+        )  # (x, y, width, height) in source pixels
+
+    @property
+    def needs_crop(self) -> bool:
+        return self.crop[2:] != tuple(self.source_size)
+
+    @property
+    def needs_scale(self) -> bool:
+        return self.crop[2:] != tuple(self.target_size)
+
+    @property
+    def is_identity(self) -> bool:
+        return not (self.needs_crop or self.needs_scale)
+
+    def ffmpeg_filters(self, scaler: Optional[str] = None) -> List[str]:
+        """Filter chain applying the plan in an ffmpeg filtergraph, optionally with a specific swscale algorithm"""
+        filters = []
+        if self.needs_crop:
+            x, y, width, height = self.crop
+            filters.append(f"crop={width}:{height}:{x}:{y}")
+        if self.needs_scale:
+            scale = "scale={}:{}".format(*self.target_size)
+            filters.append(f"{scale}:flags={scaler}" if scaler else scale)
+        return filters
+
+    def apply(self, clip):
+        """Apply the plan to a moviepy clip"""
+        if self.needs_crop:
+            x, y, width, height = self.crop
+            clip = clip.crop(x1=x, y1=y, x2=x + width, y2=y + height)
+        if self.needs_scale:
+            clip = clip.resize(newsize=self.target_size)
+        return clip
+
+    def __repr__(self):
+        return f"<NormalizationPlan({self.source_size} -> crop {self.crop} -> {self.target_size})>"
+
+# How the montage frame rate is picked from the clips' rates
+FPS_POLICIES = ["dominant", "max", "min", "first"]
+
+def plan_frame_rate(rates: List[Tuple[Optional[Fraction], float]], policy: str = "dominant") -> Optional[Fraction]:
+    """
+    Pick one frame rate for a montage from (rate, seconds on the timeline)
+    pairs in timeline order; clips without a known rate are ignored.
+    "dominant" takes the rate covering most of the montage, so a short
+    60 fps clip does not double the frames encoded for everything else;
+    "max" keeps every frame of the fastest clip; "min" and "first" are
+    the slowest and the first clip's rate.
+    """
+    known = [(rate, seconds) for rate, seconds in rates if rate]
+    if not known:
+        return None
+    if policy == "max":
+        return max(rate for rate, _ in known)
+    if policy == "min":
+        return min(rate for rate, _ in known)
+    if policy == "first":
+        return known[0][0]
+    if policy == "dominant":
+        totals = {}
+        for rate, seconds in known:
+            totals[rate] = totals.get(rate, 0.0) + seconds
+        # Ties go to the higher rate, which drops no frames
+        return max(totals, key=lambda rate: (totals[rate], rate))
+    raise ValueError(f"Unknown frame rate policy {policy!r}, expected one of {FPS_POLICIES}")
+
+class OutputFormat:
+    """Frame rate and pixel format every clip of a montage is conformed to"""
+
+    def __init__(self, fps: Fraction, pix_fmt: str = "yuv420p"):
+        self.fps = fps
+        self.pix_fmt = pix_fmt
+
+    def ffmpeg_filters(self, plan: NormalizationPlan, source_fps: Optional[Fraction], scaler: Optional[str] = None) -> List[str]:
+        """
+        Filter chain conforming one clip: frame rate, crop/scale, pixel format.
+        Frames a faster clip loses are dropped before they are cropped and
+        scaled; a slower clip is scaled first so repeated frames are scaled
+        once. The pixel format follows the scale so swscale converts in the
+        same pass.
+        """
+        rate = [f"fps={self.fps}"]
+        size = plan.ffmpeg_filters(scaler) + ["setsar=1"]
+        if source_fps and source_fps < self.fps:
+            filters = size + rate
+        else:
+            filters = rate + size
+        return filters + [f"format={self.pix_fmt}"]
+
+    def __repr__(self):
+        return f"<OutputFormat({self.fps} fps, {self.pix_fmt})>"
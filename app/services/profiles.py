@@ -0,0 +1,105 @@
+from fractions import Fraction
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+
+class EncodingProfile:
+    """
+    Speed/size tradeoff for one render: x264 preset and CRF, a cap on the
+    output frame rate and resolution, and how many threads the encoder may use.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        preset: str,
+        crf: int,
+        fps: Optional[int] = None,
+        max_width: Optional[int] = None,
+        max_height: Optional[int] = None,
+        threads: int = 0,
+        scaler: Optional[str] = None
+    ):
+        self.name = name
+        self.preset = preset
+        self.crf = crf
+        self.fps = fps  # Highest output frame rate, None keeps the clips' rate
+        self.max_width = max_width
+        self.max_height = max_height
+        self.threads = threads  # 0 lets x264 pick
+        self.scaler = scaler  # swscale algorithm, None keeps ffmpeg's default (bicubic)
+
+    def output_size(self, base_size: Tuple[int, int]) -> Tuple[int, int]:
+        """
+        The montage frame size: the base clip's size, scaled down to fit
+        within the profile's maximum resolution if it is larger.
+        """
+        width, height = base_size
+        scale = 1.0
+        if self.max_width and width > self.max_width:
+            scale = min(scale, self.max_width / width)
+        if self.max_height and height > self.max_height:
+            scale = min(scale, self.max_height / height)
+        if scale == 1.0:
+            return base_size
+        # Even dimensions, as 4:2:0 chroma subsampling requires
+        return (max(2, round(width * scale / 2) * 2), max(2, round(height * scale / 2) * 2))
+
+    def output_fps(self, source_fps: Fraction) -> Fraction:
+        """The clips' frame rate, capped at the profile's"""
+        if self.fps and source_fps > self.fps:
+            return Fraction(self.fps)
+        return source_fps
+
+    def x264_args(self, threads: Optional[int] = None) -> List[str]:
+        """ffmpeg output options applying the profile to libx264; threads overrides its thread budget"""
+        args = ["-preset", self.preset, "-crf", str(self.crf)]
+        threads = threads or self.threads
+        if threads:
+            args += ["-threads", str(threads)]
+        return args
+
+    def __repr__(self):
+        return f"<EncodingProfile({self.name}, {self.preset}, crf={self.crf})>"
+
+ENCODING_PROFILES: Dict[str, EncodingProfile] = {
+    profile.name: profile for profile in (
+        # Quick turnaround for editors: small frame, low rate, fastest presets
+        EncodingProfile("draft", preset="veryfast", crf=28, fps=24, max_width=1280, max_height=720, threads=2),
+        # x264's defaults, what every render used before profiles existed
+        EncodingProfile("standard", preset="medium", crf=23),
+        EncodingProfile("archive", preset="slow", crf=18),
+        # Proxy for previews, never requested by name: tiny frame, cheapest scaler
+        EncodingProfile(
+            "preview", preset="ultrafast", crf=30, fps=15, max_width=640, max_height=360,
+            threads=2, scaler="fast_bilinear"
+        )
+    )
+}
+
+PREVIEW_PROFILE = "preview"
+
+# Extra output renditions clients may request, by frame height
+RENDITION_HEIGHTS: Dict[str, int] = {
+    "2160p": 2160,
+    "1440p": 1440,
+    "1080p": 1080,
+    "720p": 720,
+    "480p": 480,
+    "360p": 360
+}
+
+def rendition_size(output_size: Tuple[int, int], height: int) -> Tuple[int, int]:
+    """The montage frame scaled to height, keeping its aspect ratio with an even width"""
+    width = output_size[0] * height / output_size[1]
+    return (max(2, round(width / 2) * 2), height)
+
+def available_profiles() -> List[str]:
+    """Profile names clients may request, as allowed by ENCODING_PROFILES_ALLOWED"""
+    return [name for name in settings.ENCODING_PROFILES_ALLOWED if name in ENCODING_PROFILES]
+
+def get_profile(name: Optional[str] = None) -> EncodingProfile:
+    """Look up a profile by name, falling back to DEFAULT_ENCODING_PROFILE"""
+    name = name or settings.DEFAULT_ENCODING_PROFILE
+    if name not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown encoding profile {name!r}, expected one of {available_profiles()}")
+    return ENCODING_PROFILES[name]
@@ -0,0 +1,54 @@
+import threading
+from contextlib import contextmanager
+from app.core.config import settings
+from app.utils.ffmpeg import check_stopped
+
+class ReaderSlots:
+    """
+    Caps how many clip decoders are open at once across all renders in this
+    process. Every open decoder holds a frame buffer and, for moviepy, its
+    own ffmpeg subprocess, so memory grows with the clips open rather than
+    with the clips in a montage. 0 slots means unbounded.
+    """
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.open = 0
+        self._condition = threading.Condition()
+
+    def size(self, count: int) -> int:
+        """Slots count decoders will actually take: never more than the cap"""
+        return min(count, self.slots) if self.slots else count
+
+    def acquire(self, count: int = 1) -> int:
+        """
+        Take slots for count decoders, waiting until they are all free.
+        Slots are taken all at once, so renders waiting for several never
+        block each other while holding some. Returns the slots taken.
+        A render told to stop gives up waiting with RenderCancelled.
+        """
+        count = self.size(count)
+        with self._condition:
+            # Woken now and then to notice a stopped render, whose slots
+            # may never be freed by a render that stopped too
+            while self.slots and self.open + count > self.slots:
+                check_stopped()
+                self._condition.wait(0.2)
+            self.open += count
+        return count
+
+    def release(self, count: int):
+        with self._condition:
+            self.open -= count
+            self._condition.notify_all()
+
+    @contextmanager
+    def hold(self, count: int = 1):
+        """Hold slots for count decoders for the duration of the block"""
+        taken = self.acquire(count)
+        try:
+            yield
+        finally:
+            self.release(taken)
+
+reader_slots = ReaderSlots(settings.RENDER_MAX_OPEN_READERS)
@@ -0,0 +1,63 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.models.video_task import VideoTask
+from app.services.profiles import PREVIEW_PROFILE
+
+PRIORITY_LANE = "priority"
+STANDARD_LANE = "standard"
+
+def queue_lane(task: VideoTask) -> str:
+    """Previews and short montages go ahead of full-length renders"""
+    if task.profile == PREVIEW_PROFILE:
+        return PRIORITY_LANE
+    if task.duration and task.duration <= settings.JOB_PRIORITY_MAX_SECONDS:
+        return PRIORITY_LANE
+    return STANDARD_LANE
+
+class QueueHead:
+    """The oldest queued job of one user in one lane, as the scheduler sees it"""
+
+    def __init__(self, user_id: str, lane: str, oldest: datetime, weight: Optional[int] = None):
+        self.user_id = user_id
+        self.lane = lane
+        self.oldest = oldest  # When the user's oldest queued job in the lane was created
+        self.weight = max(weight or 1, 1)  # The user's monthly_quota
+
+class FairShareScheduler:
+    """
+    Decides whose job a free worker takes next.
+
+    Jobs in the priority lane go first. Within a lane the job goes to the
+    user furthest below their fair share, running renders divided by
+    weight, so a user with 200 queued montages gets no more than their
+    share once anyone else is waiting; ties go to the oldest job. A user
+    already running max_running renders is passed over until one ends.
+
+    The running counts come from the leases at claim time, so on Postgres
+    two workers claiming at once can each see a user one below the cap;
+    the cap may then be exceeded by a render until one of them ends.
+    """
+
+    def __init__(self, max_running: int = None):
+        self.max_running = max_running if max_running is not None else settings.JOB_MAX_RUNNING_PER_USER
+
+    def capped(self, user_id: str, running: Dict[str, int]) -> bool:
+        return bool(self.max_running) and running.get(user_id, 0) >= self.max_running
+
+    def pick(self, heads: List[QueueHead], running: Dict[str, int]) -> Optional[Tuple[QueueHead, str]]:
+        """
+        Choose the user and lane to claim from, with the reason for the
+        choice, "priority" or "fair_share"; None if every user with queued
+        jobs is at the cap.
+        """
+        open_heads = [head for head in heads if not self.capped(head.user_id, running)]
+        for lane, reason in ((PRIORITY_LANE, "priority"), (STANDARD_LANE, "fair_share")):
+            candidates = [head for head in open_heads if head.lane == lane]
+            if candidates:
+                head = min(
+                    candidates,
+                    key=lambda head: (running.get(head.user_id, 0) / head.weight, head.oldest, head.user_id)
+                )
+                return head, reason
+        return None
@@ -0,0 +1,83 @@
+from fractions import Fraction
+from typing import Dict, List
+from app.services.timeline import TimelineEntry
+
+# Codecs whose GOPs can be copied next to freshly encoded ones; x264 can
+# give its parameter sets their own ids so they never clash with a source's
+SMART_RENDER_CODECS = {"h264"}
+
+class SmartPiece:
+    """
+    A run of frames [start, end) of one source on the output frame grid,
+    either copied packet for packet or re-encoded
+    """
+
+    def __init__(self, source_index: int, start: int, end: int, copy: bool):
+        self.source_index = source_index
+        self.start = start
+        self.end = end
+        self.copy = copy
+
+    @property
+    def frames(self) -> int:
+        return self.end - self.start
+
+    def key(self) -> tuple:
+        """Identity of the piece's content; looped clips repeat the same pieces"""
+        return (self.source_index, self.start, self.end, self.copy)
+
+    def __repr__(self):
+        return f"<SmartPiece(source={self.source_index}, {self.start}-{self.end}, {'copy' if self.copy else 'encode'})>"
+
+def plan_pieces(
+    timeline: List[TimelineEntry],
+    fps: Fraction,
+    cut_points: Dict[int, List[float]]
+) -> List[SmartPiece]:
+    """
+    Split every timeline entry into whole GOPs that can be copied and the
+    partial GOPs at its in and out points that must be re-encoded.
+    cut_points maps a source index to the times a copy may start or end at:
+    its keyframes plus its end.
+    """
+    pieces: List[SmartPiece] = []
+    for entry in timeline:
+        start = round(entry.start * fps)
+        end = round(entry.end * fps)
+        if end <= start:
+            continue
+        points = sorted({round(time * fps) for time in cut_points.get(entry.source_index, [])})
+        first = next((point for point in points if point >= start), None)
+        last = next((point for point in reversed(points) if point <= end), None)
+        if first is None or last is None or first >= last:
+            # No whole GOP inside the entry
+            pieces.append(SmartPiece(entry.source_index, start, end, copy=False))
+            continue
+        if start < first:
+            pieces.append(SmartPiece(entry.source_index, start, first, copy=False))
+        pieces.append(SmartPiece(entry.source_index, first, last, copy=True))
+        if last < end:
+            pieces.append(SmartPiece(entry.source_index, last, end, copy=False))
+    return pieces
+
+def snap_timeline(
+    timeline: List[TimelineEntry],
+    cut_points: Dict[int, List[float]],
+    max_shift: float
+) -> List[TimelineEntry]:
+    """
+    Move every cut to the nearest cut point of its source within max_shift
+    seconds, so the GOP it falls in is copied instead of re-encoded.
+    The montage gets longer or shorter by the total shift.
+    """
+    def snap(time: float, points: List[float]) -> float:
+        nearest = min(points, key=lambda point: abs(point - time), default=time)
+        return nearest if abs(nearest - time) <= max_shift else time
+
+    snapped = []
+    for entry in timeline:
+        points = cut_points.get(entry.source_index, [])
+        start = snap(entry.start, points) if entry.start > 0 else entry.start
+        end = snap(entry.end, points)
+        snapped.append(TimelineEntry(entry.source_index, start, end if end > start else entry.end))
+    return snapped
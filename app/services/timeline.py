@@ -0,0 +1,67 @@
+from typing import Any, List, Optional
+from app.utils.ffmpeg import MediaInfo
+
+class SourceClip:
+    """A downloaded input clip, what probing learned about it and its decoder once opened"""
+
+    def __init__(self, path: str, info: MediaInfo, clip: Any = None):
+        self.path = path
+        self.info = info
+        self.clip = clip  # moviepy clip, opened only when frames are needed
+
+    @property
+    def duration(self) -> float:
+        return self.info.duration
+
+    @property
+    def size(self):
+        return self.info.size
+
+    def close(self):
+        """Close the decoder if one was opened"""
+        if self.clip is not None:
+            self.clip.close()
+            self.clip = None
+
+class TimelineEntry:
+    """A span [start, end) of one source clip placed on the montage timeline"""
+
+    def __init__(self, source_index: int, start: float, end: float):
+        self.source_index = source_index
+        self.start = start
+        self.end = end
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def __repr__(self):
+        return f"<TimelineEntry(source={self.source_index}, {self.start:.3f}-{self.end:.3f})>"
+
+def build_timeline(durations: List[float], target_duration: Optional[float] = None) -> List[TimelineEntry]:
+    """
+    Arrange clips sequentially to fill target_duration.
+    - When the target is shorter than the clips combined, every clip is
+      shortened by the same factor
+    - When it is longer, the last clip loops to fill the remaining time
+    """
+    total_duration = sum(durations)
+    target_duration = target_duration if target_duration else total_duration
+    timeline = [TimelineEntry(i, 0.0, duration) for i, duration in enumerate(durations)]
+
+    if target_duration < total_duration:
+        scale_factor = target_duration / total_duration
+        timeline = [TimelineEntry(i, 0.0, duration * scale_factor) for i, duration in enumerate(durations)]
+    elif target_duration > total_duration:
+        remaining_duration = target_duration - total_duration
+        last_index = len(durations) - 1
+        last_duration = durations[last_index]
+        loops_needed = int(remaining_duration / last_duration)
+        remainder = remaining_duration % last_duration
+
+        # Full loops of the last clip, then a partial loop if needed
+        timeline += [TimelineEntry(last_index, 0.0, last_duration) for _ in range(loops_needed)]
+        if remainder > 0:
+            timeline.append(TimelineEntry(last_index, 0.0, remainder))
+
+    return timeline
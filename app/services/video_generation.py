@@ -1,189 +1,1171 @@
+import asyncio
+import contextvars
+import hashlib
 import os
+import shutil
+import threading
+import time
 import uuid
-from typing import List, Optional
-from moviepy.editor import VideoFileClip, CompositeVideoClip, clips_array, AudioFileClip, concatenate_videoclips
-from moviepy.video.fx.resize import resize
+from bisect import bisect_right
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from fractions import Fraction
+from typing import Callable, Dict, List, Optional, Tuple
+from moviepy.editor import VideoClip, VideoFileClip
+from proglog import ProgressBarLogger
 from sqlalchemy.orm import Session
 from app.models.video_task import VideoTask
-from app.utils.download import download_file
+from app.services.checkpoints import TaskCheckpoints
+from app.services.hls import HLSOutput
+from app.services.ingest import IngestPipeline
+from app.services.job_queue import JobQueue
+from app.services.media_index import lookup_media, media_keyframes
+from app.services.normalization import NormalizationPlan, OutputFormat, plan_frame_rate
+from app.services.smart_render import SMART_RENDER_CODECS, SmartPiece, plan_pieces, snap_timeline
+from app.services.readers import reader_slots
+from app.services.profiles import RENDITION_HEIGHTS, EncodingProfile, get_profile, rendition_size
+from app.services.timeline import SourceClip, TimelineEntry, build_timeline
+from app.utils.audio_cache import fit_audio
+from app.utils.ffmpeg import RenderCancelled, check_stopped, probe, run_ffmpeg, stop_on, write_concat_list
 from app.core.config import settings
 
+# Video codecs the MP4 muxer accepts when concatenating without re-encoding
+STREAM_COPY_CODECS = {"h264", "hevc"}
+
+def load_clip(path: str) -> VideoFileClip:
+    """Open a downloaded media file as a silent video clip"""
+    # Without audio=False an audio reader is started too, and without_audio()
+    # would leave its ffmpeg process running until garbage collection
+    return VideoFileClip(path, audio=False)
+
+def normalize_clip(clip: VideoFileClip, base_size: Tuple[int, int]) -> VideoFileClip:
+    """Crop and resize a clip to exactly the first video's dimensions"""
+    return NormalizationPlan(tuple(clip.size), base_size).apply(clip)
+
+class LazyMontageClip(VideoClip):
+    """
+    The timeline as one moviepy clip whose sources are opened one at a time.
+    A source's decoder is opened when the first frame of its entry is
+    requested and closed as soon as frames of another entry are, so a
+    montage of any length keeps a single reader open, inside a reader slot.
+    """
+
+    def __init__(
+        self,
+        sources: List[SourceClip],
+        timeline: List[TimelineEntry],
+        output_size: Tuple[int, int],
+        fps: float
+    ):
+        VideoClip.__init__(self, duration=sum(entry.duration for entry in timeline))
+        self.sources = sources
+        self.timeline = timeline
+        self.size = output_size
+        self.fps = fps
+        self.make_frame = self._frame_at
+        self._starts = []
+        start = 0.0
+        for entry in timeline:
+            self._starts.append(start)
+            start += entry.duration
+        self._current: Optional[int] = None
+        self._clip = None
+        self._slots = 0
+
+    def _open(self, index: int):
+        self.close()
+        self._slots = reader_slots.acquire()
+        source = self.sources[self.timeline[index].source_index]
+        clip = load_clip(source.path)
+        if tuple(clip.size) != tuple(self.size):
+            clip = normalize_clip(clip, self.size)
+        self._clip = clip
+        self._current = index
+
+    def _frame_at(self, t: float):
+        # moviepy pulls every frame through here, so a stopped render ends
+        # at the next frame rather than after the whole encode
+        check_stopped()
+        index = max(0, bisect_right(self._starts, t) - 1)
+        if index != self._current:
+            self._open(index)
+        entry = self.timeline[index]
+        return self._clip.get_frame(min(entry.start + t - self._starts[index], self._clip.duration))
+
+    def close(self):
+        """Close the open reader, if any, and give its slot back"""
+        if self._clip is not None:
+            self._clip.close()
+            self._clip = None
+            self._current = None
+        if self._slots:
+            reader_slots.release(self._slots)
+            self._slots = 0
+
+def probe_clip(path: str, url: Optional[str] = None) -> SourceClip:
+    """
+    Look up a downloaded media file's metadata without opening a decoder;
+    decoders are only opened by the backend that renders the clip
+    """
+    return SourceClip(path, lookup_media(path, url))
+
+def streams_match(
+    sources: List[SourceClip],
+    profile: Optional[EncodingProfile] = None,
+    output_format: Optional[OutputFormat] = None
+) -> bool:
+    """
+    Whether every clip has the first clip's codec, profile, size, frame
+    rate, timebase and pixel format, the encoding profile keeps that
+    size and frame rate and the planned output format is the clips' own,
+    so packets of all clips can share one stream
+    """
+    signature = sources[0].info.stream_signature()
+    if any(source.info.stream_signature() != signature for source in sources):
+        return False
+    if profile:
+        base = sources[0].info
+        if profile.output_size(base.size) != base.size:
+            return False
+        if base.frame_duration and profile.output_fps(Fraction(base.fps)) != Fraction(base.fps):
+            return False
+    if output_format:
+        base = sources[0].info
+        if not base.frame_duration or Fraction(base.fps) != output_format.fps:
+            return False
+        if base.pix_fmt != output_format.pix_fmt:
+            return False
+    return True
+
+def can_stream_copy(
+    sources: List[SourceClip],
+    timeline: List[TimelineEntry],
+    profile: Optional[EncodingProfile] = None,
+    output_format: Optional[OutputFormat] = None
+) -> bool:
+    """
+    Whether the timeline can be remuxed without re-encoding: the clips'
+    streams match (see streams_match) and every cut falls on a keyframe
+    so no GOP is split.
+    """
+    if sources[0].info.codec not in STREAM_COPY_CODECS or not streams_match(sources, profile, output_format):
+        return False
+
+    keyframes = {}
+    for entry in timeline:
+        source = sources[entry.source_index]
+        tolerance = source.info.frame_duration or 0.001
+        cuts = []
+        if entry.start > 0:
+            cuts.append(entry.start)
+        if entry.end < source.duration - tolerance:
+            cuts.append(entry.end)
+        if not cuts:
+            continue
+
+        if entry.source_index not in keyframes:
+            keyframes[entry.source_index] = media_keyframes(source.path, source.info)
+        for cut in cuts:
+            if not any(abs(keyframe - cut) <= tolerance / 2 for keyframe in keyframes[entry.source_index]):
+                return False
+    return True
+
+def render_stream_copy(sources: List[SourceClip], timeline: List[TimelineEntry], output_path: str):
+    """Concatenate the clips' video with the concat demuxer without re-encoding"""
+    entries = []
+    for entry in timeline:
+        source = sources[entry.source_index]
+        tolerance = source.info.frame_duration or 0.001
+        entries.append((
+            source.path,
+            entry.start if entry.start > 0 else None,
+            entry.end if entry.end < source.duration - tolerance else None
+        ))
+    concat_copy(entries, output_path, sum(entry.duration for entry in timeline))
+
+def can_smart_render(
+    sources: List[SourceClip],
+    profile: Optional[EncodingProfile] = None,
+    output_format: Optional[OutputFormat] = None
+) -> bool:
+    """
+    Whether cuts inside a GOP can be bridged by re-encoding just that GOP:
+    the clips' streams match and their codec and frame rate are known
+    """
+    base = sources[0].info
+    return base.codec in SMART_RENDER_CODECS and bool(base.frame_duration) and streams_match(sources, profile, output_format)
+
+def smart_cut_points(sources: List[SourceClip], timeline: List[TimelineEntry]) -> Dict[int, List[float]]:
+    """Where copies may start or end in each source on the timeline: its keyframes and its end"""
+    cut_points = {}
+    for index in sorted({entry.source_index for entry in timeline}):
+        source = sources[index]
+        cut_points[index] = media_keyframes(source.path, source.info) + [source.duration]
+    return cut_points
+
+def smart_piece_command(
+    source: SourceClip,
+    piece: SmartPiece,
+    fps: Fraction,
+    profile: EncodingProfile,
+    output_path: str
+) -> List[str]:
+    """ffmpeg arguments writing one smart render piece, video only"""
+    if piece.copy:
+        # A copy starts on a keyframe, which an input seek lands on exactly
+        return [
+            "-ss", f"{float(piece.start / fps):.6f}", "-i", source.path,
+            "-map", "0:v:0", "-c:v", "copy", "-frames:v", str(piece.frames),
+            "-an", output_path
+        ]
+    args = [
+        # Seeking half a frame early keeps the first frame of the piece
+        "-ss", f"{max(0.0, float((piece.start - Fraction(1, 2)) / fps)):.6f}", "-i", source.path,
+        "-map", "0:v:0", "-frames:v", str(piece.frames),
+        "-c:v", "libx264", *profile.x264_args(),
+        # Parameter sets under their own id, repeated in-band, so players
+        # never decode the copied GOPs with them or the new ones without
+        "-x264-params", "sps-id=1:repeat-headers=1",
+        "-pix_fmt", source.info.pix_fmt or "yuv420p"
+    ]
+    if source.info.time_base:
+        # Same timescale as the copied pieces so the concat keeps exact timestamps
+        args += ["-video_track_timescale", str(Fraction(source.info.time_base).denominator)]
+    return args + ["-an", output_path]
+
+def render_smart(
+    sources: List[SourceClip],
+    pieces: List[SmartPiece],
+    output_path: str,
+    profile: EncodingProfile,
+    on_progress: Optional[Callable[[float], None]] = None
+):
+    """
+    Copy the whole GOPs of every timeline entry and re-encode only the
+    partial ones at its cuts, then join the pieces without re-encoding.
+    Pieces an earlier attempt left in the piece directory are kept.
+    """
+    fps = Fraction(sources[0].info.fps)
+    unique: Dict[tuple, SmartPiece] = {}
+    for piece in pieces:
+        unique.setdefault(piece.key(), piece)
+    encode_frames = sum(piece.frames for piece in unique.values() if not piece.copy) or 1
+
+    piece_dir = output_path + ".pieces"
+    os.makedirs(piece_dir, exist_ok=True)
+    paths = {key: os.path.join(piece_dir, _segment_name(key, profile.name)) for key in unique}
+
+    # Progress follows the re-encoded frames, copies take next to no time
+    encoded = 0
+    for key, piece in unique.items():
+        track = None
+        if not piece.copy:
+            track = _progress_slice(on_progress, encoded / encode_frames, (encoded + piece.frames) / encode_frames)
+            encoded += piece.frames
+        if os.path.exists(paths[key]):
+            continue
+        with reader_slots.hold(), _atomic_output(paths[key]) as temp_path:
+            run_ffmpeg(
+                smart_piece_command(sources[piece.source_index], piece, fps, profile, temp_path),
+                duration=float(piece.frames / fps),
+                on_progress=track
+            )
+
+    total = float(sum(piece.frames for piece in pieces) / fps)
+    concat_copy([(paths[piece.key()], None, None) for piece in pieces], output_path, total)
+    # Left in place on failure for the next attempt to reuse
+    shutil.rmtree(piece_dir, ignore_errors=True)
+
+def concat_copy(entries: List[Tuple[str, Optional[float], Optional[float]]], output_path: str, duration: float):
+    """Join video files sharing the same stream parameters without re-encoding"""
+    list_path = output_path + ".concat.txt"
+    write_concat_list(list_path, entries)
+    try:
+        run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", list_path,
+            "-map", "0:v:0", "-c:v", "copy",
+            "-t", f"{duration:.3f}",
+            output_path
+        ])
+    finally:
+        os.remove(list_path)
+
+def mux_audio(video_path: str, audio_path: str, output_path: str, duration: float):
+    """Combine the rendered video and the fitted background track without re-encoding either"""
+    run_ffmpeg([
+        "-i", video_path, "-i", audio_path,
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c", "copy",
+        "-t", f"{duration:.3f}",
+        "-movflags", "+faststart",
+        output_path
+    ])
+
+def encode_renditions(
+    video_path: str,
+    renditions: List[Tuple[Tuple[int, int], str]],
+    profile: EncodingProfile,
+    duration: float,
+    on_progress: Optional[Callable[[float], None]] = None
+):
+    """
+    Encode smaller renditions of a rendered video in one pass: the video
+    is decoded once and split into one scaler and encoder per rendition.
+    Each rendition is (size, output_path).
+    """
+    size = probe(video_path).size
+    labels = "".join(f"[s{k}]" for k in range(len(renditions)))
+    chains = [f"[0:v:0]split={len(renditions)}{labels}"]
+    outputs: List[str] = []
+    for k, (rendition_size, path) in enumerate(renditions):
+        filters = NormalizationPlan(size, rendition_size).ffmpeg_filters(profile.scaler) or ["null"]
+        chains.append(f"[s{k}]{','.join(filters)}[o{k}]")
+        outputs += ["-map", f"[o{k}]", "-c:v", "libx264", *profile.x264_args(), "-an", path]
+    run_ffmpeg(
+        ["-i", video_path, "-filter_complex", ";".join(chains), *outputs],
+        duration=duration,
+        on_progress=on_progress
+    )
+
+def _progress_slice(on_progress: Optional[Callable[[float], None]], start: float, end: float) -> Optional[Callable[[float], None]]:
+    """Map a sub-step's 0-1 progress onto [start, end] of on_progress"""
+    if not on_progress:
+        return None
+    return lambda fraction: on_progress(start + (end - start) * fraction)
+
+@contextmanager
+def _atomic_output(path: str):
+    """
+    Yield a temporary path beside path and move it into place once the
+    block completes, so path only ever names a complete file
+    """
+    root, ext = os.path.splitext(path)
+    temp_path = f"{root}.{uuid.uuid4().hex[:8]}.tmp{ext}"
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def _segment_name(*identity) -> str:
+    """
+    File name of an encoded segment, derived from everything that decides
+    its content, so a retry finds the segments an earlier attempt finished
+    """
+    return hashlib.sha1(repr(identity).encode()).hexdigest()[:16] + ".mp4"
+
+def _split_progress(on_progress: Optional[Callable[[float], None]], renditions) -> Tuple[Optional[Callable], Optional[Callable]]:
+    """
+    Progress callbacks for rendering the full-size video and for deriving
+    renditions from it afterwards; the second pass gets the last fifth
+    """
+    if not renditions:
+        return on_progress, None
+    return _progress_slice(on_progress, 0.0, 0.8), _progress_slice(on_progress, 0.8, 1.0)
+
+async def _until_stopped(awaitable, stop: threading.Event):
+    """
+    Await work running on the event loop, such as the downloads, cancelling
+    it and raising RenderCancelled once stop is set. Work in threads needs
+    no such help: it ends as soon as its ffmpeg runs are killed.
+    """
+    work = asyncio.ensure_future(awaitable)
+    try:
+        while not stop.is_set():
+            done, _ = await asyncio.wait({work}, timeout=0.2)
+            if done:
+                return work.result()
+    finally:
+        work.cancel()
+    # Let the cancelled work unwind before the render gives up
+    await asyncio.gather(work, return_exceptions=True)
+    raise RenderCancelled("Render stopped")
+
+class ProgressReporter:
+    """
+    Maps a stage's own 0-1 completion onto a slice of the task's progress.
+    Updates are only written when progress moves by at least a percent.
+    """
+
+    def __init__(self, service: "VideoGenerationService", task_id: str, start: float, end: float):
+        self.service = service
+        self.task_id = task_id
+        self.start = start
+        self.end = end
+        self._last = start
+
+    @property
+    def progress(self) -> float:
+        """Task progress as last written by this reporter"""
+        return self._last
+
+    def __call__(self, fraction: float):
+        progress = self.start + (self.end - self.start) * min(max(fraction, 0.0), 1.0)
+        if progress - self._last >= 0.01 or (fraction >= 1.0 and progress > self._last):
+            self._last = progress
+            self.service.update_task_progress(self.task_id, progress)
+
+class StageTimer:
+    """
+    Records when each stage of a task started and finished, relative to
+    the start of the task, so overlapping stages can be seen as such.
+    Stages may run in different threads.
+    """
+
+    def __init__(self):
+        self.origin = time.monotonic()
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.monotonic() - self.origin
+        try:
+            yield
+        finally:
+            end = time.monotonic() - self.origin
+            self.stages[name] = {"start": round(start, 3), "end": round(end, 3), "seconds": round(end - start, 3)}
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Stage timings plus the task's total wall-clock time so far"""
+        summary = dict(self.stages)
+        summary["total"] = {"start": 0.0, "end": round(time.monotonic() - self.origin, 3)}
+        summary["total"]["seconds"] = summary["total"]["end"]
+        return summary
+
+class RenderProgressLogger(ProgressBarLogger):
+    """Forwards moviepy's frame counter to a progress callback"""
+
+    def __init__(self, on_progress: Callable[[float], None]):
+        super().__init__()
+        self.on_progress = on_progress
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        # "t" is the video frame bar; audio uses "chunk"
+        if bar == "t" and attr == "index" and self.bars[bar]["total"]:
+            self.on_progress(value / self.bars[bar]["total"])
+
+class RenderBackend:
+    """
+    Turns a timeline of source clips into video.
+    prepare() runs during ingest for every clip after the base clip, and
+    render() encodes the timeline as a video-only file plus any smaller
+    renditions, given as (size, path) pairs; the background track is
+    prepared alongside and muxed in afterwards. With hls, the montage is
+    also written as an HLS playlist carrying the fitted background track,
+    as it encodes where the backend can.
+    """
+
+    name = ""
+
+    def __init__(self, profile: Optional[EncodingProfile] = None):
+        self.profile = profile or get_profile()
+        self.output_format: Optional[OutputFormat] = None  # Planned per montage before render()
+
+    def prepare(self, source: SourceClip, base: SourceClip) -> SourceClip:
+        return source
+
+    def plan_format(
+        self,
+        sources: List[SourceClip],
+        timeline: Optional[List[TimelineEntry]] = None,
+        fps: Optional[float] = None
+    ) -> OutputFormat:
+        """
+        The montage's frame rate and pixel format: the requested fps, or
+        OUTPUT_FPS_POLICY applied to the clips' rates weighted by their time
+        on the timeline (whole clips without one), capped by the profile
+        """
+        if timeline is None:
+            spans = [(source, source.duration) for source in sources]
+        else:
+            spans = [(sources[entry.source_index], entry.duration) for entry in timeline]
+        if fps:
+            target = Fraction(fps).limit_denominator(1001)
+        else:
+            target = plan_frame_rate(
+                [(Fraction(source.info.fps) if source.info.frame_duration else None, seconds) for source, seconds in spans],
+                settings.OUTPUT_FPS_POLICY
+            )
+        return OutputFormat(self.profile.output_fps(target or Fraction(25)), settings.OUTPUT_PIX_FMT)
+
+    def montage_format(self, sources: List[SourceClip]) -> OutputFormat:
+        """The planned output format, or one planned from the whole clips"""
+        return self.output_format or self.plan_format(sources)
+
+    def render(
+        self,
+        sources: List[SourceClip],
+        timeline: List[TimelineEntry],
+        output_path: str,
+        on_progress: Optional[Callable[[float], None]] = None,
+        renditions: List[Tuple[Tuple[int, int], str]] = (),
+        hls: Optional[HLSOutput] = None
+    ):
+        raise NotImplementedError
+
+class MoviePyBackend(RenderBackend):
+    """
+    Reference backend: decodes every frame into NumPy arrays, resizes and
+    crops them in Python and pipes raw frames to ffmpeg for encoding.
+    """
+
+    name = "moviepy"
+
+    def render(self, sources, timeline, output_path, on_progress=None, renditions=(), hls=None):
+        # Nothing was opened during ingest; every source is opened and
+        # conformed to the output size only while its entries are written
+        output_size = self.profile.output_size(sources[0].size)
+        final_video = LazyMontageClip(sources, timeline, output_size, float(self.montage_format(sources).fps))
+
+        render_progress, rendition_progress = _split_progress(on_progress, renditions)
+        try:
+            final_video.write_videofile(
+                output_path,
+                fps=final_video.fps,
+                codec='libx264',
+                audio=False,
+                preset=self.profile.preset,
+                ffmpeg_params=["-crf", str(self.profile.crf)],
+                threads=self.profile.threads or None,
+                logger=RenderProgressLogger(render_progress) if render_progress else None
+            )
+        finally:
+            final_video.close()
+
+        if hls:
+            hls.segment(output_path, final_video.duration)
+        if renditions:
+            encode_renditions(output_path, renditions, self.profile, final_video.duration, rendition_progress)
+
+class FFmpegBackend(RenderBackend):
+    """
+    Compiles the timeline into a single ffmpeg filtergraph and runs it as a
+    subprocess, so decoding, scaling and encoding all happen in native code
+    across cores instead of frame by frame in Python.
+
+    When the last clip loops, the timeline is rendered as parts instead:
+    the clips before the loop, one loop of the last clip and the partial
+    remainder are each encoded once, and the loop's file is repeated in the
+    concat list as often as needed.
+    """
+
+    name = "ffmpeg"
+
+    def video_filters(self, source: SourceClip, output_size: Tuple[int, int], output_format: OutputFormat) -> List[str]:
+        """Filters conforming one clip's frames to the output size, rate and pixel format"""
+        plan = NormalizationPlan(source.size, output_size)
+        source_fps = Fraction(source.info.fps) if source.info.frame_duration else None
+        return output_format.ffmpeg_filters(plan, source_fps, self.profile.scaler)
+
+    def build_command(
+        self,
+        sources: List[SourceClip],
+        timeline: List[TimelineEntry],
+        output_path: str,
+        renditions: List[Tuple[Tuple[int, int], str]] = (),
+        hls: Optional[HLSOutput] = None
+    ) -> List[str]:
+        """
+        ffmpeg arguments rendering timeline to output_path, video only.
+        Renditions are split off the finished frames inside the same graph,
+        so the sources are decoded once however many outputs there are.
+        With hls, the montage goes to the playlist with the background
+        track instead of to output_path.
+        """
+        output_format = self.montage_format(sources)
+        output_size = self.profile.output_size(sources[0].size)
+        total = sum(entry.duration for entry in timeline)
+
+        inputs: List[str] = []
+        chains: List[str] = []
+        for k, entry in enumerate(timeline):
+            source = sources[entry.source_index]
+            # One input per entry: a looped clip gets its own decoder rather
+            # than a split filter buffering every decoded frame between loops.
+            # Seeking and limiting the input stops decoding at the cut
+            # instead of trimming frames decoded to the end of the file
+            inputs += ["-ss", f"{entry.start:.6f}", "-t", f"{entry.duration:.6f}", "-i", source.path]
+            chain = ["setpts=PTS-STARTPTS", *self.video_filters(source, output_size, output_format)]
+            chains.append(f"[{k}:v:0]{','.join(chain)}[v{k}]")
+
+        segments = "".join(f"[v{k}]" for k in range(len(timeline)))
+        concat = f"{segments}concat=n={len(timeline)}:v=1:a=0,format={output_format.pix_fmt}"
+        if not renditions:
+            chains.append(f"{concat}[v]")
+        else:
+            labels = "".join(f"[r{k}]" for k in range(len(renditions)))
+            chains.append(f"{concat},split={len(renditions) + 1}[v]{labels}")
+            for k, (size, _) in enumerate(renditions):
+                filters = NormalizationPlan(output_size, size).ffmpeg_filters(self.profile.scaler) or ["null"]
+                chains.append(f"[r{k}]{','.join(filters)}[o{k}]")
+
+        args = [*inputs]
+        if hls:
+            args += ["-i", hls.audio_path]
+        args += ["-filter_complex", ";".join(chains)]
+
+        outputs = [("[v]", output_path)] + [(f"[o{k}]", path) for k, (_, path) in enumerate(renditions)]
+        for k, (label, path) in enumerate(outputs):
+            args += ["-map", label, "-c:v", "libx264", *self.profile.x264_args()]
+            if k == 0 and hls:
+                args += ["-t", f"{total:.6f}", *hls.output_args(audio_input=len(timeline))]
+            else:
+                args += ["-an", "-t", f"{total:.6f}", path]
+        return args
+
+    def part_command(
+        self,
+        sources: List[SourceClip],
+        entries: List[TimelineEntry],
+        output_format: OutputFormat,
+        frames: int,
+        output_path: str,
+        threads: int = 0
+    ) -> List[str]:
+        """
+        ffmpeg arguments encoding frames frames of consecutive timeline
+        entries, video only; threads overrides the profile's thread budget
+        """
+        output_size = self.profile.output_size(sources[0].size)
+        inputs: List[str] = []
+        chains: List[str] = []
+        for k, entry in enumerate(entries):
+            source = sources[entry.source_index]
+            # Seek on the input and read a frame past the end so rounding
+            # never leaves the part short
+            inputs += ["-ss", f"{entry.start:.6f}", "-t", f"{entry.duration + float(1 / output_format.fps):.6f}", "-i", source.path]
+            chain = ["setpts=PTS-STARTPTS", *self.video_filters(source, output_size, output_format)]
+            chains.append(f"[{k}:v:0]{','.join(chain)}[v{k}]")
+
+        segments = "".join(f"[v{k}]" for k in range(len(entries)))
+        # Parts ending at the end of their clip can run a frame short after
+        # rate conversion; repeat the last frame and let -frames:v cut
+        chains.append(f"{segments}concat=n={len(entries)}:v=1:a=0,tpad=stop_mode=clone:stop=-1,format={output_format.pix_fmt}[v]")
+
+        return [
+            *inputs,
+            "-filter_complex", ";".join(chains),
+            "-map", "[v]", "-frames:v", str(frames),
+            "-c:v", "libx264", *self.profile.x264_args(threads or None),
+            "-an", output_path
+        ]
+
+    def split_parts(self, timeline: List[TimelineEntry]) -> List[List[TimelineEntry]]:
+        """
+        Group the timeline into parts that are encoded separately.
+        Everything before the looped clip forms one part, split further so
+        no part decodes more inputs than the reader cap allows; the loops
+        and the remainder are parts of their own so repeats can share one
+        encode.
+        """
+        loop_start = next(
+            (i for i in range(1, len(timeline)) if _same_span(timeline[i], timeline[i - 1])),
+            None
+        )
+        if loop_start is None:
+            head, loops = timeline, []
+        else:
+            head, loops = timeline[:loop_start - 1], timeline[loop_start - 1:]
+        size = max(1, reader_slots.size(len(head)))
+        return [head[i:i + size] for i in range(0, len(head), size)] + [[entry] for entry in loops]
+
+    def render(self, sources, timeline, output_path, on_progress=None, renditions=(), hls=None):
+        parts = self.split_parts(timeline)
+        total = sum(entry.duration for entry in timeline)
+        # Encoding loops once saves work but only yields a file at the end;
+        # HLS renders the whole graph so segments appear from the start,
+        # unless it would open more inputs than the reader cap allows
+        if len(parts) == 1 or (hls and reader_slots.size(len(timeline)) == len(timeline)):
+            with reader_slots.hold(len(timeline)):
+                run_ffmpeg(
+                    self.build_command(sources, timeline, output_path, renditions, hls),
+                    duration=total,
+                    on_progress=on_progress
+                )
+        else:
+            render_progress, rendition_progress = _split_progress(on_progress, renditions)
+            self.render_parts(sources, parts, output_path, render_progress)
+            if hls:
+                hls.segment(output_path, total)
+            if renditions:
+                encode_renditions(output_path, renditions, self.profile, total, rendition_progress)
+
+    def render_parts(
+        self,
+        sources: List[SourceClip],
+        parts: List[List[TimelineEntry]],
+        output_path: str,
+        on_progress: Optional[Callable[[float], None]] = None,
+        workers: int = 1,
+        threads: int = 0
+    ):
+        """
+        Encode every distinct part once, up to workers at a time, and join
+        them in timeline order with a stream-copy concat. Parts an earlier
+        attempt left in the part directory are not encoded again.
+        """
+        output_format = self.montage_format(sources)
+        fps = output_format.fps
+        durations = [sum(entry.duration for entry in part) for part in parts]
+        total = sum(durations)
+
+        # Every part but the last gets its own rounded frame count, the last
+        # one absorbs the rounding so the total is exact
+        frames = [max(1, round(duration * fps)) for duration in durations]
+        frames[-1] = max(1, round(total * fps) - sum(frames[:-1]))
+
+        # Parts covering the same spans with the same frame count are encoded once
+        unique: Dict[tuple, Tuple[List[TimelineEntry], int]] = {}
+        part_keys = []
+        for part, count in zip(parts, frames):
+            key = (tuple((entry.source_index, entry.start, entry.end) for entry in part), count)
+            unique.setdefault(key, (part, count))
+            part_keys.append(key)
+
+        part_dir = output_path + ".parts"
+        os.makedirs(part_dir, exist_ok=True)
+        paths = {
+            key: os.path.join(part_dir, _segment_name(key, str(fps), output_format.pix_fmt, self.profile.name))
+            for key in unique
+        }
+        # Seconds encoded per distinct part, written by the workers; parts
+        # an earlier attempt finished count as done
+        done = {key: float(unique[key][1] / fps) if os.path.exists(paths[key]) else 0.0 for key in unique}
+        encode_total = sum(count for _, count in unique.values()) / fps
+
+        def encode(key):
+            part, count = unique[key]
+            part_duration = float(count / fps)
+
+            def track(fraction: float):
+                done[key] = fraction * part_duration
+
+            with reader_slots.hold(len(part)), _atomic_output(paths[key]) as temp_path:
+                run_ffmpeg(
+                    self.part_command(sources, part, output_format, count, temp_path, threads),
+                    duration=part_duration,
+                    on_progress=track
+                )
+            done[key] = part_duration
+
+        # The encoding happens in the ffmpeg child processes, so threads
+        # are enough to keep one encoder running per worker. Each runs in a
+        # copy of this context so a stopped render kills their ffmpegs too
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            pending = {
+                pool.submit(contextvars.copy_context().run, encode, key)
+                for key in unique if not os.path.exists(paths[key])
+            }
+            while pending:
+                finished, pending = wait(pending, timeout=0.5, return_when=FIRST_EXCEPTION)
+                for future in finished:
+                    if future.exception():
+                        for other in pending:
+                            other.cancel()
+                        raise future.exception()
+                if on_progress:
+                    # Leave the last few percent for the final concat
+                    on_progress(0.95 * float(sum(done.values()) / encode_total))
+
+        concat_copy([(paths[key], None, None) for key in part_keys], output_path, total)
+        # Left in place on failure for the next attempt to reuse
+        shutil.rmtree(part_dir, ignore_errors=True)
+
+def _same_span(a: TimelineEntry, b: TimelineEntry) -> bool:
+    return (a.source_index, a.start, a.end) == (b.source_index, b.start, b.end)
+
+def split_timeline(timeline: List[TimelineEntry], max_seconds: float = 0) -> List[TimelineEntry]:
+    """
+    Split timeline entries into pieces of at most max_seconds.
+    With max_seconds of 0 every entry stays a single piece.
+    """
+    if max_seconds <= 0:
+        return list(timeline)
+    pieces = []
+    for entry in timeline:
+        start = entry.start
+        while entry.end - start > max_seconds:
+            pieces.append(TimelineEntry(entry.source_index, start, start + max_seconds))
+            start += max_seconds
+        pieces.append(TimelineEntry(entry.source_index, start, entry.end))
+    return pieces
+
+class SegmentedFFmpegBackend(FFmpegBackend):
+    """
+    Renders independent pieces of the timeline in parallel, one ffmpeg
+    encoder per piece, then joins them with a stream-copy concat.
+
+    A single x264 encoder stops scaling after a handful of threads; many
+    small encoders with few threads each keep every core of a large node
+    busy. Pieces are one per timeline entry, or RENDER_SEGMENT_SECONDS long.
+    """
+
+    name = "segmented"
+
+    def render(self, sources, timeline, output_path, on_progress=None, renditions=(), hls=None):
+        pieces = split_timeline(timeline, settings.RENDER_SEGMENT_SECONDS)
+        render_progress, rendition_progress = _split_progress(on_progress, renditions)
+        self.render_parts(
+            sources,
+            [[piece] for piece in pieces],
+            output_path,
+            render_progress,
+            workers=settings.RENDER_SEGMENT_WORKERS or os.cpu_count() or 1,
+            threads=self.profile.threads or settings.RENDER_SEGMENT_THREADS
+        )
+        total = sum(entry.duration for entry in timeline)
+        if hls:
+            hls.segment(output_path, total)
+        if renditions:
+            encode_renditions(output_path, renditions, self.profile, total, rendition_progress)
+
+RENDER_BACKENDS = {backend.name: backend for backend in (MoviePyBackend, FFmpegBackend, SegmentedFFmpegBackend)}
+
+def get_render_backend(name: Optional[str] = None, profile: Optional[EncodingProfile] = None) -> RenderBackend:
+    """Instantiate the render backend configured by RENDER_BACKEND"""
+    name = name or settings.RENDER_BACKEND
+    if name not in RENDER_BACKENDS:
+        raise ValueError(f"Unknown render backend {name!r}, expected one of {sorted(RENDER_BACKENDS)}")
+    return RENDER_BACKENDS[name](profile)
+
 class VideoGenerationService:
     def __init__(self, db: Session):
         self.db = db
+        # A render writes progress and checkpoints from its threads, so
+        # every write to the session is serialized
+        self._db_lock = threading.Lock()
         self.storage_path = "storage/videos"
         os.makedirs(self.storage_path, exist_ok=True)
 
-    def create_task(self, user_id: str, background_url: str, media_list: List[str], duration: Optional[int] = None) -> VideoTask:
-        """Create a new video generation task"""
+    def create_task(
+        self,
+        user_id: str,
+        background_url: str,
+        media_list: List[str],
+        duration: Optional[int] = None,
+        profile: Optional[str] = None,
+        preview_task_id: Optional[str] = None,
+        renditions: Optional[List[str]] = None,
+        output_format: Optional[str] = None,
+        fps: Optional[float] = None,
+        cost: Optional[float] = None
+    ) -> VideoTask:
+        """Create a new video generation task, queued at its estimated cost"""
         task = VideoTask(
             id=str(uuid.uuid4()),
             user_id=user_id,
             status="pending",
             background_url=background_url,  # Now used for audio track
             media_list=media_list,
-            duration=duration
+            duration=duration,
+            profile=profile,
+            preview_task_id=preview_task_id,
+            renditions=renditions,
+            output_format=output_format,
+            fps=fps
         )
         self.db.add(task)
+        # The job is stored with the task, so no accepted task is ever lost
+        JobQueue.enqueue(self.db, task, cost)
         self.db.commit()
         self.db.refresh(task)
         return task
 
-    def update_task_progress(self, task_id: str, progress: float, status: str = None, error: str = None, output_url: str = None):
+    def update_task_progress(self, task_id: str, progress: float, status: str = None, error: str = None, output_url: str = None, stage_timings: dict = None, playlist_url: str = None):
         """Update task progress and status"""
-        task = self.db.query(VideoTask).filter(VideoTask.id == task_id).first()
-        if task:
-            task.progress = progress
-            if status:
-                task.status = status
-            if error:
-                task.error_message = error
-            if output_url:
-                task.output_url = output_url
-            self.db.commit()
-            self.db.refresh(task)
-
-    async def generate_video(self, task_id: str):
-        """Generate video montage with background audio"""
-        try:
+        with self._db_lock:
             task = self.db.query(VideoTask).filter(VideoTask.id == task_id).first()
-            if not task:
-                return
+            if task:
+                task.progress = progress
+                if status:
+                    task.status = status
+                if error:
+                    task.error = error
+                if output_url:
+                    task.output_url = output_url
+                if stage_timings:
+                    task.stage_timings = stage_timings
+                if playlist_url:
+                    task.playlist_url = playlist_url
+                self.db.commit()
+                self.db.refresh(task)
 
-            self.update_task_progress(task_id, 0.1, "processing")
+    async def generate_video(self, task_id: str, stop: Optional[threading.Event] = None):
+        """
+        Generate video montage with background audio.
+        Setting stop ends the render early: its ffmpeg runs are killed, its
+        threads are waited for and RenderCancelled is raised, leaving the
+        work files and checkpoints to whoever renders the task next.
+        """
+        # The worker's event loop is shared by other renders and their
+        # heartbeats, so every database call of a render runs in a thread
+        task = await asyncio.to_thread(self.get_task, task_id)
+        if not task:
+            return
+        # Commits then leave the task loaded: reading its fields on the
+        # loop never turns into a query
+        self.db.expire_on_commit = False
 
-            # Download background audio
-            audio_path = download_file(task.background_url, self.storage_path)
+        stop = stop or threading.Event()
+        with stop_on(stop):
+            await self._generate_video(task, stop)
+
+    async def _generate_video(self, task: VideoTask, stop: threading.Event):
+        task_id = task.id
+        timer = StageTimer()
+        # A task claimed again after its worker died resumes from what the
+        # earlier attempt finished; the checkpoints say what that was
+        checkpoints = TaskCheckpoints(self.db, task, self._db_lock)
+        try:
+            await asyncio.to_thread(self.update_task_progress, task_id, 0.1, "processing")
+            profile = get_profile(task.profile)
+            backend = get_render_backend(profile=profile)
+
+            # Stream clips through download, probe and normalize while the
+            # background audio downloads alongside; ingest covers 0.1 - 0.5
+            pipeline = IngestPipeline(
+                task_id,
+                task.media_list,
+                load=probe_clip,
+                normalize=backend.prepare,
+                target_duration=task.duration,
+                on_progress=ProgressReporter(self, task_id, 0.1, 0.5),
+                downloaded=checkpoints.get("downloads", []),
+                on_downloaded=lambda path: checkpoints.append("downloads", path)
+            )
+            with timer.stage("ingest"):
+                audio_path, sources = await _until_stopped(pipeline.run(task.background_url), stop)
             if not audio_path:
                 raise Exception("Failed to download background audio")
 
-            # Download media files
-            media_paths = []
-            for url in task.media_list:
-                path = download_file(url, self.storage_path)
-                if path:
-                    media_paths.append(path)
+            # Failed media downloads are skipped, order is kept for the timeline
+            sources = [source for source in sources if source is not None]
 
-            if not media_paths:
+            if not sources:
                 raise Exception("Failed to download any media files")
 
-            self.update_task_progress(task_id, 0.3)
-
-            # Load background audio
-            background_audio = AudioFileClip(audio_path)
-            
-            # Load and process media clips
-            video_clips = []
-            total_duration = 0
-            
-            for path in media_paths:
-                clip = VideoFileClip(path).without_audio()  # Remove original audio
-                total_duration += clip.duration
-                video_clips.append(clip)
-            
-            # Handle duration
-            target_duration = task.duration if task.duration else total_duration
-            total_original_duration = total_duration
-
-            if target_duration < total_original_duration:
-                # If target duration is shorter, adjust clip durations proportionally
-                scale_factor = target_duration / total_original_duration
-                video_clips = [clip.subclip(0, clip.duration * scale_factor) for clip in video_clips]
-            elif target_duration > total_original_duration:
-                # If target duration is longer, loop the last clip
-                remaining_duration = target_duration - total_original_duration
-                last_clip = video_clips[-1]
-                loops_needed = int(remaining_duration / last_clip.duration)
-                remainder = remaining_duration % last_clip.duration
-                
-                # Add full loops
-                for _ in range(loops_needed):
-                    video_clips.append(last_clip)
-                
-                # Add partial loop if needed
-                if remainder > 0:
-                    video_clips.append(last_clip.subclip(0, remainder))
-
-            self.update_task_progress(task_id, 0.5)
-
-            # Get the aspect ratio from the first video
-            if not video_clips:
-                raise Exception("No valid video clips provided")
-            
-            base_width, base_height = video_clips[0].size
-            aspect_ratio = base_width / base_height
-
-            # Resize all subsequent clips to match the first video's dimensions
-            for i in range(1, len(video_clips)):
-                clip = video_clips[i]
-                current_ratio = clip.size[0] / clip.size[1]
-                
-                if current_ratio > aspect_ratio:
-                    # Video is wider than target ratio, fit to height
-                    new_width = int(base_height * current_ratio)
-                    resized = clip.resize(height=base_height)
-                    # Crop to match target width
-                    x_center = resized.size[0] // 2
-                    video_clips[i] = resized.crop(
-                        x1=x_center - (base_width // 2),
-                        y1=0,
-                        x2=x_center + (base_width // 2),
-                        y2=base_height
-                    )
-                else:
-                    # Video is taller than target ratio, fit to width
-                    new_height = int(base_width / current_ratio)
-                    resized = clip.resize(width=base_width)
-                    # Crop to match target height
-                    y_center = resized.size[1] // 2
-                    video_clips[i] = resized.crop(
-                        x1=0,
-                        y1=y_center - (base_height // 2),
-                        x2=base_width,
-                        y2=y_center + (base_height // 2)
+            timeline = build_timeline([source.duration for source in sources], task.duration)
+            # One frame rate and pixel format for the whole montage, picked
+            # before anything is decoded. A retry keeps the earlier plan, so
+            # segments already encoded still fit, unless the clips changed
+            durations = [source.duration for source in sources]
+            planned = checkpoints.get("metadata")
+            if planned and planned["durations"] == durations:
+                output_format = OutputFormat(Fraction(planned["fps"]), planned["pix_fmt"])
+            else:
+                output_format = backend.plan_format(sources, timeline, task.fps)
+                await asyncio.to_thread(checkpoints.record, "metadata", {
+                    "durations": durations,
+                    "fps": str(output_format.fps),
+                    "pix_fmt": output_format.pix_fmt
+                })
+            backend.output_format = output_format
+
+            # Clips already in the montage's format only need the GOPs around
+            # the cuts re-encoded, or none if cuts may move to keyframes
+            smart_pieces = None
+            if settings.SMART_RENDER_ENABLED and can_smart_render(sources, profile, output_format):
+                cut_points = await asyncio.to_thread(smart_cut_points, sources, timeline)
+                if settings.SMART_RENDER_SNAP_SECONDS:
+                    timeline = snap_timeline(timeline, cut_points, settings.SMART_RENDER_SNAP_SECONDS)
+                pieces = plan_pieces(timeline, Fraction(sources[0].info.fps), cut_points)
+                if any(piece.copy for piece in pieces):
+                    smart_pieces = pieces
+            total_duration = sum(entry.duration for entry in timeline)
+
+            await asyncio.to_thread(self.update_task_progress, task_id, 0.5)
+
+            # The background track is looped/trimmed and encoded while the
+            # video renders, then both are muxed without re-encoding;
+            # rendering covers 0.5 - 0.95
+            fitted_audio_path, video_path = self._work_paths(task)[:2]
+            output_path = os.path.join(self.storage_path, f"output_{task_id}.mp4")
+
+            # Renditions smaller than the montage are encoded from the same
+            # decoded frames; one at or above its height is the main output
+            output_size = profile.output_size(sources[0].size)
+            renditions = []
+            rendition_urls = {}
+            for name in task.renditions or []:
+                height = RENDITION_HEIGHTS[name]
+                if height >= output_size[1]:
+                    rendition_urls[name] = f"/storage/videos/output_{task_id}.mp4"
+                    continue
+                renditions.append((
+                    name,
+                    rendition_size(output_size, height),
+                    os.path.join(self.storage_path, f"video_{task_id}_{name}.mp4")
+                ))
+            rendition_outputs = [(size, path) for _, size, path in renditions]
+
+            # HLS segments carry the fitted background track; the playlist
+            # is published as soon as it lists a segment
+            hls = None
+            if task.output_format == "hls":
+                hls = HLSOutput(
+                    os.path.join(self.storage_path, f"hls_{task_id}"),
+                    fitted_audio_path,
+                    settings.HLS_SEGMENT_SECONDS
+                )
+            playlist_published = False
+
+            def publish_playlist(progress: float):
+                nonlocal playlist_published
+                if hls and not playlist_published and hls.has_segment():
+                    playlist_published = True
+                    self.update_task_progress(
+                        task_id, progress,
+                        playlist_url=f"/storage/videos/hls_{task_id}/{os.path.basename(hls.playlist_path)}"
                     )
 
-            # Concatenate all clips
-            final_video = concatenate_videoclips(video_clips)
+            def encoded_paths() -> List[str]:
+                # What the mux reads: the HLS playlist and its segments, or
+                # the full-size video, which HLS mode may never write
+                main = hls.files() if hls else [video_path]
+                return main + [path for _, _, path in renditions]
+
+            def render_video():
+                if checkpoints.complete("encoded", encoded_paths()):
+                    # An earlier attempt got as far as the mux
+                    publish_playlist(0.95)
+                    return
+                if hls and task.playlist_url:
+                    # An earlier attempt published its playlist, and encoding
+                    # again would rewrite it from the first segment, which an
+                    # event playlist never does. It is withdrawn and published
+                    # again once the new one lists a segment
+                    self._withdraw_playlist(task)
+                    hls.clear()
+                encode_video()
+                checkpoints.record("encoded", encoded_paths())
+
+            def encode_video():
+                with timer.stage("video"):
+                    reporter = ProgressReporter(self, task_id, 0.5, 0.95)
+
+                    def progress(fraction: float):
+                        reporter(fraction)
+                        publish_playlist(reporter.progress)
 
-            # Prepare audio
-            if background_audio.duration < final_video.duration:
-                # Loop audio if needed
-                background_audio = background_audio.loop(duration=final_video.duration)
+                    # Smart render pieces are cut by frame count, so they are
+                    # preferred over the plain concat even when all are copies
+                    if smart_pieces:
+                        smart_progress, rendition_progress = _split_progress(progress, rendition_outputs)
+                        render_smart(sources, smart_pieces, video_path, profile, smart_progress)
+                    elif settings.STREAM_COPY_ENABLED and can_stream_copy(sources, timeline, profile, output_format):
+                        render_stream_copy(sources, timeline, video_path)
+                        rendition_progress = progress
+                    else:
+                        backend.render(
+                            sources, timeline, video_path,
+                            on_progress=progress,
+                            renditions=rendition_outputs,
+                            hls=hls
+                        )
+                        publish_playlist(reporter.progress)
+                        return
+
+                    # Remuxed clips only make the full-size video; HLS
+                    # segments and renditions are derived from it
+                    if hls:
+                        hls.segment(video_path, total_duration)
+                    if rendition_outputs:
+                        encode_renditions(video_path, rendition_outputs, profile, total_duration, rendition_progress)
+                    publish_playlist(reporter.progress)
+
+            def prepare_audio():
+                with timer.stage("audio"):
+                    fit_audio(audio_path, total_duration, fitted_audio_path)
+
+            if hls:
+                # The first segment needs the fitted track, so it comes first
+                await asyncio.to_thread(prepare_audio)
+                await asyncio.to_thread(render_video)
             else:
-                # Trim audio if needed
-                background_audio = background_audio.subclip(0, final_video.duration)
+                # Let both branches finish before the task is failed
+                results = await asyncio.gather(
+                    asyncio.to_thread(render_video),
+                    asyncio.to_thread(prepare_audio),
+                    return_exceptions=True
+                )
+                for result in results:
+                    if isinstance(result, BaseException):
+                        raise result
 
-            # Set audio to final video
-            final_video = final_video.set_audio(background_audio)
+            def mux():
+                with timer.stage("mux"):
+                    if hls:
+                        # The segments already hold both tracks
+                        hls.remux(output_path)
+                    else:
+                        mux_audio(video_path, fitted_audio_path, output_path, total_duration)
+                    for name, _, rendition_path in renditions:
+                        mux_audio(
+                            rendition_path, fitted_audio_path,
+                            os.path.join(self.storage_path, f"output_{task_id}_{name}.mp4"),
+                            total_duration
+                        )
+                        rendition_urls[name] = f"/storage/videos/output_{task_id}_{name}.mp4"
 
-            # Save the final video
-            output_path = os.path.join(self.storage_path, f"output_{task_id}.mp4")
-            final_video.write_videofile(
-                output_path,
-                codec='libx264',
-                audio_codec='aac',
-                temp_audiofile=os.path.join(self.storage_path, f"temp_audio_{task_id}.m4a"),
-                remove_temp=True
-            )
+            # Off the event loop, like every other ffmpeg run, so tasks
+            # sharing the worker keep reporting progress
+            await asyncio.to_thread(mux)
+            # Stopped after the last ffmpeg: the work files may already be
+            # another worker's
+            check_stopped()
 
-            # Update task with output URL
-            task.output_url = f"/storage/videos/output_{task_id}.mp4"
-            task.status = "done"
-            task.progress = 1.0
-            self.db.commit()
+            def finish():
+                self._remove_work_files(task)
+                with self._db_lock:
+                    # Update task with output URL
+                    task.output_url = f"/storage/videos/output_{task_id}.mp4"
+                    if rendition_urls:
+                        task.rendition_urls = rendition_urls
+                    task.status = "done"
+                    task.progress = 1.0
+                    task.stage_timings = timer.summary()
+                    self.db.commit()
 
-            # Clean up clips
-            background_audio.close()
-            for clip in video_clips:
-                if clip:
-                    clip.close()
-            final_video.close()
+            await asyncio.to_thread(finish)
 
+        except RenderCancelled:
+            # Stopped, not failed: the job is claimed again and resumes
+            # from the work files and checkpoints left behind
+            raise
         except Exception as e:
-            self.update_task_progress(task_id, 0, "error", error=str(e))
+            # Nothing retries a failed render, so its work files go too
+            def fail():
+                self._remove_work_files(task)
+                self.update_task_progress(task_id, 0, "error", error=str(e), stage_timings=timer.summary())
+
+            await asyncio.to_thread(fail)
             raise
 
+    def _withdraw_playlist(self, task: VideoTask):
+        """Unpublish a task's HLS playlist until it is written again"""
+        with self._db_lock:
+            task.playlist_url = None
+            self.db.commit()
+
+    def _work_paths(self, task: VideoTask) -> List[str]:
+        """Files and directories a task renders into before the final mux"""
+        video_path = os.path.join(self.storage_path, f"video_{task.id}.mp4")
+        return [
+            os.path.join(self.storage_path, f"audio_{task.id}.m4a"),
+            video_path,
+            video_path + ".parts",
+            video_path + ".pieces",
+            *(os.path.join(self.storage_path, f"video_{task.id}_{name}.mp4") for name in task.renditions or [])
+        ]
+
+    def _remove_work_files(self, task: VideoTask):
+        for path in self._work_paths(task):
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+
     def get_task(self, task_id: str) -> Optional[VideoTask]:
         """Get task by ID"""
         return self.db.query(VideoTask).filter(VideoTask.id == task_id).first() 
\ No newline at end of file
@@ -0,0 +1,151 @@
+import asyncio
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Optional, Set
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.services.job_queue import JobQueue
+from app.services.video_generation import VideoGenerationService
+from app.utils.ffmpeg import RenderCancelled
+
+class RenderWorker:
+    """
+    Claims render jobs from the job queue and renders them in this
+    process, up to concurrency at a time.
+
+    The API only records tasks; rendering never runs on its event loop.
+    Every task gets its own database session, opened by the worker for
+    the length of the render, and its lease is renewed by a heartbeat
+    until the render ends. A render whose lease is lost is stopped, as
+    another worker may already have claimed the job again: its ffmpeg
+    runs are killed and its threads waited for before the session closes.
+
+    Every worker also reaps: every JOB_REAP_SECONDS it requeues the jobs
+    of workers that stopped heartbeating, so no task waits on a dead node.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = None,
+        poll_seconds: float = None,
+        session_factory: Callable[[], Session] = SessionLocal,
+        queue: Optional[JobQueue] = None,
+        heartbeat_seconds: float = None,
+        reap_seconds: float = None
+    ):
+        self.concurrency = concurrency or settings.WORKER_CONCURRENCY
+        self.poll_seconds = poll_seconds if poll_seconds is not None else settings.WORKER_POLL_SECONDS
+        self.heartbeat_seconds = heartbeat_seconds or settings.JOB_HEARTBEAT_SECONDS
+        self.reap_seconds = reap_seconds if reap_seconds is not None else settings.JOB_REAP_SECONDS
+        self.session_factory = session_factory
+        self.queue = queue or JobQueue(session_factory)
+        # Unique per process, so a restarted worker never renews its old leases
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running: Set[asyncio.Task] = set()
+        self._reaped_at: Optional[float] = None
+
+    def claim(self) -> Optional[str]:
+        """Lease the next job, or None if there is none to take"""
+        return self.queue.claim(self.worker_id)
+
+    async def reap(self):
+        """Requeue expired jobs if the last reap is more than reap_seconds ago"""
+        if self._reaped_at is not None and time.monotonic() - self._reaped_at < self.reap_seconds:
+            return
+        self._reaped_at = time.monotonic()
+        for task_id in await asyncio.to_thread(self.queue.reap):
+            print(f"Requeued task {task_id}, its worker stopped renewing the lease")
+
+    async def _heartbeat(self, task_id: str, stop: threading.Event):
+        """
+        Renew the lease every heartbeat_seconds. A renewal that fails is
+        retried sooner, backing off up to the usual interval; once the lease
+        has run out without one succeeding it is as good as lost.
+        """
+        renewed_at = time.monotonic()
+        failures = 0
+        while True:
+            await asyncio.sleep(min(self.heartbeat_seconds, 2 ** failures) if failures else self.heartbeat_seconds)
+            try:
+                held = await asyncio.to_thread(self.queue.heartbeat, task_id, self.worker_id)
+            except Exception as e:
+                failures += 1
+                print(f"Error renewing the lease on task {task_id}: {str(e)}")
+                if time.monotonic() - renewed_at < self.queue.lease_seconds:
+                    continue
+                held = False
+            if not held:
+                print(f"Lost the lease on task {task_id}, stopping its render")
+                stop.set()
+                return
+            renewed_at = time.monotonic()
+            failures = 0
+
+    async def run_task(self, task_id: str):
+        """Render one claimed task with a session of its own while holding its lease"""
+        db = self.session_factory()
+        stop = threading.Event()
+        heartbeat = asyncio.create_task(self._heartbeat(task_id, stop))
+        try:
+            try:
+                await VideoGenerationService(db).generate_video(task_id, stop)
+                state = "done"
+            except RenderCancelled:
+                # The lease is gone, so is the job: its new owner finishes it
+                return
+            except Exception as e:
+                # The task already carries the error; keep the worker running
+                print(f"Error rendering task {task_id}: {str(e)}")
+                state = "failed"
+            finally:
+                db.close()
+            # The heartbeat keeps the lease until the job is closed
+            await self._finish(task_id, state, stop)
+        finally:
+            heartbeat.cancel()
+
+    async def _finish(self, task_id: str, state: str, stop: threading.Event):
+        """
+        Close the job with its final state. A failure is retried with
+        backoff, as a job left leased would be reaped and rendered again,
+        until the heartbeat finds the lease lost.
+        """
+        failures = 0
+        while not stop.is_set():
+            try:
+                if not await asyncio.to_thread(self.queue.finish, task_id, self.worker_id, state):
+                    print(f"Lost the lease on task {task_id} before closing its job")
+                return
+            except Exception as e:
+                failures += 1
+                print(f"Error closing the job of task {task_id}: {str(e)}")
+            await asyncio.sleep(min(self.heartbeat_seconds, 2 ** failures))
+
+    def _job_done(self, job: asyncio.Task):
+        self._running.discard(job)
+        if not job.cancelled() and job.exception():
+            print(f"Error in render job: {str(job.exception())}")
+
+    async def run(self, stop: Optional[asyncio.Event] = None):
+        """Claim and render jobs until stop is set, then let running renders finish"""
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            await self.reap()
+            while len(self._running) < self.concurrency:
+                task_id = await asyncio.to_thread(self.claim)
+                if task_id is None:
+                    break
+                job = asyncio.create_task(self.run_task(task_id))
+                self._running.add(job)
+                job.add_done_callback(self._job_done)
+            try:
+                await asyncio.wait_for(stop.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+        if self._running:
+            # One failed render must not abandon the others
+            await asyncio.gather(*self._running, return_exceptions=True)
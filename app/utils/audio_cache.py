@@ -0,0 +1,174 @@
+import os
+import shutil
+import uuid
+from typing import Dict, Iterator, Optional
+import numpy as np
+from app.core.config import settings
+from app.utils.download_cache import CacheIndex, hash_file
+from app.utils.ffmpeg import pipe_to_ffmpeg, run_ffmpeg
+
+# Samples handed to the encoder per write when fitting a track
+BLOCK_SECONDS = 10
+
+class PCMTrack:
+    """A decoded background track, memory-mapped as interleaved signed 16-bit samples"""
+
+    def __init__(self, path: str, sample_rate: int, channels: int):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        if os.path.getsize(path):
+            self.samples = np.memmap(path, dtype=np.int16, mode='r').reshape(-1, channels)
+        else:
+            self.samples = np.zeros((0, channels), dtype=np.int16)
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sample_rate
+
+    def iter_fitted(self, duration: float) -> Iterator[bytes]:
+        """
+        Yield the track looped or trimmed to duration as raw PCM.
+        Loops are slices of the same mapped buffer, nothing is decoded again.
+        """
+        remaining = round(duration * self.sample_rate)
+        block = BLOCK_SECONDS * self.sample_rate
+        length = len(self.samples)
+        if not length:
+            # A track without samples fills the montage with silence
+            while remaining > 0:
+                frames = min(block, remaining)
+                yield bytes(frames * self.channels * 2)
+                remaining -= frames
+            return
+
+        position = 0
+        while remaining > 0:
+            frames = min(block, remaining, length - position)
+            yield self.samples[position:position + frames].tobytes()
+            remaining -= frames
+            position = (position + frames) % length
+
+class AudioCache:
+    """
+    Cache of decoded background tracks shared across tasks.
+
+    Each distinct track (by content hash) is decoded once to raw PCM; any
+    target duration is then produced by slicing that buffer and encoding
+    the result. Finished AAC encodes are cached too, keyed by track and
+    duration, so popular (track, duration) pairs are not even re-encoded.
+    Both live under one LRU budget.
+    """
+
+    def __init__(self, root: str, max_bytes: int, sample_rate: int = 44100, channels: int = 2):
+        self.root = root
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.index = CacheIndex(root, max_bytes)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name)
+
+    def _temp_path(self, path: str) -> str:
+        # Unique per writer so concurrent tasks never share a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"{path}.{uuid.uuid4().hex}.part"
+
+    def pcm(self, audio_path: str, content_hash: Optional[str] = None) -> PCMTrack:
+        """Return the decoded track for audio_path, decoding it on first use"""
+        content_hash = content_hash or hash_file(audio_path)
+        key = f"pcm:{content_hash}:{self.sample_rate}:{self.channels}"
+        path = self.index.get(key)
+        if path:
+            self.index.incr("pcm_hits")
+        else:
+            self.index.incr("pcm_misses")
+            path = self._path(f"{content_hash}.{self.sample_rate}x{self.channels}.s16le")
+            temp_path = self._temp_path(path)
+            try:
+                run_ffmpeg([
+                    "-i", audio_path, "-map", "0:a:0",
+                    "-f", "s16le", "-acodec", "pcm_s16le",
+                    "-ar", str(self.sample_rate), "-ac", str(self.channels),
+                    temp_path
+                ])
+                os.replace(temp_path, path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            self.index.put(key, path)
+        return PCMTrack(path, self.sample_rate, self.channels)
+
+    def fitted_aac(self, audio_path: str, duration: float, output_path: str):
+        """
+        Write the track looped or trimmed to duration as AAC at output_path,
+        reusing a cached encode when one exists for this track and duration.
+        """
+        content_hash = hash_file(audio_path)
+        key = f"aac:{content_hash}:{round(duration * 1000)}"
+        cached = self.index.get(key)
+        if cached:
+            self.index.incr("aac_hits")
+        else:
+            self.index.incr("aac_misses")
+            track = self.pcm(audio_path, content_hash)
+            cached = self._path(f"{content_hash}.{round(duration * 1000)}ms.m4a")
+            temp_path = self._temp_path(cached)
+            try:
+                encode_pcm(track, duration, temp_path)
+                os.replace(temp_path, cached)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            self.index.put(key, cached)
+
+        # Hard-link so eviction never pulls the file from under a render
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        try:
+            os.link(cached, output_path)
+        except OSError:
+            shutil.copyfile(cached, output_path)
+
+    def stats(self) -> Dict[str, float]:
+        stats = {"pcm_hits": 0, "pcm_misses": 0, "aac_hits": 0, "aac_misses": 0, "evictions": 0}
+        stats.update(self.index.stats())
+        return stats
+
+def encode_pcm(track: PCMTrack, duration: float, output_path: str):
+    """Encode the track fitted to duration as AAC in an MP4 audio container"""
+    pipe_to_ffmpeg([
+        "-f", "s16le", "-ar", str(track.sample_rate), "-ac", str(track.channels), "-i", "pipe:0",
+        "-c:a", "aac", "-f", "mp4", output_path
+    ], track.iter_fitted(duration))
+
+def fit_audio(audio_path: str, duration: float, output_path: str):
+    """
+    Produce the background track looped or trimmed to duration as AAC.
+    Goes through the shared audio cache when enabled, otherwise encodes
+    directly from the downloaded file.
+    """
+    cache = get_audio_cache()
+    if cache:
+        cache.fitted_aac(audio_path, duration, output_path)
+        return
+    run_ffmpeg([
+        "-stream_loop", "-1", "-i", audio_path, "-map", "0:a:0",
+        "-t", f"{duration:.6f}", "-c:a", "aac", "-f", "mp4", output_path
+    ])
+
+_cache: Optional[AudioCache] = None
+
+def get_audio_cache() -> Optional[AudioCache]:
+    """Return the process-wide audio cache, or None when disabled"""
+    global _cache
+    if not settings.AUDIO_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = AudioCache(
+            settings.AUDIO_CACHE_DIR or os.path.join(settings.STORAGE_DIR, "audio_cache"),
+            settings.AUDIO_CACHE_MAX_BYTES,
+            settings.AUDIO_SAMPLE_RATE,
+            settings.AUDIO_CHANNELS
+        )
+    return _cache
@@ -1,37 +1,475 @@
+import asyncio
+import fcntl
+import json
 import os
-import requests
-from typing import Optional
+import random
+import httpx
+from contextlib import asynccontextmanager
+from typing import List, Optional
 from urllib.parse import urlparse
 from app.core.config import settings
+from app.utils.download_cache import DownloadCache, get_download_cache, hash_file
+from app.utils.mp4 import MovieIndex, read_movie_index
 
-def download_file(url: str, task_id: str) -> Optional[str]:
+def _task_dir(task_id: str) -> str:
+    """Return the task's download directory, creating it if needed"""
+    task_dir = os.path.join(settings.STORAGE_DIR, task_id)
+    os.makedirs(task_dir, exist_ok=True)
+    return task_dir
+
+def _file_name(url: str) -> str:
+    """Derive a local file name from the URL path"""
+    file_name = os.path.basename(urlparse(url).path)
+    if not file_name:
+        file_name = f"file_{hash(url)}.mp4"
+    return file_name
+
+def task_file_path(task_id: str, index: int, url: str) -> str:
+    """
+    Local path for the index-th input of a task.
+    The input position is part of the name so two URLs sharing a basename
+    never write to the same file.
+    """
+    return os.path.join(_task_dir(task_id), f"{index:03d}_{_file_name(url)}")
+
+def _chunk_size(content_length: Optional[int]) -> int:
+    """
+    Pick a read size for a response.
+    Small files keep small chunks, large files read in bigger chunks so
+    fewer syscalls and event loop iterations are spent per megabyte.
+    """
+    if not content_length:
+        return settings.DOWNLOAD_MIN_CHUNK_SIZE
+    return max(
+        settings.DOWNLOAD_MIN_CHUNK_SIZE,
+        min(settings.DOWNLOAD_MAX_CHUNK_SIZE, content_length // 32)
+    )
+
+# Statuses worth retrying: the server may answer normally a moment later
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+class RetryableDownloadError(Exception):
+    """A download attempt failed in a way that may succeed on retry"""
+
+class RangeNotHonored(Exception):
+    """The server answered a range request with the full body"""
+
+class RemoteFile:
+    """What a HEAD request told us about a URL"""
+
+    def __init__(
+        self,
+        size: Optional[int] = None,
+        accept_ranges: bool = False,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        not_modified: bool = False
+    ):
+        self.size = size
+        self.accept_ranges = accept_ranges
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+        self.limited = False  # size was cut down to a requested prefix
+
+    @classmethod
+    def from_response(cls, response: httpx.Response) -> "RemoteFile":
+        content_length = response.headers.get("Content-Length")
+        return cls(
+            size=int(content_length) if content_length else None,
+            accept_ranges=response.headers.get("Accept-Ranges", "").lower() == "bytes",
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            not_modified=response.status_code == 304
+        )
+
+    def limit(self, byte_limit: Optional[int]):
+        """Only fetch the first byte_limit bytes, if the server allows ranges"""
+        if byte_limit and self.accept_ranges and self.size and byte_limit < self.size:
+            self.size = byte_limit
+            self.limited = True
+
+    @property
+    def validator(self) -> Optional[str]:
+        """Value for If-Range; weak ETags are not allowed there"""
+        if self.etag and not self.etag.startswith("W/"):
+            return self.etag
+        return self.last_modified
+
+def _check_status(response: httpx.Response):
+    """Raise for error statuses, marking the transient ones as retryable"""
+    if response.status_code in RETRY_STATUSES:
+        raise RetryableDownloadError(f"{response.url} returned {response.status_code}")
+    response.raise_for_status()
+
+async def _retry(factory):
     """
-    Download a file from URL and save it to the storage directory.
-    Returns the local file path if successful, None otherwise.
+    Await factory() until it succeeds, retrying transient failures with
+    bounded exponential backoff and jitter.
     """
+    for attempt in range(settings.DOWNLOAD_RETRIES + 1):
+        try:
+            return await factory()
+        except (RetryableDownloadError, httpx.TransportError):
+            if attempt == settings.DOWNLOAD_RETRIES:
+                raise
+            delay = min(settings.DOWNLOAD_BACKOFF_MAX, settings.DOWNLOAD_BACKOFF_BASE * 2 ** attempt)
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+def _load_state(path: str) -> Optional[dict]:
     try:
-        # Create task directory if it doesn't exist
-        task_dir = os.path.join(settings.STORAGE_DIR, task_id)
-        os.makedirs(task_dir, exist_ok=True)
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _save_state(path: str, state: dict):
+    with open(path, 'w') as f:
+        json.dump(state, f)
+
+def _discard(part_path: str):
+    """Remove a partial download and its segment state"""
+    for path in (part_path, part_path + ".json"):
+        if os.path.exists(path):
+            os.remove(path)
+
+@asynccontextmanager
+async def _file_lock(path: str):
+    """Hold an exclusive cross-process lock on path"""
+    with open(path, 'w') as f:
+        await asyncio.to_thread(fcntl.flock, f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+class AsyncDownloader:
+    """
+    Concurrent downloader backed by a single pooled, keep-alive HTTP client.
+    A global semaphore bounds downloads across all tasks in the process and
+    each call to download_files gets its own per-task limit on top of it.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        task_concurrency: Optional[int] = None
+    ):
+        self.max_concurrency = max_concurrency or settings.DOWNLOAD_MAX_CONCURRENCY
+        self.task_concurrency = task_concurrency or settings.DOWNLOAD_TASK_CONCURRENCY
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind(self):
+        """
+        Create the client and global semaphore for the running event loop.
+        Both are loop-bound, so a new loop (e.g. asyncio.run in a worker)
+        gets fresh instances instead of reusing dead ones.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=httpx.Timeout(settings.DOWNLOAD_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency
+                )
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+
+    async def download(self, url: str, local_path: str, byte_limit: Optional[int] = None) -> Optional[str]:
+        """
+        Fetch a single URL into local_path, going through the download cache
+        when it is enabled. With byte_limit only that many leading bytes are
+        fetched when the server supports ranges.
+        Returns the local file path if successful, None otherwise.
+        """
+        self._bind()
+        cache = get_download_cache()
+        try:
+            async with self._semaphore:
+                if cache is None:
+                    part_path = local_path + ".part"
+                    await self._fetch(url, part_path, byte_limit=byte_limit)
+                    os.replace(part_path, local_path)
+                else:
+                    await self._fetch_cached(cache, url, local_path, byte_limit)
+
+            return local_path
 
-        # Get file name from URL
-        file_name = os.path.basename(urlparse(url).path)
-        if not file_name:
-            file_name = f"file_{hash(url)}.mp4"
+        except Exception as e:
+            print(f"Error downloading file from {url}: {str(e)}")
+            return None
 
-        local_path = os.path.join(task_dir, file_name)
+    async def _fetch_cached(
+        self,
+        cache: DownloadCache,
+        url: str,
+        local_path: str,
+        byte_limit: Optional[int] = None
+    ):
+        """Serve url from the cache, revalidating or downloading as needed"""
+        # A prefix is cached separately from the full file
+        cache_key = f"{url}#bytes=0-{byte_limit - 1}" if byte_limit else url
+        part_path = cache.part_path(cache_key)
 
-        # Download file in chunks
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
+        # The cache index is SQLite and linking copies across devices, so
+        # both run in threads while other downloads keep streaming
+        def hit(cached_path: str, revalidated: bool = False):
+            if revalidated:
+                cache.mark_validated(cache_key)
+                cache.index.incr("revalidations")
+            cache.link(cached_path, local_path)
+            cache.record_hit(os.path.getsize(local_path))
 
-        with open(local_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
+        def miss(size: int, content_hash: str, remote: RemoteFile):
+            cached_path = cache.store(
+                cache_key,
+                part_path,
+                content_hash,
+                etag=remote.etag,
+                last_modified=remote.last_modified
+            )
+            cache.link(cached_path, local_path)
+            cache.record_miss(size)
+
+        # Only one process downloads a given URL at a time; anyone waiting
+        # on the lock usually finds a fresh cache entry once it gets it
+        async with _file_lock(part_path + ".lock"):
+            entry = await asyncio.to_thread(cache.lookup, cache_key)
+            if entry and cache.is_fresh(entry):
+                await asyncio.to_thread(hit, entry["path"])
+                return
+
+            headers = cache.conditional_headers(entry) if entry else {}
+            remote = await self._fetch(url, part_path, headers=headers, byte_limit=byte_limit)
+            if remote.not_modified:
+                await asyncio.to_thread(hit, entry["path"], revalidated=True)
+                return
+
+            size = os.path.getsize(part_path)
+            content_hash = await asyncio.to_thread(hash_file, part_path)
+            await asyncio.to_thread(miss, size, content_hash, remote)
+
+    async def _fetch(
+        self,
+        url: str,
+        part_path: str,
+        headers: Optional[dict] = None,
+        byte_limit: Optional[int] = None
+    ) -> RemoteFile:
+        """
+        Download url into part_path, resuming whatever an earlier attempt
+        left there. Large files on servers that accept byte ranges are
+        fetched as parallel segments.
+        A conditional request answered with 304 returns without downloading.
+        """
+        remote = await _retry(lambda: self._probe(url, headers))
+        if remote.not_modified:
+            return remote
+        remote.limit(byte_limit)
+
+        if (
+            remote.accept_ranges
+            and remote.size
+            and remote.size >= settings.DOWNLOAD_SEGMENT_MIN_SIZE
+            and settings.DOWNLOAD_SEGMENTS > 1
+        ):
+            try:
+                await self._download_segments(url, part_path, remote)
+                return remote
+            except RangeNotHonored:
+                # The server stopped honoring ranges or the file changed
+                # under us: start over with a plain download
+                _discard(part_path)
+
+        await _retry(lambda: self._download_stream(url, part_path, remote))
+        return remote
+
+    async def _probe(self, url: str, headers: Optional[dict] = None) -> RemoteFile:
+        """Learn size, range support and validators with a HEAD request"""
+        response = await self._client.head(url, headers=headers)
+        if response.status_code in RETRY_STATUSES:
+            raise RetryableDownloadError(f"HEAD {url} returned {response.status_code}")
+        if response.status_code >= 400:
+            # Some servers reject HEAD; the GET will surface real errors
+            return RemoteFile()
+        return RemoteFile.from_response(response)
+
+    async def _download_stream(self, url: str, part_path: str, remote: RemoteFile):
+        """Download url over a single connection, appending to part_path"""
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset and not (remote.accept_ranges and remote.validator):
+            offset = 0
+        if remote.size is not None and offset > remote.size:
+            # Left by a longer download, e.g. of the whole file
+            offset = 0
+        if remote.size is not None and offset == remote.size:
+            return
+
+        headers = {}
+        if offset or remote.limited:
+            end = remote.size - 1 if remote.limited else ""
+            headers["Range"] = f"bytes={offset}-{end}"
+            if remote.validator:
+                headers["If-Range"] = remote.validator
+
+        async with self._client.stream("GET", url, headers=headers) as response:
+            _check_status(response)
+            # Anything but 206 means the server sent the whole file again. A
+            # part file not being resumed is stale, even if this is a 206
+            # for a prefix
+            mode = 'ab' if offset and response.status_code == 206 else 'wb'
+            content_length = response.headers.get("Content-Length")
+            chunk_size = _chunk_size(int(content_length) if content_length else None)
+
+            # Read chunks as they arrive and batch them in the write buffer, so
+            # a dropped connection still leaves every received byte on disk
+            with open(part_path, mode, buffering=chunk_size) as f:
+                async for chunk in response.aiter_bytes():
                     f.write(chunk)
 
-        return local_path
+        expected_size = remote.size
+        if remote.limited and response.status_code != 206:
+            # The server sent the whole file instead of the prefix
+            expected_size = None
+        if expected_size is not None and os.path.getsize(part_path) != expected_size:
+            raise RetryableDownloadError(f"Incomplete download of {url}")
+
+    async def _download_segments(self, url: str, part_path: str, remote: RemoteFile):
+        """
+        Download url as parallel byte ranges written into a preallocated
+        part_path. Per-segment progress is kept in a sidecar file so an
+        interrupted download resumes each segment where it stopped.
+        """
+        state_path = part_path + ".json"
+        state = _load_state(state_path)
+        if (
+            not state
+            or state["size"] != remote.size
+            or state["validator"] != remote.validator
+            or not os.path.exists(part_path)
+        ):
+            segment_size = -(-remote.size // settings.DOWNLOAD_SEGMENTS)
+            state = {
+                "size": remote.size,
+                "validator": remote.validator,
+                "segments": [
+                    {"start": start, "end": min(start + segment_size, remote.size) - 1, "done": 0}
+                    for start in range(0, remote.size, segment_size)
+                ]
+            }
+            with open(part_path, 'wb') as f:
+                f.truncate(remote.size)
+            _save_state(state_path, state)
+
+        async def fetch_segment(segment: dict):
+            start = segment["start"] + segment["done"]
+            if start > segment["end"]:
+                return
+
+            headers = {"Range": f"bytes={start}-{segment['end']}"}
+            if remote.validator:
+                headers["If-Range"] = remote.validator
+
+            async with self._client.stream("GET", url, headers=headers) as response:
+                _check_status(response)
+                if response.status_code != 206:
+                    raise RangeNotHonored(f"Range request for {url} returned {response.status_code}")
+
+                chunk_size = _chunk_size(segment["end"] - start + 1)
+                unsaved = 0
+                with open(part_path, 'r+b', buffering=chunk_size) as f:
+                    f.seek(start)
+                    try:
+                        async for chunk in response.aiter_bytes():
+                            f.write(chunk)
+                            unsaved += len(chunk)
+                            if unsaved >= chunk_size:
+                                # Only record progress that is actually on disk
+                                f.flush()
+                                segment["done"] += unsaved
+                                unsaved = 0
+                                _save_state(state_path, state)
+                    finally:
+                        f.flush()
+                        segment["done"] += unsaved
+                        _save_state(state_path, state)
+
+            if segment["start"] + segment["done"] <= segment["end"]:
+                raise RetryableDownloadError(f"Incomplete segment of {url}")
+
+        await asyncio.gather(*(
+            _retry(lambda segment=segment: fetch_segment(segment))
+            for segment in state["segments"]
+        ))
+        os.remove(state_path)
+
+    async def download_files(
+        self,
+        urls: List[str],
+        task_id: str,
+        byte_limits: Optional[List[Optional[int]]] = None
+    ) -> List[Optional[str]]:
+        """
+        Download all URLs in parallel into the task directory.
+        byte_limits optionally caps each download to a leading byte range.
+        Results keep the order of urls; failed downloads are None.
+        """
+        self._bind()
+        task_semaphore = asyncio.Semaphore(self.task_concurrency)
+        byte_limits = byte_limits or [None] * len(urls)
+
+        async def fetch(index: int, url: str) -> Optional[str]:
+            async with task_semaphore:
+                return await self.download(url, task_file_path(task_id, index, url), byte_limits[index])
+
+        return await asyncio.gather(*(fetch(i, url) for i, url in enumerate(urls)))
+
+    async def fetch_movie_index(self, url: str) -> Optional[MovieIndex]:
+        """
+        Read the MP4 index of a remote file with a few small range requests.
+        Returns None if the server does not support ranges or the file is
+        not a readable MP4.
+        """
+        self._bind()
+        try:
+            async with self._semaphore:
+                remote = await _retry(lambda: self._probe(url))
+                if not (remote.accept_ranges and remote.size):
+                    return None
+
+                async def read_range(start: int, end: int) -> bytes:
+                    async def get() -> bytes:
+                        response = await self._client.get(url, headers={"Range": f"bytes={start}-{end}"})
+                        _check_status(response)
+                        if response.status_code != 206:
+                            raise RangeNotHonored(f"Range request for {url} returned {response.status_code}")
+                        return response.content
+                    return await _retry(get)
+
+                return await read_movie_index(read_range, remote.size)
+
+        except Exception as e:
+            print(f"Error reading media index from {url}: {str(e)}")
+            return None
+
+    async def aclose(self):
+        """Close the pooled HTTP client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+downloader = AsyncDownloader()
 
-    except Exception as e:
-        print(f"Error downloading file from {url}: {str(e)}")
-        return None 
\ No newline at end of file
+async def download_files(
+    urls: List[str],
+    task_id: str,
+    byte_limits: Optional[List[Optional[int]]] = None
+) -> List[Optional[str]]:
+    """Download URLs concurrently with the shared downloader, keeping input order"""
+    return await downloader.download_files(urls, task_id, byte_limits)
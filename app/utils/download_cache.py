@@ -0,0 +1,256 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+from app.core.config import settings
+
+class CacheIndex:
+    """
+    LRU index of files stored under a cache directory.
+    The index lives in a SQLite file next to the cached files so every
+    process on the node (API and workers) shares the same view, and the
+    stored files are evicted oldest-access-first once max_bytes is exceeded.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self.db_path = os.path.join(root, "index.sqlite3")
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, "
+                "last_access REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def connect(self):
+        """
+        Open a short-lived connection to the index.
+        One connection per operation keeps this safe to use from threads and
+        processes alike.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached path for key and mark it as recently used"""
+        with self.connect() as conn:
+            row = conn.execute("SELECT path FROM entries WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            if not os.path.exists(row[0]):
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key: str, path: str):
+        """Register a file stored under the cache root and evict if over budget"""
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, path, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, path, os.path.getsize(path), time.time())
+            )
+        self.evict(keep=key)
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Remove least recently used files until the cache fits max_bytes.
+        The entry named by keep is never evicted so a caller can still use
+        the file it just stored.
+        """
+        evicted = 0
+        with self.connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            rows = conn.execute("SELECT key, path, size FROM entries ORDER BY last_access").fetchall()
+            for key, path, size in rows:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted += 1
+        if evicted:
+            self.incr("evictions", evicted)
+        return evicted
+
+    def incr(self, name: str, value: float = 1):
+        """Increment a persistent counter"""
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO stats (name, value) VALUES (?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                (name, value)
+            )
+
+    def stats(self) -> Dict[str, float]:
+        """Return all counters plus the current cache size"""
+        with self.connect() as conn:
+            stats = {name: value for name, value in conn.execute("SELECT name, value FROM stats")}
+            stats["bytes_stored"] = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()[0]
+        return stats
+
+class DownloadCache:
+    """
+    Content-addressed cache for downloaded media shared across tasks.
+
+    Files are stored once per content hash. Each URL remembers the hash it
+    resolved to together with its ETag/Last-Modified validators, so a later
+    request can be answered locally or revalidated with a conditional GET.
+    """
+
+    def __init__(self, root: str, max_bytes: int, fresh_seconds: int = 0):
+        self.root = root
+        self.fresh_seconds = fresh_seconds
+        self.index = CacheIndex(root, max_bytes)
+        with self.index.connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS urls ("
+                "url TEXT PRIMARY KEY, content_hash TEXT NOT NULL, etag TEXT, "
+                "last_modified TEXT, validated_at REAL NOT NULL)"
+            )
+
+    def blob_path(self, content_hash: str) -> str:
+        """Location of a cached file by content hash"""
+        return os.path.join(self.root, "objects", content_hash[:2], content_hash)
+
+    def lookup(self, url: str) -> Optional[dict]:
+        """Return the cache record for url if its file is still present"""
+        with self.index.connect() as conn:
+            row = conn.execute(
+                "SELECT content_hash, etag, last_modified, validated_at FROM urls WHERE url = ?",
+                (url,)
+            ).fetchone()
+        if not row:
+            return None
+        content_hash, etag, last_modified, validated_at = row
+        path = self.index.get(content_hash)
+        if not path:
+            return None
+        return {
+            "content_hash": content_hash,
+            "etag": etag,
+            "last_modified": last_modified,
+            "validated_at": validated_at,
+            "path": path
+        }
+
+    def is_fresh(self, entry: dict) -> bool:
+        """Whether an entry was validated recently enough to skip the origin"""
+        return time.time() - entry["validated_at"] < self.fresh_seconds
+
+    def conditional_headers(self, entry: dict) -> Dict[str, str]:
+        """Headers for revalidating an entry with the origin"""
+        headers = {}
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def mark_validated(self, url: str):
+        """Record a successful revalidation (304) for url"""
+        with self.index.connect() as conn:
+            conn.execute("UPDATE urls SET validated_at = ? WHERE url = ?", (time.time(), url))
+
+    def part_path(self, url: str) -> str:
+        """
+        Where an in-flight download of url is written.
+        The name is stable per URL so an interrupted download can resume.
+        """
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        return os.path.join(tmp_dir, hashlib.sha256(url.encode()).hexdigest() + ".part")
+
+    def store(
+        self,
+        url: str,
+        temp_path: str,
+        content_hash: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ) -> str:
+        """Move a finished download into the cache and record it for url"""
+        path = self.blob_path(content_hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            # Same bytes already cached under another URL
+            os.remove(temp_path)
+        else:
+            os.replace(temp_path, path)
+
+        with self.index.connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO urls (url, content_hash, etag, last_modified, validated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (url, content_hash, etag, last_modified, time.time())
+            )
+        self.index.put(content_hash, path)
+        return path
+
+    def link(self, cached_path: str, local_path: str):
+        """Hard-link a cached file into a task directory, copying across devices"""
+        if os.path.exists(local_path):
+            os.remove(local_path)
+        try:
+            os.link(cached_path, local_path)
+        except OSError:
+            shutil.copyfile(cached_path, local_path)
+
+    def record_hit(self, size: int):
+        self.index.incr("hits")
+        self.index.incr("bytes_saved", size)
+
+    def record_miss(self, size: int):
+        self.index.incr("misses")
+        self.index.incr("bytes_downloaded", size)
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss/bytes-saved counters for the cache"""
+        stats = {"hits": 0, "misses": 0, "revalidations": 0, "bytes_saved": 0, "bytes_downloaded": 0, "evictions": 0}
+        stats.update(self.index.stats())
+        return stats
+
+def hash_file(path: str) -> str:
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+_cache: Optional[DownloadCache] = None
+
+def get_download_cache() -> Optional[DownloadCache]:
+    """Return the process-wide download cache, or None when disabled"""
+    global _cache
+    if not settings.DOWNLOAD_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = DownloadCache(
+            settings.DOWNLOAD_CACHE_DIR or os.path.join(settings.STORAGE_DIR, "cache"),
+            settings.DOWNLOAD_CACHE_MAX_BYTES,
+            settings.DOWNLOAD_CACHE_FRESH_SECONDS
+        )
+    return _cache
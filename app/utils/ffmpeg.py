@@ -0,0 +1,247 @@
+import json
+import os
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fractions import Fraction
+from typing import Callable, Iterable, List, Optional, Tuple
+from app.core.config import settings
+
+class FFmpegError(Exception):
+    """An ffmpeg or ffprobe invocation failed"""
+
+class RenderCancelled(Exception):
+    """The render was told to stop; its ffmpeg and ffprobe runs were killed"""
+
+# Set while a render that can be told to stop runs. Context variables
+# follow asyncio tasks and asyncio.to_thread, so every ffmpeg started on
+# the render's behalf sees the render's event
+_stop_event: ContextVar[Optional[threading.Event]] = ContextVar("ffmpeg_stop_event", default=None)
+
+@contextmanager
+def stop_on(event: threading.Event):
+    """Kill every ffmpeg and ffprobe run started in this context once event is set"""
+    token = _stop_event.set(event)
+    try:
+        yield
+    finally:
+        _stop_event.reset(token)
+
+def check_stopped():
+    """Raise RenderCancelled if the render running in this context was told to stop"""
+    stop = _stop_event.get()
+    if stop is not None and stop.is_set():
+        raise RenderCancelled("Render stopped")
+
+class MediaInfo:
+    """Stream parameters of a media file as reported by ffprobe"""
+
+    def __init__(
+        self,
+        duration: float,
+        width: Optional[int] = None,
+        height: Optional[int] = None,
+        fps: Optional[str] = None,
+        codec: Optional[str] = None,
+        profile: Optional[str] = None,
+        pix_fmt: Optional[str] = None,
+        time_base: Optional[str] = None,
+        audio_codec: Optional[str] = None,
+        rotation: int = 0,
+        keyframes: Optional[List[float]] = None,
+        content_hash: Optional[str] = None
+    ):
+        self.duration = duration
+        self.width = width
+        self.height = height
+        self.fps = fps  # As a rational string, e.g. "30000/1001"
+        self.codec = codec
+        self.profile = profile
+        self.pix_fmt = pix_fmt
+        self.time_base = time_base
+        self.audio_codec = audio_codec
+        self.rotation = rotation  # Degrees the coded frames are turned clockwise for display
+        self.keyframes = keyframes  # Keyframe times, when they were scanned
+        self.content_hash = content_hash  # Key of the media_metadata row it was looked up by
+
+    @classmethod
+    def from_ffprobe(cls, data: dict) -> "MediaInfo":
+        streams = data.get("streams", [])
+        video = next((s for s in streams if s.get("codec_type") == "video"), {})
+        audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+        duration = data.get("format", {}).get("duration") or video.get("duration") or audio.get("duration") or 0
+        # Older ffprobe reports a clockwise "rotate" tag, newer versions the
+        # display matrix, which turns counter-clockwise
+        rotation = video.get("tags", {}).get("rotate", 0)
+        for side_data in video.get("side_data_list", []):
+            if "rotation" in side_data:
+                rotation = -float(side_data["rotation"])
+        return cls(
+            duration=float(duration),
+            width=video.get("width"),
+            height=video.get("height"),
+            fps=video.get("r_frame_rate"),
+            codec=video.get("codec_name"),
+            profile=video.get("profile"),
+            pix_fmt=video.get("pix_fmt"),
+            time_base=video.get("time_base"),
+            audio_codec=audio.get("codec_name"),
+            rotation=int(float(rotation)) % 360
+        )
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Display size: ffmpeg and moviepy hand out frames already rotated"""
+        if self.rotation in (90, 270):
+            return (self.height, self.width)
+        return (self.width, self.height)
+
+    @property
+    def frame_duration(self) -> float:
+        """Seconds per frame, or 0 if the frame rate is unknown"""
+        try:
+            rate = Fraction(self.fps)
+        except (TypeError, ValueError, ZeroDivisionError):
+            return 0.0
+        return float(1 / rate) if rate else 0.0
+
+    @property
+    def keyframe_interval(self) -> Optional[float]:
+        """Average seconds between keyframes, None if they were not scanned"""
+        if not self.keyframes:
+            return None
+        return self.duration / len(self.keyframes)
+
+    def stream_signature(self) -> tuple:
+        """Parameters that must match for streams to be concatenated without re-encoding"""
+        return (self.codec, self.profile, self.width, self.height, self.fps, self.time_base, self.pix_fmt, self.rotation)
+
+def run_ffmpeg(
+    args: List[str],
+    duration: Optional[float] = None,
+    on_progress: Optional[Callable[[float], None]] = None
+) -> str:
+    """
+    Run ffmpeg with args, returning stderr and raising FFmpegError on failure.
+    With on_progress, ffmpeg's progress output is followed and reported as
+    the fraction of duration (seconds of output) written so far.
+    """
+    command = [settings.FFMPEG_BINARY, "-hide_banner", "-nostdin", "-y", *args]
+    if not (on_progress and duration):
+        return _run(command).stderr
+
+    command[1:1] = ["-progress", "pipe:1", "-nostats"]
+    check_stopped()
+    # stderr goes to a file so a chatty encoder cannot fill the pipe while
+    # stdout is being read
+    with tempfile.TemporaryFile(mode="w+") as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr, text=True)
+        _kill_on_stop(process)
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            if key == "out_time_us" and value.isdigit():
+                on_progress(min(int(value) / 1_000_000 / duration, 1.0))
+        returncode = process.wait()
+        stderr.seek(0)
+        output = stderr.read()
+    _check_returncode(command, returncode, output)
+    return output
+
+def pipe_to_ffmpeg(args: List[str], chunks: Iterable[bytes]) -> str:
+    """Run ffmpeg with args, feeding chunks to its stdin (read as "pipe:0")"""
+    command = [settings.FFMPEG_BINARY, "-hide_banner", "-y", *args]
+    check_stopped()
+    with tempfile.TemporaryFile(mode="w+") as stderr:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr)
+        _kill_on_stop(process)
+        try:
+            for chunk in chunks:
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            # ffmpeg exited early, its error output says why
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+        returncode = process.wait()
+        stderr.seek(0)
+        output = stderr.read()
+    _check_returncode(command, returncode, output)
+    return output
+
+def _run(command: List[str]) -> subprocess.CompletedProcess:
+    check_stopped()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    _kill_on_stop(process)
+    stdout, stderr = process.communicate()
+    _check_returncode(command, process.returncode, stderr)
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
+
+def _kill_on_stop(process: subprocess.Popen):
+    """Watch the render's stop event, if any, killing process once it is set"""
+    stop = _stop_event.get()
+    if stop is None:
+        return
+
+    def watch():
+        # Ends with the process, whether it exits or is killed
+        while process.poll() is None:
+            if stop.wait(0.2):
+                process.kill()
+                return
+
+    threading.Thread(target=watch, daemon=True).start()
+
+def _check_returncode(command: List[str], returncode: int, stderr: str):
+    if returncode != 0:
+        # A process killed because the render stopped did not fail
+        check_stopped()
+        raise FFmpegError(f"{command[0]} failed: {_tail(stderr)}")
+
+def _tail(stderr: str) -> str:
+    # The last lines of ffmpeg's output hold the actual error
+    return "\n".join(stderr.strip().splitlines()[-5:])
+
+def probe(path: str) -> MediaInfo:
+    """Read container and stream parameters without decoding any frames"""
+    output = _run([
+        settings.FFPROBE_BINARY, "-v", "error",
+        "-show_format", "-show_streams",
+        "-of", "json", path
+    ]).stdout
+    return MediaInfo.from_ffprobe(json.loads(output))
+
+def keyframe_times(path: str) -> List[float]:
+    """Presentation times of the video keyframes, read from packet flags"""
+    output = _run([
+        settings.FFPROBE_BINARY, "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0", path
+    ]).stdout
+    times = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            times.append(float(pts_time))
+    return sorted(times)
+
+def write_concat_list(path: str, entries: List[Tuple[str, Optional[float], Optional[float]]]):
+    """
+    Write an ffmpeg concat demuxer list.
+    Each entry is (file, inpoint, outpoint); None leaves that end untouched.
+    Files are written as absolute paths since the demuxer resolves relative
+    ones against the list's own directory.
+    """
+    with open(path, 'w') as f:
+        for file_path, inpoint, outpoint in entries:
+            escaped = os.path.abspath(file_path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+            if inpoint is not None:
+                f.write(f"inpoint {inpoint:.6f}\n")
+            if outpoint is not None:
+                f.write(f"outpoint {outpoint:.6f}\n")
@@ -0,0 +1,222 @@
+import struct
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+# How much of the file to read per request while looking for the moov box
+HEAD_READ_SIZE = 64 * 1024
+
+def iter_boxes(data: bytes, offset: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int, int]]:
+    """
+    Iterate ISO-BMFF boxes in data[offset:end].
+    Yields (type, box_start, payload_start, box_end) with absolute offsets
+    into data; a box running past the end of data is yielded as-is.
+    """
+    end = len(data) if end is None else end
+    while offset + 8 <= end:
+        size, box_type = struct.unpack(">I4s", data[offset:offset + 8])
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack(">Q", data[offset + 8:offset + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield box_type, offset, offset + header, offset + size
+        offset += size
+
+def _children(data: bytes, payload_start: int, box_end: int) -> Dict[bytes, List[Tuple[int, int]]]:
+    """Map child box type to (payload_start, box_end) pairs"""
+    children: Dict[bytes, List[Tuple[int, int]]] = {}
+    for box_type, _, child_payload, child_end in iter_boxes(data, payload_start, box_end):
+        children.setdefault(box_type, []).append((child_payload, child_end))
+    return children
+
+class TrackIndex:
+    """Sample tables of a single track, enough to map time to byte offsets"""
+
+    def __init__(
+        self,
+        handler: bytes,
+        timescale: int,
+        time_to_sample: List[Tuple[int, int]],
+        sample_to_chunk: List[Tuple[int, int]],
+        sample_sizes: List[int],
+        chunk_offsets: List[int]
+    ):
+        self.handler = handler
+        self.timescale = timescale
+        self.time_to_sample = time_to_sample  # (sample_count, sample_delta)
+        self.sample_to_chunk = sample_to_chunk  # (first_chunk, samples_per_chunk), 1-based chunks
+        self.sample_sizes = sample_sizes
+        self.chunk_offsets = chunk_offsets
+
+    def samples_before(self, seconds: float) -> int:
+        """Number of samples whose decode time is before seconds"""
+        limit = seconds * self.timescale
+        elapsed = 0
+        samples = 0
+        for count, delta in self.time_to_sample:
+            if delta == 0 or elapsed + count * delta <= limit:
+                elapsed += count * delta
+                samples += count
+                continue
+            return samples + max(0, int(-(-(limit - elapsed) // delta)))
+        return samples
+
+    def byte_end(self, sample_count: int) -> int:
+        """Absolute file offset just past the first sample_count samples"""
+        if sample_count <= 0 or not self.chunk_offsets:
+            return 0
+        target = min(sample_count, len(self.sample_sizes)) - 1
+
+        sample = 0
+        for i, (first_chunk, per_chunk) in enumerate(self.sample_to_chunk):
+            last_chunk = (
+                self.sample_to_chunk[i + 1][0] - 1
+                if i + 1 < len(self.sample_to_chunk)
+                else len(self.chunk_offsets)
+            )
+            run = (last_chunk - first_chunk + 1) * per_chunk
+            if target < sample + run:
+                chunk = first_chunk + (target - sample) // per_chunk
+                chunk_first_sample = sample + (chunk - first_chunk) * per_chunk
+                return self.chunk_offsets[chunk - 1] + sum(self.sample_sizes[chunk_first_sample:target + 1])
+            sample += run
+        return self.chunk_offsets[-1]
+
+class MovieIndex:
+    """What the moov box says about a file, without touching media data"""
+
+    def __init__(self, duration: float, tracks: List[TrackIndex], faststart: bool, size: int):
+        self.duration = duration
+        self.tracks = tracks
+        self.faststart = faststart  # moov precedes mdat
+        self.size = size
+
+    def prefix_size(self, seconds: float) -> Optional[int]:
+        """
+        Bytes from the start of the file that hold every sample decoded in
+        the first seconds of every track, or None if a prefix is not a
+        playable file (moov after mdat).
+        """
+        if not self.faststart:
+            return None
+        end = 0
+        for track in self.tracks:
+            end = max(end, track.byte_end(track.samples_before(seconds)))
+        return min(end, self.size) if end else None
+
+def parse_moov(data: bytes, payload_start: int, box_end: int) -> Tuple[float, List[TrackIndex]]:
+    """Parse the moov payload into the movie duration and per-track sample tables"""
+    moov = _children(data, payload_start, box_end)
+    duration = 0.0
+    if b"mvhd" in moov:
+        start, _ = moov[b"mvhd"][0]
+        duration = _parse_header_duration(data, start)
+
+    tracks = []
+    for trak_start, trak_end in moov.get(b"trak", []):
+        track = _parse_trak(data, trak_start, trak_end)
+        if track:
+            tracks.append(track)
+    return duration, tracks
+
+def _parse_header_duration(data: bytes, start: int) -> float:
+    """Duration in seconds from an mvhd box payload"""
+    version = data[start]
+    if version == 1:
+        timescale, duration = struct.unpack(">IQ", data[start + 20:start + 32])
+    else:
+        timescale, duration = struct.unpack(">II", data[start + 12:start + 20])
+    return duration / timescale if timescale else 0.0
+
+def _parse_trak(data: bytes, start: int, end: int) -> Optional[TrackIndex]:
+    mdia_boxes = _children(data, start, end).get(b"mdia")
+    if not mdia_boxes:
+        return None
+    mdia = _children(data, *mdia_boxes[0])
+    if b"mdhd" not in mdia or b"minf" not in mdia or b"hdlr" not in mdia:
+        return None
+
+    mdhd, _ = mdia[b"mdhd"][0]
+    timescale_offset = mdhd + (20 if data[mdhd] == 1 else 12)
+    timescale = struct.unpack(">I", data[timescale_offset:timescale_offset + 4])[0]
+
+    hdlr, _ = mdia[b"hdlr"][0]
+    handler = data[hdlr + 8:hdlr + 12]
+
+    stbl_boxes = _children(data, *mdia[b"minf"][0]).get(b"stbl")
+    if not stbl_boxes:
+        return None
+    stbl = _children(data, *stbl_boxes[0])
+
+    def entries(box: bytes, fmt: str, first: int = 8) -> List[tuple]:
+        if box not in stbl:
+            return []
+        payload, _ = stbl[box][0]
+        count = struct.unpack(">I", data[payload + 4:payload + 8])[0]
+        width = struct.calcsize(fmt)
+        base = payload + first
+        return [struct.unpack(fmt, data[base + i * width:base + (i + 1) * width]) for i in range(count)]
+
+    time_to_sample = entries(b"stts", ">II")
+    sample_to_chunk = [(first, per_chunk) for first, per_chunk, _ in entries(b"stsc", ">III")]
+
+    sample_sizes: List[int] = []
+    if b"stsz" in stbl:
+        payload, _ = stbl[b"stsz"][0]
+        uniform, count = struct.unpack(">II", data[payload + 4:payload + 12])
+        if uniform:
+            sample_sizes = [uniform] * count
+        else:
+            sample_sizes = list(struct.unpack(f">{count}I", data[payload + 12:payload + 12 + 4 * count]))
+
+    if b"co64" in stbl:
+        chunk_offsets = [offset for (offset,) in entries(b"co64", ">Q")]
+    else:
+        chunk_offsets = [offset for (offset,) in entries(b"stco", ">I")]
+
+    if not (timescale and time_to_sample and sample_to_chunk and sample_sizes and chunk_offsets):
+        return None
+    return TrackIndex(handler, timescale, time_to_sample, sample_to_chunk, sample_sizes, chunk_offsets)
+
+async def read_movie_index(
+    read_range: Callable[[int, int], Awaitable[bytes]],
+    size: int
+) -> Optional[MovieIndex]:
+    """
+    Locate and parse the moov box of a remote MP4 using byte-range reads.
+    read_range(start, end) must return bytes start..end inclusive.
+    Returns None if the file is not an MP4 or has no readable moov.
+    """
+    offset = 0
+    seen_mdat = False
+    while offset + 8 <= size:
+        head = await read_range(offset, min(offset + HEAD_READ_SIZE, size) - 1)
+        boxes = list(iter_boxes(head))
+        if not boxes:
+            return None
+
+        for box_type, box_start, payload_start, box_end in boxes:
+            if box_type == b"moov":
+                if box_end > len(head):
+                    # moov continues past this read, fetch it whole
+                    head = await read_range(offset + box_start, offset + box_end - 1)
+                    payload_start -= box_start
+                    box_end -= box_start
+                duration, tracks = parse_moov(head, payload_start, box_end)
+                return MovieIndex(duration, tracks, faststart=not seen_mdat, size=size)
+            if box_type == b"mdat":
+                if struct.unpack(">I", head[box_start:box_start + 4])[0] == 0:
+                    # mdat runs to the end of the file, there is no moov after it
+                    return None
+                seen_mdat = True
+            if box_end > len(head):
+                # Skip over a box (usually mdat) that extends past this read
+                offset += box_end
+                break
+        else:
+            offset += boxes[-1][3]
+    return None
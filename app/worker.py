@@ -0,0 +1,25 @@
+"""
+Render worker entry point, run next to the API:
+
+    python -m app.worker
+
+Renders tasks the API has recorded, in a process of its own.
+"""
+import asyncio
+import signal
+from app.db.base import Base, engine
+from app.services.worker import RenderWorker
+
+async def main():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    worker = RenderWorker()
+    print(f"Render worker started, {worker.concurrency} tasks at a time")
+    await worker.run(stop)
+
+if __name__ == "__main__":
+    Base.metadata.create_all(bind=engine)
+    asyncio.run(main())
@@ -0,0 +1,173 @@
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.api import deps
+from app.core.config import settings
+from app.db import session as db_session
+from app.db.base import Base
+from app.main import app
+from app.models.media_metadata import MediaMetadata
+from app.models.render_job import RenderJob
+from app.models.user import User
+from app.models.video_task import VideoTask
+from app.services.admission import AdmissionControl, estimate_cost
+from app.services.job_queue import JobQueue
+from app.services.scheduler import STANDARD_LANE
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A SQLite session with two users, and admission sized for round numbers"""
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMISSION_MIN_THROUGHPUT", 1.0)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_BACKLOG_SECONDS", 100)
+    monkeypatch.setattr(settings, "ADMISSION_THROUGHPUT_WINDOW_SECONDS", 10)
+    engine = create_engine(f"sqlite:///{tmp_path / 'admission.db'}")
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    session.add(User(id="bulk", email="bulk@example.com", api_key="bulk", monthly_quota=100))
+    session.add(User(id="light", email="light@example.com", api_key="light", monthly_quota=100))
+    session.commit()
+    yield session
+    session.close()
+
+@pytest.fixture
+def client(db, monkeypatch):
+    """A client whose requests, /metrics included, all use the test database"""
+    session_factory = sessionmaker(bind=db.get_bind())
+
+    def get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[deps.get_db] = get_db
+    app.dependency_overrides[db_session.get_db] = get_db
+    monkeypatch.setattr("app.main.SessionLocal", session_factory)
+    monkeypatch.setattr("app.main.JobQueue", lambda: JobQueue(session_factory))
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+def _queue(db, user_id, cost, state="queued", progress=0.0, finished_at=None):
+    task = VideoTask(
+        id=f"{user_id}-{len(db.query(VideoTask).all())}", user_id=user_id, status="pending",
+        background_url="https://example.com/a.mp3", media_list=[], progress=progress
+    )
+    db.add(task)
+    db.flush()
+    JobQueue.enqueue(db, task, cost)
+    db.flush()
+    job = db.get(RenderJob, task.id)
+    job.state = state
+    job.finished_at = finished_at
+    db.commit()
+
+def test_cost_uses_probed_metadata(db):
+    """Test known clips are costed at their size and length, unknown ones at the defaults"""
+    db.add(MediaMetadata(content_hash="a", url="https://example.com/a.mp4", duration=4.0, width=1280, height=720))
+    db.commit()
+
+    # 1280x720 for 4 s, plus a default 10 s clip at the same size
+    assert estimate_cost(db, ["https://example.com/a.mp4", "https://example.com/b.mp4"]) == pytest.approx(1280 * 720 * 14 / 1e6)
+    # 480p rendition adds its own pixels; 720p is the main output itself
+    assert estimate_cost(db, ["https://example.com/a.mp4"], 10, renditions=["480p", "720p"]) == pytest.approx((1280 * 720 + 854 * 480) * 10 / 1e6)
+    # Never-probed clips fall back to the default size
+    assert estimate_cost(db, ["https://example.com/c.mp4"], 10) == pytest.approx(1920 * 1080 * 10 / 1e6)
+
+def test_admits_until_backlog_passes_threshold(db):
+    """Test work is accepted while the fleet can finish it within the threshold"""
+    control = AdmissionControl(db)
+    # An empty queue accepts even a request larger than the threshold
+    control.admit(db.get(User, "light"), 500.0)
+
+    _queue(db, "bulk", 60.0)
+    _queue(db, "light", 40.0, state="leased", progress=0.5)
+    control.admit(db.get(User, "light"), 20.0)
+
+    with pytest.raises(HTTPException) as error:
+        control.admit(db.get(User, "light"), 30.0)
+    assert error.value.status_code == 503
+    # 80 outstanding plus 30 is 10 s of work past the threshold at 1 per second
+    assert error.value.headers["Retry-After"] == "10"
+
+def test_user_over_their_share_gets_429(db):
+    """Test the user filling the backlog is told to slow down rather than the service being unavailable"""
+    _queue(db, "bulk", 90.0)
+    _queue(db, "light", 5.0)
+
+    with pytest.raises(HTTPException) as error:
+        AdmissionControl(db).admit(db.get(User, "bulk"), 20.0)
+    assert error.value.status_code == 429
+    assert "Retry-After" in error.value.headers
+    # Someone with nothing queued is refused for the same request, but not blamed
+    with pytest.raises(HTTPException) as error:
+        AdmissionControl(db).admit(db.get(User, "light"), 20.0)
+    assert error.value.status_code == 503
+
+def test_throughput_follows_finished_jobs(db):
+    """Test fleet throughput is measured from recently finished jobs, never below the floor"""
+    control = AdmissionControl(db)
+    assert control.throughput() == 1.0
+
+    _queue(db, "bulk", 50.0, state="done", finished_at=datetime.utcnow())
+    _queue(db, "bulk", 500.0, state="done", finished_at=datetime.utcnow() - timedelta(minutes=5))
+    assert control.throughput() == pytest.approx(5.0)
+
+    # At five times the speed the same backlog fits
+    _queue(db, "light", 200.0)
+    control.admit(db.get(User, "light"), 100.0)
+    assert control.stats()["backlog_seconds"] == 40.0
+
+def _request(url="https://example.com/clip.mp4"):
+    # One never-probed 1080p clip for 10 s costs 20.736
+    return {"type": "LoopVideo", "data": {"background_url": "https://example.com/a.mp3", "media_list": [url], "duration": 10}}
+
+def test_loop_video_queues_a_task(client, db):
+    """Test /loop-video needs an API key and queues the task for the workers at its estimated cost"""
+    response = client.post(f"{settings.API_V1_STR}/video-generation/loop-video", json=_request())
+    assert response.status_code == 403
+
+    response = client.post(f"{settings.API_V1_STR}/video-generation/loop-video", json=_request(), headers={"X-API-Key": "light"})
+    assert response.status_code == 200
+    task_id = response.json()["data"]["id"]
+    task = db.get(VideoTask, task_id)
+    assert task.user_id == "light"
+    assert task.status == "pending"
+    job = db.get(RenderJob, task_id)
+    assert job.state == "queued"
+    assert job.cost == pytest.approx(20.736)
+
+def test_full_backlog_is_refused_over_http(client, db):
+    """Test both render endpoints answer a full backlog with 429 or 503 and Retry-After"""
+    _queue(db, "bulk", 90.0)
+    _queue(db, "light", 5.0)
+
+    for endpoint in ("generate", "loop-video"):
+        response = client.post(f"{settings.API_V1_STR}/video-generation/{endpoint}", json=_request(), headers={"X-API-Key": "bulk"})
+        assert response.status_code == 429
+        # 95 outstanding plus 20.736 is 15.736 s past the threshold at 1 per second
+        assert response.headers["Retry-After"] == "16"
+
+        response = client.post(f"{settings.API_V1_STR}/video-generation/{endpoint}", json=_request(), headers={"X-API-Key": "light"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "16"
+
+    # Nothing refused was queued
+    assert db.query(RenderJob).count() == 2
+
+def test_metrics_report_queue_and_admission(client, db):
+    """Test /metrics reports the render queue and the admission backlog"""
+    _queue(db, "bulk", 60.0)
+    _queue(db, "light", 40.0, state="leased")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    metrics = response.json()
+    assert metrics["render_queue"]["queued"] == {STANDARD_LANE: 1}
+    assert metrics["render_queue"]["running"] == {STANDARD_LANE: 1}
+    assert metrics["admission"]["backlog_cost"] == 100.0
+    assert metrics["admission"]["backlog_seconds"] == 100.0
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from app.utils import audio_cache
+from app.utils.audio_cache import AudioCache, PCMTrack
+
+def _write_pcm(path, samples):
+    np.asarray(samples, dtype=np.int16).tofile(path)
+
+def _fitted(track, duration):
+    return np.frombuffer(b"".join(track.iter_fitted(duration)), dtype=np.int16)
+
+def test_pcm_track_loops_and_trims(tmp_path):
+    """Test fitting slices the mapped buffer, wrapping around for loops"""
+    path = tmp_path / "track.s16le"
+    _write_pcm(path, range(10))
+    track = PCMTrack(str(path), sample_rate=10, channels=1)
+
+    assert track.duration == 1.0
+    assert list(_fitted(track, 0.4)) == [0, 1, 2, 3]
+    assert list(_fitted(track, 2.5)) == list(range(10)) * 2 + [0, 1, 2, 3, 4]
+
+def test_pcm_track_keeps_channels_interleaved(tmp_path):
+    """Test loops never split a stereo frame"""
+    path = tmp_path / "track.s16le"
+    _write_pcm(path, [1, -1, 2, -2, 3, -3])
+    track = PCMTrack(str(path), sample_rate=3, channels=2)
+
+    assert list(_fitted(track, 5 / 3)) == [1, -1, 2, -2, 3, -3, 1, -1, 2, -2]
+
+def test_empty_track_fills_with_silence(tmp_path):
+    """Test a track without samples still yields the requested length"""
+    path = tmp_path / "track.s16le"
+    path.write_bytes(b"")
+    track = PCMTrack(str(path), sample_rate=10, channels=2)
+
+    assert list(_fitted(track, 0.3)) == [0] * 6
+
+@pytest.fixture
+def fake_ffmpeg(monkeypatch):
+    """Decode to a fixed PCM buffer and "encode" by copying the fitted PCM"""
+    calls = {"decode": 0, "encode": 0}
+
+    def decode(args):
+        calls["decode"] += 1
+        _write_pcm(args[-1], range(8))
+
+    def encode(track, duration, output_path):
+        calls["encode"] += 1
+        with open(output_path, 'wb') as f:
+            f.write(b"".join(track.iter_fitted(duration)))
+
+    monkeypatch.setattr(audio_cache, "run_ffmpeg", decode)
+    monkeypatch.setattr(audio_cache, "encode_pcm", encode)
+    return calls
+
+def test_audio_cache_decodes_each_track_once(tmp_path, fake_ffmpeg):
+    """Test a track is decoded once and each (track, duration) encoded once"""
+    cache = AudioCache(str(tmp_path / "cache"), max_bytes=10 ** 6, sample_rate=4, channels=1)
+    track = tmp_path / "bg.mp3"
+    track.write_bytes(b"mp3 bytes")
+
+    cache.fitted_aac(str(track), 3.0, str(tmp_path / "a.m4a"))
+    cache.fitted_aac(str(track), 3.0, str(tmp_path / "b.m4a"))
+    cache.fitted_aac(str(track), 1.0, str(tmp_path / "c.m4a"))
+
+    assert fake_ffmpeg == {"decode": 1, "encode": 2}
+    assert (tmp_path / "a.m4a").read_bytes() == (tmp_path / "b.m4a").read_bytes()
+    assert len((tmp_path / "a.m4a").read_bytes()) == 3 * 4 * 2
+    stats = cache.stats()
+    assert (stats["pcm_misses"], stats["pcm_hits"]) == (1, 1)
+    assert (stats["aac_misses"], stats["aac_hits"]) == (2, 1)
+
+def test_audio_cache_evicts_least_recently_used(tmp_path, fake_ffmpeg):
+    """Test fitted encodes share the LRU budget with decoded tracks"""
+    cache = AudioCache(str(tmp_path / "cache"), max_bytes=64, sample_rate=4, channels=1)
+    track = tmp_path / "bg.mp3"
+    track.write_bytes(b"mp3 bytes")
+
+    for seconds in (2.0, 3.0, 4.0):
+        cache.fitted_aac(str(track), seconds, str(tmp_path / f"{seconds}.m4a"))
+
+    assert cache.stats()["bytes_stored"] <= 64
+    assert cache.stats()["evictions"] >= 1
+    # Files handed to tasks survive eviction of their cache entries
+    assert (tmp_path / "2.0.m4a").exists()
@@ -0,0 +1,67 @@
+import threading
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.db.base import Base
+from app.models.user import User
+from app.models.video_task import VideoTask
+from app.services.checkpoints import TaskCheckpoints
+
+@pytest.fixture
+def task_session(tmp_path):
+    """A SQLite session holding one task"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'tasks.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.add(User(id="user", email="user@example.com", api_key="key"))
+    db.add(VideoTask(
+        id="task", user_id="user", status="processing",
+        background_url="https://example.com/a.mp3", media_list=[]
+    ))
+    db.commit()
+    yield db
+    db.close()
+
+def test_checkpoints_are_stored_on_the_task(task_session, tmp_path):
+    """Test recorded stages survive into a fresh session, as a retry would see them"""
+    checkpoints = TaskCheckpoints(task_session, task_session.get(VideoTask, "task"))
+
+    checkpoints.record("metadata", {"fps": "30", "pix_fmt": "yuv420p"})
+    checkpoints.append("downloads", str(tmp_path / "a.mp4"))
+    checkpoints.append("downloads", str(tmp_path / "b.mp4"))
+    task_session.expire_all()
+
+    resumed = TaskCheckpoints(task_session, task_session.get(VideoTask, "task"))
+    assert resumed.get("metadata")["fps"] == "30"
+    assert resumed.get("downloads") == [str(tmp_path / "a.mp4"), str(tmp_path / "b.mp4")]
+    assert resumed.get("encoded") is None
+
+def test_complete_needs_every_recorded_file(task_session, tmp_path):
+    """Test a stage only counts as complete while all of its files exist"""
+    video, rendition = tmp_path / "video.mp4", tmp_path / "video_480p.mp4"
+    video.write_bytes(b"")
+    rendition.write_bytes(b"")
+    checkpoints = TaskCheckpoints(task_session, task_session.get(VideoTask, "task"))
+    paths = [str(video), str(rendition)]
+
+    assert not checkpoints.complete("encoded", paths)
+    checkpoints.record("encoded", paths)
+    assert checkpoints.complete("encoded", paths)
+    # A different set of outputs was requested
+    assert not checkpoints.complete("encoded", paths[:1])
+    rendition.unlink()
+    assert not checkpoints.complete("encoded", paths)
+
+def test_writes_wait_for_the_shared_lock(task_session, tmp_path):
+    """Test a checkpoint is not committed while another writer of the session holds its lock"""
+    lock = threading.Lock()
+    checkpoints = TaskCheckpoints(task_session, task_session.get(VideoTask, "task"), lock)
+
+    with lock:
+        writer = threading.Thread(target=checkpoints.append, args=("downloads", str(tmp_path / "a.mp4")))
+        writer.start()
+        writer.join(0.2)
+        assert writer.is_alive()
+        assert checkpoints.get("downloads") is None
+    writer.join()
+    assert checkpoints.get("downloads") == [str(tmp_path / "a.mp4")]
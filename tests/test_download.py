@@ -0,0 +1,219 @@
+import asyncio
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from app.core.config import settings
+from app.utils import download_cache
+from app.utils.download import AsyncDownloader
+
+PAYLOAD = os.urandom(256 * 1024)
+
+class FlakyServer:
+    """
+    Local stand-in for a media host.
+    Serves PAYLOAD with ETag and byte-range support, answers HEAD requests
+    that still hold its ETag with 304, and can be told to drop the
+    connection part way through the next few GET responses.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.drop_after = None  # Bytes to send before dropping the connection
+        self.drops_left = 0
+        self.fail_with = []  # Status codes to answer the next GETs with
+        self.accept_ranges = True
+        self.etag = '"v1"'  # None serves files without a validator
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                server.requests.append(("HEAD", self.path, dict(self.headers)))
+                if self.path.startswith("/missing"):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                if server.etag and self.headers.get("If-None-Match") == server.etag:
+                    self.send_response(304)
+                    self.send_header("ETag", server.etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(PAYLOAD)))
+                if server.etag:
+                    self.send_header("ETag", server.etag)
+                if server.accept_ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+
+            def do_GET(self):
+                server.requests.append(("GET", self.path, dict(self.headers)))
+                if self.path.startswith("/missing"):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                if server.fail_with:
+                    self.send_response(server.fail_with.pop(0))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                start, end = 0, len(PAYLOAD) - 1
+                range_header = self.headers.get("Range")
+                if range_header and server.accept_ranges:
+                    first, last = range_header.split("=")[1].split("-")
+                    start = int(first)
+                    end = int(last) if last else end
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(PAYLOAD)}")
+                else:
+                    self.send_response(200)
+                body = PAYLOAD[start:end + 1]
+                self.send_header("Content-Length", str(len(body)))
+                if server.etag:
+                    self.send_header("ETag", server.etag)
+                self.end_headers()
+
+                if server.drops_left and server.drop_after is not None:
+                    server.drops_left -= 1
+                    self.wfile.write(body[:server.drop_after])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def gets(self):
+        return [request for request in self.requests if request[0] == "GET"]
+
+@pytest.fixture
+def flaky_server():
+    server = FlakyServer()
+    thread = threading.Thread(target=server.httpd.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+@pytest.fixture
+def download_settings(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "DOWNLOAD_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "DOWNLOAD_BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(settings, "DOWNLOAD_SEGMENT_MIN_SIZE", 10 ** 9)
+    return settings
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def test_download_files_keeps_order_and_reports_failures(flaky_server, download_settings):
+    """Test parallel downloads keep input order and mark failures as None"""
+    urls = [
+        f"{flaky_server.url}/clip.mp4",
+        f"{flaky_server.url}/missing.mp4",
+        f"{flaky_server.url}/other/clip.mp4"
+    ]
+
+    paths = asyncio.run(AsyncDownloader().download_files(urls, "task"))
+
+    assert paths[1] is None
+    assert paths[0] != paths[2]
+    assert _read(paths[0]) == PAYLOAD
+    assert _read(paths[2]) == PAYLOAD
+
+def test_download_resumes_after_dropped_connection(flaky_server, download_settings):
+    """Test that a dropped transfer continues from the .part file with Range"""
+    flaky_server.drop_after = 100 * 1024
+    flaky_server.drops_left = 1
+
+    paths = asyncio.run(AsyncDownloader().download_files([f"{flaky_server.url}/clip.mp4"], "task"))
+
+    assert _read(paths[0]) == PAYLOAD
+    retry_headers = flaky_server.gets()[-1][2]
+    assert retry_headers["Range"] == f"bytes={100 * 1024}-"
+    assert retry_headers["If-Range"] == '"v1"'
+    assert not os.path.exists(paths[0] + ".part")
+
+def test_download_retries_server_errors(flaky_server, download_settings):
+    """Test bounded retries on transient server errors"""
+    flaky_server.fail_with = [503, 502]
+
+    paths = asyncio.run(AsyncDownloader().download_files([f"{flaky_server.url}/clip.mp4"], "task"))
+
+    assert _read(paths[0]) == PAYLOAD
+    assert len(flaky_server.gets()) == 3
+
+def test_download_gives_up_after_retries(flaky_server, download_settings, monkeypatch):
+    """Test that persistent failures end as a failed download"""
+    monkeypatch.setattr(settings, "DOWNLOAD_RETRIES", 2)
+    flaky_server.fail_with = [503] * 10
+
+    paths = asyncio.run(AsyncDownloader().download_files([f"{flaky_server.url}/clip.mp4"], "task"))
+
+    assert paths == [None]
+    assert len(flaky_server.gets()) == 3
+
+def test_download_restarts_without_range_support(flaky_server, download_settings):
+    """Test that a server without range support gets a full retry"""
+    flaky_server.accept_ranges = False
+    flaky_server.drop_after = 100 * 1024
+    flaky_server.drops_left = 1
+
+    paths = asyncio.run(AsyncDownloader().download_files([f"{flaky_server.url}/clip.mp4"], "task"))
+
+    assert _read(paths[0]) == PAYLOAD
+    assert "Range" not in flaky_server.gets()[-1][2]
+
+def test_download_large_file_in_segments(flaky_server, download_settings, monkeypatch):
+    """Test that large files are fetched as parallel byte ranges and resumed per segment"""
+    monkeypatch.setattr(settings, "DOWNLOAD_SEGMENT_MIN_SIZE", 1024)
+    monkeypatch.setattr(settings, "DOWNLOAD_SEGMENTS", 4)
+    flaky_server.drop_after = 10 * 1024
+    flaky_server.drops_left = 2
+
+    paths = asyncio.run(AsyncDownloader().download_files([f"{flaky_server.url}/clip.mp4"], "task"))
+
+    assert _read(paths[0]) == PAYLOAD
+    ranges = [request[2]["Range"] for request in flaky_server.gets()]
+    segment_starts = {int(r.split("=")[1].split("-")[0]) for r in ranges}
+    assert {0, 64 * 1024, 128 * 1024, 192 * 1024} <= segment_starts
+    # Each dropped segment resumed from where it stopped
+    assert len(ranges) == 6
+    assert not os.path.exists(paths[0] + ".part.json")
+
+def test_stale_cache_entry_revalidated_with_304(flaky_server, download_settings, monkeypatch):
+    """Test a stale cache entry whose ETag still matches is served from the cache after a 304"""
+    monkeypatch.setattr(settings, "DOWNLOAD_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "DOWNLOAD_CACHE_DIR", None)
+    # Every entry is stale at once, so each later request revalidates
+    monkeypatch.setattr(settings, "DOWNLOAD_CACHE_FRESH_SECONDS", 0)
+    monkeypatch.setattr(download_cache, "_cache", None)
+    url = f"{flaky_server.url}/clip.mp4"
+
+    first = asyncio.run(AsyncDownloader().download_files([url], "first"))
+    second = asyncio.run(AsyncDownloader().download_files([url], "second"))
+
+    assert _read(second[0]) == PAYLOAD
+    assert len(flaky_server.gets()) == 1
+    assert flaky_server.requests[-1][2]["If-None-Match"] == '"v1"'
+    stats = download_cache.get_download_cache().stats()
+    assert (stats["misses"], stats["revalidations"], stats["hits"]) == (1, 1, 1)
+    assert first[0] != second[0]
+
+def test_limited_download_replaces_stale_part(flaky_server, download_settings):
+    """Test a prefix download over a part file it cannot resume overwrites it instead of appending"""
+    flaky_server.etag = None
+    local_path = str(download_settings.STORAGE_DIR) + "/clip.mp4"
+    with open(local_path + ".part", "wb") as f:
+        f.write(b"stale" * 100)
+
+    path = asyncio.run(AsyncDownloader().download(f"{flaky_server.url}/clip.mp4", local_path, byte_limit=1000))
+
+    assert _read(path) == PAYLOAD[:1000]
+    assert flaky_server.gets()[-1][2]["Range"] == "bytes=0-999"
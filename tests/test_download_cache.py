@@ -0,0 +1,75 @@
+import os
+import time
+from app.utils.download_cache import CacheIndex, DownloadCache
+
+def _write(path, size):
+    with open(path, 'wb') as f:
+        f.write(b"x" * size)
+    return str(path)
+
+def test_cache_index_evicts_least_recently_used(tmp_path):
+    """Test LRU eviction against the byte budget"""
+    index = CacheIndex(str(tmp_path / "cache"), max_bytes=250)
+
+    index.put("a", _write(tmp_path / "a", 100))
+    time.sleep(0.01)
+    index.put("b", _write(tmp_path / "b", 100))
+    time.sleep(0.01)
+    # Touch "a" so "b" becomes the oldest entry
+    assert index.get("a") is not None
+    time.sleep(0.01)
+    index.put("c", _write(tmp_path / "c", 100))
+
+    assert index.get("a") is not None
+    assert index.get("b") is None
+    assert index.get("c") is not None
+    assert not os.path.exists(tmp_path / "b")
+    assert index.stats()["evictions"] == 1
+
+def test_cache_index_keeps_entry_larger_than_budget(tmp_path):
+    """Test that a just-stored file survives even if it exceeds the budget"""
+    index = CacheIndex(str(tmp_path / "cache"), max_bytes=50)
+
+    index.put("big", _write(tmp_path / "big", 100))
+
+    assert index.get("big") is not None
+
+def test_download_cache_store_and_lookup(tmp_path):
+    """Test storing a download and looking it up by URL"""
+    cache = DownloadCache(str(tmp_path / "cache"), max_bytes=1024, fresh_seconds=60)
+
+    temp_path = _write(tmp_path / "download.part", 10)
+    cache.store("https://example.com/a.mp4", temp_path, "abc123", etag='"v1"')
+
+    entry = cache.lookup("https://example.com/a.mp4")
+    assert entry["content_hash"] == "abc123"
+    assert entry["path"] == cache.blob_path("abc123")
+    assert cache.is_fresh(entry)
+    assert cache.conditional_headers(entry) == {"If-None-Match": '"v1"'}
+    assert cache.lookup("https://example.com/other.mp4") is None
+
+def test_download_cache_deduplicates_by_content_hash(tmp_path):
+    """Test that two URLs with identical content share one cached file"""
+    cache = DownloadCache(str(tmp_path / "cache"), max_bytes=1024)
+
+    cache.store("https://a.example.com/clip.mp4", _write(tmp_path / "download.part", 10), "samehash")
+    cache.store("https://b.example.com/clip.mp4", _write(tmp_path / "download.part", 10), "samehash")
+
+    first = cache.lookup("https://a.example.com/clip.mp4")
+    second = cache.lookup("https://b.example.com/clip.mp4")
+    assert first["path"] == second["path"]
+    assert cache.stats()["bytes_stored"] == 10
+
+def test_download_cache_links_into_task_dir(tmp_path):
+    """Test that cached files are linked into the task directory"""
+    cache = DownloadCache(str(tmp_path / "cache"), max_bytes=1024)
+    cached_path = cache.store("https://example.com/a.mp4", _write(tmp_path / "download.part", 10), "abc123")
+
+    local_path = str(tmp_path / "task.mp4")
+    cache.link(cached_path, local_path)
+    cache.record_hit(10)
+
+    assert os.path.getsize(local_path) == 10
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["bytes_saved"] == 10
@@ -0,0 +1,58 @@
+from app.services.hls import HLSOutput
+from app.services.timeline import SourceClip, build_timeline
+from app.services.video_generation import FFmpegBackend
+from app.utils.ffmpeg import MediaInfo
+
+def _source(path, duration=4.0):
+    return SourceClip(path, MediaInfo(duration=duration, width=1280, height=720, fps="25/1", codec="h264"))
+
+def test_playlist_published_after_first_segment(tmp_path):
+    """Test the playlist only counts as ready once it lists a segment"""
+    hls = HLSOutput(str(tmp_path / "hls"), "audio.m4a", 4)
+    assert not hls.has_segment()
+
+    with open(hls.playlist_path, "w") as f:
+        f.write("#EXTM3U\n#EXT-X-PLAYLIST-TYPE:EVENT\n")
+    assert not hls.has_segment()
+
+    with open(hls.playlist_path, "a") as f:
+        f.write("#EXTINF:4.000000,\nsegment_00000.m4s\n")
+    assert hls.has_segment()
+
+def test_files_lists_playlist_and_segments(tmp_path):
+    """Test the files of an HLS output are the playlist, its init segment and every listed segment"""
+    hls = HLSOutput(str(tmp_path / "hls"), "audio.m4a", 4)
+    assert hls.files() == []
+
+    with open(hls.playlist_path, "w") as f:
+        f.write(
+            '#EXTM3U\n#EXT-X-MAP:URI="init.mp4"\n'
+            "#EXTINF:4.000000,\nsegment_00000.m4s\n#EXTINF:2.000000,\nsegment_00001.m4s\n#EXT-X-ENDLIST\n"
+        )
+
+    assert hls.files() == [
+        hls.playlist_path,
+        str(tmp_path / "hls" / "init.mp4"),
+        str(tmp_path / "hls" / "segment_00000.m4s"),
+        str(tmp_path / "hls" / "segment_00001.m4s")
+    ]
+
+def test_ffmpeg_backend_writes_hls_as_it_encodes(tmp_path):
+    """Test the main output goes to a growing playlist with the fitted track"""
+    hls = HLSOutput(str(tmp_path / "hls"), "audio.m4a", 4)
+    timeline = build_timeline([4.0, 4.0], 12.0)
+
+    command = FFmpegBackend().build_command(
+        [_source("a.mp4"), _source("b.mp4")], timeline, "video.mp4",
+        renditions=[((640, 360), "360.mp4")], hls=hls
+    )
+
+    # The audio input follows one video input per timeline entry
+    assert command[command.index("audio.m4a") - 1] == "-i"
+    assert command[command.index("-c:a") - 1] == f"{len(timeline)}:a:0"
+    assert command[command.index("-force_key_frames") + 1] == "expr:gte(t,n_forced*4)"
+    assert command[command.index("-hls_playlist_type") + 1] == "event"
+    assert hls.playlist_path in command
+    assert "video.mp4" not in command
+    # Renditions are still plain video-only files
+    assert command[-3:] == ["-t", "12.000000", "360.mp4"]
@@ -0,0 +1,114 @@
+import asyncio
+import random
+import threading
+import pytest
+from app.services import ingest
+from app.services.ingest import IngestPipeline
+
+class FakeDownloader:
+    """Downloads that finish in random order and fail for URLs containing 'bad'"""
+
+    task_concurrency = 3
+
+    async def download(self, url, local_path, byte_limit=None):
+        await asyncio.sleep(random.uniform(0, 0.01))
+        return None if "bad" in url else url
+
+    async def fetch_movie_index(self, url):
+        return None
+
+@pytest.fixture
+def fake_downloader(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingest.settings, "STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(ingest, "downloader", FakeDownloader())
+
+def run_pipeline(media_list):
+    progress = []
+    pipeline = IngestPipeline(
+        "task",
+        media_list,
+        load=lambda path, url: {"path": path},
+        normalize=lambda clip, base: {**clip, "base": base["path"]},
+        on_progress=progress.append
+    )
+    audio_path, clips = asyncio.run(pipeline.run("https://example.com/bg.mp3"))
+    return audio_path, clips, progress
+
+def test_pipeline_keeps_input_order(fake_downloader):
+    """Test that clips come out in input order whatever order they finish in"""
+    urls = [f"https://example.com/{i}.mp4" for i in range(10)]
+
+    audio_path, clips, progress = run_pipeline(urls)
+
+    assert audio_path == "https://example.com/bg.mp3"
+    assert [clip["path"] for clip in clips] == urls
+    # The first clip sets the dimensions and is not normalized itself
+    assert "base" not in clips[0]
+    assert all(clip["base"] == urls[0] for clip in clips[1:])
+
+def test_pipeline_skips_failed_downloads(fake_downloader):
+    """Test that a failed first clip hands the base role to the next one"""
+    urls = ["https://example.com/bad.mp4", "https://example.com/1.mp4", "https://example.com/2.mp4"]
+
+    _, clips, _ = run_pipeline(urls)
+
+    assert clips[0] is None
+    assert "base" not in clips[1]
+    assert clips[2]["base"] == urls[1]
+
+def test_pipeline_reports_stage_progress(fake_downloader):
+    """Test that progress grows with completed stages and ends at 1"""
+    urls = [f"https://example.com/{i}.mp4" for i in range(5)]
+
+    _, _, progress = run_pipeline(urls)
+
+    assert len(progress) == 3 * len(urls)
+    assert progress == sorted(progress)
+    assert progress[-1] == 1.0
+
+def test_pipeline_propagates_stage_errors(fake_downloader):
+    """Test that a clip failing to load fails the whole run"""
+    def load(path, url):
+        raise ValueError("corrupt clip")
+
+    pipeline = IngestPipeline("task", ["https://example.com/0.mp4"], load=load, normalize=lambda c, b: c)
+
+    with pytest.raises(ValueError, match="corrupt clip"):
+        asyncio.run(pipeline.run("https://example.com/bg.mp3"))
+
+def test_pipeline_reuses_earlier_downloads(fake_downloader):
+    """Test that files an earlier attempt downloaded are not fetched again"""
+    urls = [f"https://example.com/{i}.mp4" for i in range(3)]
+    kept = ingest.task_file_path("task", 2, urls[1])
+    open(kept, "w").close()
+    recorded = []
+    pipeline = IngestPipeline(
+        "task",
+        urls,
+        load=lambda path, url: {"path": path},
+        normalize=lambda clip, base: clip,
+        downloaded=[kept],
+        on_downloaded=recorded.append
+    )
+
+    audio_path, clips = asyncio.run(pipeline.run("https://example.com/bg.mp3"))
+
+    assert [clip["path"] for clip in clips] == [urls[0], kept, urls[2]]
+    assert sorted(recorded) == sorted([audio_path, urls[0], urls[2]])
+
+def test_pipeline_callbacks_run_off_the_event_loop(fake_downloader):
+    """Test progress and download callbacks, which write to the database, never run on the loop's thread"""
+    loop_thread = threading.get_ident()
+    threads = set()
+    pipeline = IngestPipeline(
+        "task",
+        [f"https://example.com/{i}.mp4" for i in range(3)],
+        load=lambda path, url: {"path": path},
+        normalize=lambda clip, base: clip,
+        on_progress=lambda fraction: threads.add(threading.get_ident()),
+        on_downloaded=lambda path: threads.add(threading.get_ident())
+    )
+
+    asyncio.run(pipeline.run("https://example.com/bg.mp3"))
+
+    assert threads and loop_thread not in threads
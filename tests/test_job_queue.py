@@ -0,0 +1,207 @@
+import time
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.db.base import Base
+from app.models.render_job import RenderJob
+from app.models.user import User
+from app.models.video_task import VideoTask
+from app.services.job_queue import JobQueue
+from app.services.scheduler import STANDARD_LANE, FairShareScheduler, QueueHead
+
+@pytest.fixture
+def sessions(tmp_path):
+    """The SQLite stand-in with two queued tasks"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'queue.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    with factory() as db:
+        db.add(User(id="user", email="user@example.com", api_key="key"))
+        for task_id in ("first", "second"):
+            db.add(VideoTask(
+                id=task_id, user_id="user", status="pending",
+                background_url="https://example.com/a.mp3", media_list=[]
+            ))
+            db.flush()
+            JobQueue.enqueue(db, db.get(VideoTask, task_id))
+            # Distinct creation times keep the order deterministic
+            time.sleep(0.01)
+        db.commit()
+    return factory
+
+def _job(sessions, task_id):
+    with sessions() as db:
+        return db.get(RenderJob, task_id)
+
+def test_claims_in_order_and_hides_leased_jobs(sessions):
+    """Test a leased job is not handed to a second worker"""
+    queue = JobQueue(sessions, lease_seconds=60)
+
+    assert queue.claim("a") == "first"
+    assert queue.claim("b") == "second"
+    assert queue.claim("c") is None
+    with sessions() as db:
+        assert db.get(VideoTask, "first").status == "processing"
+
+def test_expired_lease_is_requeued_and_claimed_again(sessions):
+    """Test a job whose worker stopped heartbeating goes to another worker"""
+    queue = JobQueue(sessions, lease_seconds=0.05)
+    assert queue.claim("dead") == "first"
+    assert queue.claim("slow") == "second"
+    time.sleep(0.1)
+
+    # Expired leases stay put until reaped
+    assert queue.claim("alive") is None
+    assert sorted(queue.reap()) == ["first", "second"]
+    with sessions() as db:
+        assert db.get(VideoTask, "first").status == "pending"
+
+    assert queue.claim("alive") == "first"
+    job = _job(sessions, "first")
+    assert (job.lease_owner, job.attempts) == ("alive", 2)
+    # The first worker's lease is gone: it can neither renew nor finish the job
+    assert not queue.heartbeat("first", "dead")
+    assert not queue.finish("first", "dead")
+    assert queue.finish("first", "alive")
+    assert _job(sessions, "first").state == "done"
+
+def test_heartbeat_keeps_job_leased(sessions):
+    """Test renewing the lease keeps a long render from being reclaimed"""
+    queue = JobQueue(sessions, lease_seconds=0.1)
+    assert queue.claim("a") == "first"
+    assert queue.claim("a") == "second"
+    assert queue.finish("second", "a")
+
+    for _ in range(3):
+        time.sleep(0.05)
+        assert queue.heartbeat("first", "a")
+        assert queue.reap() == []
+    assert queue.claim("b") is None
+
+def test_job_fails_after_max_attempts(sessions):
+    """Test a job that keeps killing its workers ends as an error"""
+    queue = JobQueue(sessions, lease_seconds=0.01, max_attempts=2)
+    assert queue.claim("a") == "first"
+    assert queue.claim("a") == "second"
+    assert queue.finish("second", "a")
+    time.sleep(0.02)
+    assert queue.reap() == ["first"]
+    assert queue.claim("b") == "first"
+    time.sleep(0.02)
+
+    assert queue.reap() == []
+    assert queue.claim("c") is None
+    assert _job(sessions, "first").state == "failed"
+    with sessions() as db:
+        assert db.get(VideoTask, "first").status == "error"
+
+def _add_tasks(sessions, user_id, count, quota=100, **fields):
+    with sessions() as db:
+        if db.get(User, user_id) is None:
+            db.add(User(id=user_id, email=f"{user_id}@example.com", api_key=user_id, monthly_quota=quota))
+        for k in range(count):
+            task = VideoTask(
+                id=f"{user_id}-{fields.get('profile') or 'full'}-{k}", user_id=user_id, status="pending",
+                background_url="https://example.com/a.mp3", media_list=[], **fields
+            )
+            db.add(task)
+            db.flush()
+            JobQueue.enqueue(db, task)
+            time.sleep(0.002)
+        db.commit()
+
+def test_busy_user_does_not_starve_others(sessions):
+    """Test a user with a long backlog gets no more than their share once others wait"""
+    queue = JobQueue(sessions, lease_seconds=60, scheduler=FairShareScheduler(max_running=0))
+    _add_tasks(sessions, "bulk", 10)
+    _add_tasks(sessions, "small", 2)
+
+    claimed = [queue.claim("w") for _ in range(6)]
+
+    # "user" from the fixture holds the two oldest jobs
+    owners = [task_id.split("-")[0] for task_id in claimed]
+    assert owners.count("small") == 2
+    assert owners.count("bulk") == 2
+
+def test_share_follows_monthly_quota(sessions):
+    """Test a user with twice the quota runs twice as many renders"""
+    queue = JobQueue(sessions, lease_seconds=60, scheduler=FairShareScheduler(max_running=0))
+    _add_tasks(sessions, "big", 10, quota=200)
+    _add_tasks(sessions, "other", 10, quota=100)
+    for task_id in ("first", "second"):
+        with sessions() as db:
+            db.delete(db.get(RenderJob, task_id))
+            db.commit()
+
+    owners = [queue.claim("w").split("-")[0] for _ in range(6)]
+
+    assert owners.count("big") == 4
+    assert owners.count("other") == 2
+
+def test_previews_and_short_jobs_go_first(sessions):
+    """Test the priority lane is claimed ahead of older full renders"""
+    queue = JobQueue(sessions, lease_seconds=60, scheduler=FairShareScheduler(max_running=0))
+    _add_tasks(sessions, "editor", 1, profile="preview")
+    _add_tasks(sessions, "short", 1, duration=10)
+    _add_tasks(sessions, "long", 1, duration=600)
+
+    claimed = [queue.claim("w") for _ in range(3)]
+
+    assert claimed[:2] == ["editor-preview-0", "short-full-0"]
+    with sessions() as db:
+        assert db.get(RenderJob, "editor-preview-0").claim_reason == "priority"
+        assert db.get(RenderJob, claimed[2]).claim_reason == "fair_share"
+
+def test_user_concurrency_cap(sessions):
+    """Test a user at the cap is passed over until one of their renders ends"""
+    queue = JobQueue(sessions, lease_seconds=60, scheduler=FairShareScheduler(max_running=1))
+    _add_tasks(sessions, "other", 1)
+
+    assert queue.claim("w") == "first"
+    assert queue.claim("w") == "other-full-0"
+    assert queue.claim("w") is None
+    stats = queue.stats()
+    assert stats["capped_users"] == 1
+    assert stats["users"]["user"]["capped"]
+
+    queue.finish("first", "w")
+    assert queue.claim("w") == "second"
+
+def test_claim_moves_past_locked_heads(sessions):
+    """Test a claim whose picked head has no job left to lock tries the other heads instead of spinning"""
+    picks = []
+
+    class RecordingScheduler(FairShareScheduler):
+        def pick(self, heads, running):
+            picks.append([head.user_id for head in heads])
+            assert len(picks) < 10, "claim keeps picking the same head"
+            return super().pick(heads, running)
+
+    class LockedQueue(JobQueue):
+        def _queue_heads(self, db, now):
+            # A head whose jobs another claim holds locked: it is listed,
+            # but SKIP LOCKED finds nothing to take for it
+            locked = QueueHead("locked", STANDARD_LANE, datetime(2000, 1, 1))
+            return [locked] + super()._queue_heads(db, now)
+
+    queue = LockedQueue(sessions, scheduler=RecordingScheduler(max_running=0))
+
+    assert queue.claim("a") == "first"
+    assert picks == [["locked", "user"], ["user"]]
+
+def test_stats_report_queue_and_decisions(sessions):
+    """Test the metrics show depth per lane, shares and claim reasons"""
+    queue = JobQueue(sessions, lease_seconds=60, scheduler=FairShareScheduler(max_running=0))
+    _add_tasks(sessions, "editor", 1, profile="preview", quota=300)
+    queue.claim("w")
+    queue.claim("w")
+
+    stats = queue.stats()
+
+    assert stats["running"] == {"priority": 1, "standard": 1}
+    assert stats["queued"] == {"standard": 1}
+    assert stats["users"]["editor"]["fair_share"] == 0.75
+    assert stats["users"]["user"]["running_share"] == 0.5
+    assert set(stats["decisions"]) == {"priority", "fair_share"}
+    assert stats["decisions"]["priority"]["claims"] == 1
@@ -0,0 +1,89 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.models.media_metadata import MediaMetadata
+from app.services import media_index
+from app.utils.ffmpeg import MediaInfo
+
+@pytest.fixture
+def index(monkeypatch, tmp_path):
+    """Media index on a throwaway SQLite database, counting probes"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'media.db'}")
+    MediaMetadata.__table__.create(engine)
+    monkeypatch.setattr(media_index, "SessionLocal", sessionmaker(bind=engine))
+    monkeypatch.setattr(settings, "MEDIA_METADATA_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "DOWNLOAD_CACHE_ENABLED", False)
+
+    probes = []
+    def probe_media(path):
+        probes.append(path)
+        return MediaInfo(duration=8.0, width=1920, height=1080, fps="30/1", codec="h264")
+    monkeypatch.setattr(media_index, "probe_media", probe_media)
+    return probes
+
+def test_lookup_probes_each_content_once(index, tmp_path):
+    """Test a file with already seen content is served from the index"""
+    first = tmp_path / "first.mp4"
+    copy = tmp_path / "copy.mp4"
+    first.write_bytes(b"same bytes")
+    copy.write_bytes(b"same bytes")
+
+    info = media_index.lookup_media(str(first), "https://example.com/a.mp4")
+    cached = media_index.lookup_media(str(copy), "https://example.com/b.mp4")
+
+    assert index == [str(first)]
+    assert cached.size == info.size == (1920, 1080)
+    # Keyframes are only scanned once a render asks for them
+    assert cached.keyframes is None
+
+def test_keyframes_scanned_once_per_content(index, monkeypatch, tmp_path):
+    """Test keyframes are scanned on first use and stored with the content's metadata"""
+    scans = []
+    def keyframe_times(path):
+        scans.append(path)
+        return [0.0, 4.0]
+    monkeypatch.setattr(media_index, "keyframe_times", keyframe_times)
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"same bytes")
+
+    info = media_index.lookup_media(str(path), "https://example.com/a.mp4")
+    assert media_index.media_keyframes(str(path), info) == [0.0, 4.0]
+    assert media_index.media_keyframes(str(path), info) == [0.0, 4.0]
+    reused = media_index.lookup_media(str(path), "https://example.com/a.mp4")
+
+    assert scans == [str(path)]
+    assert reused.keyframes == [0.0, 4.0]
+    assert reused.keyframe_interval == 4.0
+
+def test_lookup_probes_changed_content(index, tmp_path):
+    """Test new bytes behind the same URL are probed again"""
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"version 1")
+    media_index.lookup_media(str(path), "https://example.com/a.mp4")
+    path.write_bytes(b"version 2")
+    media_index.lookup_media(str(path), "https://example.com/a.mp4")
+
+    assert len(index) == 2
+
+def test_rotation_from_display_matrix():
+    """Test portrait phone footage reports its display size"""
+    info = MediaInfo.from_ffprobe({
+        "format": {"duration": "3.0"},
+        "streams": [{
+            "codec_type": "video", "codec_name": "h264", "width": 1920, "height": 1080,
+            "side_data_list": [{"side_data_type": "Display Matrix", "rotation": -90}]
+        }]
+    })
+
+    assert info.rotation == 90
+    assert info.size == (1080, 1920)
+
+def test_rotation_from_rotate_tag():
+    """Test the tag written by older muxers is read as well"""
+    info = MediaInfo.from_ffprobe({
+        "streams": [{"codec_type": "video", "width": 1280, "height": 720, "tags": {"rotate": "180"}}]
+    })
+
+    assert info.rotation == 180
+    assert info.size == (1280, 720)
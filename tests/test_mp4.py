@@ -0,0 +1,89 @@
+import asyncio
+import struct
+from app.utils.mp4 import iter_boxes, read_movie_index
+
+def box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+def full_box(box_type: bytes, payload: bytes) -> bytes:
+    return box(box_type, b"\x00\x00\x00\x00" + payload)
+
+def build_mp4(faststart: bool = True, padding: int = 0) -> bytes:
+    """
+    Build a minimal MP4 with one video track of 100 samples at 10 fps,
+    10 samples of 100 bytes per chunk, followed by padding bytes of mdat.
+    """
+    def moov(mdat_payload_offset: int) -> bytes:
+        stts = full_box(b"stts", struct.pack(">III", 1, 100, 1000))
+        stsc = full_box(b"stsc", struct.pack(">IIII", 1, 1, 10, 1))
+        stsz = full_box(b"stsz", struct.pack(">II", 100, 100))
+        stco = full_box(b"stco", struct.pack(">I", 10) + b"".join(
+            struct.pack(">I", mdat_payload_offset + chunk * 1000) for chunk in range(10)
+        ))
+        stbl = box(b"stbl", stts + stsc + stsz + stco)
+        minf = box(b"minf", stbl)
+        mdhd = full_box(b"mdhd", struct.pack(">IIII", 0, 0, 10000, 1000000) + b"\x00" * 4)
+        hdlr = full_box(b"hdlr", struct.pack(">I4s", 0, b"vide") + b"\x00" * 12)
+        trak = box(b"trak", box(b"mdia", mdhd + hdlr + minf))
+        mvhd = full_box(b"mvhd", struct.pack(">IIII", 0, 0, 1000, 10000) + b"\x00" * 80)
+        return box(b"moov", mvhd + trak)
+
+    ftyp = box(b"ftyp", b"isom\x00\x00\x02\x00")
+    media = b"\x01" * 10000 + b"\x00" * padding
+    if faststart:
+        moov_size = len(moov(0))
+        return ftyp + moov(len(ftyp) + moov_size + 8) + box(b"mdat", media)
+    return ftyp + box(b"mdat", media) + moov(len(ftyp) + 8)
+
+def read_index(data: bytes):
+    reads = []
+
+    async def read_range(start, end):
+        reads.append((start, end))
+        return data[start:end + 1]
+
+    return asyncio.run(read_movie_index(read_range, len(data))), reads
+
+def test_iter_boxes_top_level():
+    """Test walking top-level boxes"""
+    data = build_mp4()
+    assert [b[0] for b in iter_boxes(data)] == [b"ftyp", b"moov", b"mdat"]
+
+def test_read_movie_index_faststart():
+    """Test reading duration and sample tables from a faststart file"""
+    data = build_mp4(faststart=True)
+
+    index, _ = read_index(data)
+
+    assert index.duration == 10.0
+    assert index.faststart
+    assert len(index.tracks) == 1
+    assert index.tracks[0].handler == b"vide"
+
+def test_prefix_size_covers_needed_samples():
+    """Test mapping a duration to the bytes holding its samples"""
+    data = build_mp4(faststart=True)
+    index, _ = read_index(data)
+    mdat_payload = len(data) - 10000
+
+    # 2 seconds at 10 fps is 20 samples, i.e. the first two chunks
+    assert index.prefix_size(2.0) == mdat_payload + 2000
+    assert index.prefix_size(0.15) == mdat_payload + 200
+    assert index.prefix_size(60.0) == len(data)
+
+def test_moov_at_end_is_found_but_not_prefixable():
+    """Test that a trailing moov is read but prefixes are refused"""
+    data = build_mp4(faststart=False, padding=1024 * 1024)
+
+    index, reads = read_index(data)
+
+    assert index.duration == 10.0
+    assert not index.faststart
+    assert index.prefix_size(2.0) is None
+    # The mdat is skipped rather than read
+    assert sum(end - start + 1 for start, end in reads) < len(data)
+
+def test_read_movie_index_rejects_non_mp4():
+    """Test that arbitrary bytes are not mistaken for an MP4"""
+    index, _ = read_index(b"\x00\x00\x00\x02" + b"garbage" * 10)
+    assert index is None
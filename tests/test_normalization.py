@@ -0,0 +1,81 @@
+from fractions import Fraction
+import pytest
+from app.services.normalization import NormalizationPlan, OutputFormat, plan_frame_rate
+
+def test_plan_crops_wide_source_before_scaling():
+    """Test a 4K source is cropped in source pixels, then scaled once"""
+    plan = NormalizationPlan((3840, 2160), (1080, 1080))
+
+    assert plan.crop == (840, 0, 2160, 2160)
+    assert plan.ffmpeg_filters() == ["crop=2160:2160:840:0", "scale=1080:1080"]
+
+def test_plan_crops_tall_source():
+    """Test portrait sources lose rows evenly from top and bottom"""
+    plan = NormalizationPlan((1080, 1920), (1920, 1080))
+
+    assert plan.crop == (0, 656, 1080, 608)
+    assert plan.needs_crop and plan.needs_scale
+
+def test_plan_scales_only_when_ratio_matches():
+    """Test no crop is planned for a source with the target's aspect ratio"""
+    plan = NormalizationPlan((3840, 2160), (1920, 1080))
+
+    assert not plan.needs_crop
+    assert plan.ffmpeg_filters() == ["scale=1920:1080"]
+
+def test_plan_identity():
+    """Test a clip already at the target size is left alone"""
+    plan = NormalizationPlan((1280, 720), (1280, 720))
+
+    assert plan.is_identity
+    assert plan.ffmpeg_filters() == []
+
+@pytest.mark.parametrize("source_size, target_size", [
+    ((1920, 1080), (641, 481)),
+    ((640, 480), (333, 333)),
+    ((1001, 999), (1279, 721)),
+    ((720, 1280), (1081, 1919))
+])
+def test_plan_produces_exact_odd_sizes(source_size, target_size):
+    """Test odd target sizes come out exact rather than one pixel short"""
+    plan = NormalizationPlan(source_size, target_size)
+    x, y, width, height = plan.crop
+
+    assert 0 <= x and x + width <= source_size[0]
+    assert 0 <= y and y + height <= source_size[1]
+    assert abs(width / height - target_size[0] / target_size[1]) < 0.01
+
+class FakeClip:
+    def __init__(self, size):
+        self.size = size
+
+    def crop(self, x1, y1, x2, y2):
+        return FakeClip((x2 - x1, y2 - y1))
+
+    def resize(self, newsize):
+        return FakeClip(newsize)
+
+def test_plan_applies_to_moviepy_clip():
+    """Test the moviepy path yields exactly the target size, odd widths included"""
+    clip = NormalizationPlan((1920, 1080), (641, 480)).apply(FakeClip((1920, 1080)))
+    assert clip.size == (641, 480)
+
+def test_frame_rate_policies():
+    """Test each policy picks its rate from the clips' time on the timeline"""
+    rates = [(Fraction(24), 10.0), (Fraction(60), 2.0), (None, 5.0), (Fraction(30), 4.0)]
+
+    assert plan_frame_rate(rates) == 24
+    assert plan_frame_rate(rates, "max") == 60
+    assert plan_frame_rate(rates, "min") == 24
+    assert plan_frame_rate(rates[1:], "first") == 60
+    assert plan_frame_rate([(None, 5.0)]) is None
+    with pytest.raises(ValueError):
+        plan_frame_rate(rates, "median")
+
+def test_slower_clips_are_scaled_before_repeating_frames():
+    """Test duplicated frames are scaled once and the format follows the scale"""
+    plan = NormalizationPlan((1280, 720), (1920, 1080))
+    output_format = OutputFormat(Fraction(30))
+
+    assert output_format.ffmpeg_filters(plan, Fraction(24)) == ["scale=1920:1080", "setsar=1", "fps=30", "format=yuv420p"]
+    assert output_format.ffmpeg_filters(plan, Fraction(60)) == ["fps=30", "scale=1920:1080", "setsar=1", "format=yuv420p"]
@@ -0,0 +1,62 @@
+from fractions import Fraction
+import pytest
+from app.core.config import settings
+from app.services.profiles import PREVIEW_PROFILE, EncodingProfile, available_profiles, get_profile, rendition_size
+from app.services.timeline import SourceClip, build_timeline
+from app.services.video_generation import FFmpegBackend
+from app.utils.ffmpeg import MediaInfo
+
+def test_output_size_caps_resolution():
+    """Test the base size is scaled down to fit, keeping aspect and even dimensions"""
+    profile = EncodingProfile("test", preset="veryfast", crf=28, max_width=1280, max_height=720)
+
+    assert profile.output_size((3840, 2160)) == (1280, 720)
+    assert profile.output_size((1080, 1920)) == (404, 720)
+    assert profile.output_size((640, 480)) == (640, 480)
+
+def test_output_fps_is_a_cap():
+    """Test the profile frame rate only ever lowers the clips' rate"""
+    profile = EncodingProfile("test", preset="veryfast", crf=28, fps=24)
+
+    assert profile.output_fps(Fraction(60)) == 24
+    assert profile.output_fps(Fraction(15)) == 15
+    assert get_profile("standard").output_fps(Fraction(30000, 1001)) == Fraction(30000, 1001)
+
+def test_rendition_size_keeps_aspect_ratio():
+    """Test renditions are scaled to their height with an even width"""
+    assert rendition_size((1920, 1080), 480) == (854, 480)
+    assert rendition_size((1080, 1920), 720) == (404, 720)
+    assert rendition_size((1280, 960), 360) == (480, 360)
+
+def test_x264_args():
+    """Test preset, CRF and thread budget reach the encoder"""
+    assert get_profile("draft").x264_args() == ["-preset", "veryfast", "-crf", "28", "-threads", "2"]
+    assert get_profile("archive").x264_args(threads=4) == ["-preset", "slow", "-crf", "18", "-threads", "4"]
+
+def test_profiles_allowlist(monkeypatch):
+    """Test only allowed profiles are offered and unknown names are rejected"""
+    monkeypatch.setattr(settings, "ENCODING_PROFILES_ALLOWED", ["draft", "nonexistent"])
+
+    assert available_profiles() == ["draft"]
+    assert get_profile(None).name == settings.DEFAULT_ENCODING_PROFILE
+    with pytest.raises(ValueError):
+        get_profile("ultra")
+
+def test_ffmpeg_backend_applies_profile():
+    """Test the filtergraph scales to the profile's size and rate"""
+    info = MediaInfo(duration=4.0, width=3840, height=2160, fps="60/1", codec="h264")
+    backend = FFmpegBackend(get_profile("draft"))
+
+    command = backend.build_command([SourceClip("a.mp4", info)], build_timeline([4.0]), "out.mp4")
+    graph = command[command.index("-filter_complex") + 1]
+
+    assert "scale=1280:720" in graph and "fps=24" in graph
+    assert command[command.index("-preset") + 1] == "veryfast"
+
+def test_preview_profile_is_internal():
+    """Test the proxy profile renders small and fast but cannot be requested by name"""
+    profile = get_profile(PREVIEW_PROFILE)
+
+    assert profile.output_size((3840, 2160)) == (640, 360)
+    assert profile.preset == "ultrafast"
+    assert PREVIEW_PROFILE not in available_profiles()
@@ -0,0 +1,103 @@
+import threading
+import time
+import numpy as np
+from app.services import video_generation
+from app.services.readers import ReaderSlots
+from app.services.timeline import SourceClip, build_timeline
+from app.services.video_generation import FFmpegBackend, LazyMontageClip
+from app.utils.ffmpeg import MediaInfo, RenderCancelled, stop_on
+
+class FakeReader:
+    """A decoder that counts how many of its kind are open"""
+    open = 0
+    peak = 0
+
+    def __init__(self, path):
+        self.path = path
+        self.size = (64, 36)
+        self.duration = 1.0
+        FakeReader.open += 1
+        FakeReader.peak = max(FakeReader.peak, FakeReader.open)
+
+    def get_frame(self, t):
+        return np.zeros((36, 64, 3), dtype=np.uint8)
+
+    def close(self):
+        FakeReader.open -= 1
+
+def _sources(count):
+    return [
+        SourceClip(f"{k}.mp4", MediaInfo(duration=1.0, width=64, height=36, fps="10/1", codec="h264"))
+        for k in range(count)
+    ]
+
+def test_slots_cap_concurrent_readers():
+    """Test holders beyond the cap wait for a slot"""
+    slots = ReaderSlots(2)
+    running, peak = [], []
+
+    def job():
+        with slots.hold():
+            running.append(1)
+            peak.append(len(running))
+            time.sleep(0.02)
+            running.pop()
+
+    threads = [threading.Thread(target=job) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) == 2
+    assert slots.open == 0
+
+def test_slots_never_exceed_cap_for_one_holder():
+    """Test a render needing more readers than the cap still gets the whole cap"""
+    slots = ReaderSlots(4)
+    with slots.hold(10):
+        assert slots.open == 4
+    assert ReaderSlots(0).size(100) == 100
+
+def test_stopped_render_stops_waiting_for_a_slot():
+    """Test a render told to stop while waiting for a slot gives up instead of waiting on"""
+    slots = ReaderSlots(1)
+    stop = threading.Event()
+    errors = []
+
+    def wait():
+        with stop_on(stop):
+            try:
+                slots.acquire()
+            except RenderCancelled as e:
+                errors.append(e)
+
+    with slots.hold():
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        stop.set()
+        waiter.join(2)
+        assert not waiter.is_alive()
+    assert len(errors) == 1
+    assert slots.open == 0
+
+def test_lazy_montage_keeps_one_reader_open(monkeypatch):
+    """Test a 100-clip montage opens each clip only while its frames are read"""
+    monkeypatch.setattr(video_generation, "load_clip", FakeReader)
+    FakeReader.open = FakeReader.peak = 0
+    sources = _sources(100)
+    montage = LazyMontageClip(sources, build_timeline([1.0] * 100), (64, 36), 10.0)
+
+    frames = list(montage.iter_frames())
+    montage.close()
+
+    assert len(frames) == 1000
+    assert FakeReader.peak == 1
+    assert FakeReader.open == 0
+
+def test_split_parts_respects_reader_cap(monkeypatch):
+    """Test no part of a long montage decodes more inputs than the cap"""
+    monkeypatch.setattr(video_generation, "reader_slots", ReaderSlots(16))
+    parts = FFmpegBackend().split_parts(build_timeline([1.0] * 100))
+
+    assert [len(part) for part in parts] == [16] * 6 + [4]
@@ -0,0 +1,223 @@
+import os
+import threading
+import time
+from fractions import Fraction
+import pytest
+from app.services.normalization import OutputFormat
+from app.services.timeline import SourceClip, TimelineEntry, build_timeline
+from app.services import video_generation
+from app.services.video_generation import (
+    FFmpegBackend, MoviePyBackend, StageTimer, get_render_backend, split_timeline
+)
+from app.utils.ffmpeg import MediaInfo, RenderCancelled, check_stopped, run_ffmpeg, stop_on
+
+def _source(path, width=1920, height=1080, fps="25/1", duration=4.0):
+    return SourceClip(path, MediaInfo(duration=duration, width=width, height=height, fps=fps, codec="h264"))
+
+def _filter_graph(command):
+    return command[command.index("-filter_complex") + 1].split(";")
+
+def test_get_render_backend():
+    """Test backends are selected by name"""
+    assert isinstance(get_render_backend("ffmpeg"), FFmpegBackend)
+    assert isinstance(get_render_backend("moviepy"), MoviePyBackend)
+    with pytest.raises(ValueError):
+        get_render_backend("gstreamer")
+
+def test_ffmpeg_backend_compiles_timeline():
+    """Test the timeline becomes one input and one filter chain per entry"""
+    sources = [_source("a.mp4"), _source("b.mp4", width=1080, height=1920, fps="30/1")]
+    timeline = build_timeline([4.0, 4.0], 4.0)
+
+    command = FFmpegBackend().build_command(sources, timeline, "out.mp4")
+    graph = _filter_graph(command)
+
+    assert [command[i + 1] for i, arg in enumerate(command) if arg == "-i"] == ["a.mp4", "b.mp4"]
+    # Equal time at 25 and 30 fps goes to the higher rate
+    assert graph[0] == "[0:v:0]setpts=PTS-STARTPTS,setsar=1,fps=30,format=yuv420p[v0]"
+    assert command[command.index("-t") + 1] == "2.000000"
+    # Only the clip that differs from the base clip is scaled and cropped
+    assert "crop=1080:608:0:656,scale=1920:1080" in graph[1]
+    assert graph[2] == "[v0][v1]concat=n=2:v=1:a=0,format=yuv420p[v]"
+    # The background track is muxed in afterwards
+    assert "-an" in command
+    assert command[-1] == "out.mp4"
+
+def test_faster_clips_drop_frames_before_scaling():
+    """Test frames a faster clip loses are never cropped or scaled"""
+    sources = [_source("a.mp4", fps="30/1", duration=8.0), _source("b.mp4", width=1280, height=720, fps="60/1")]
+    timeline = build_timeline([8.0, 4.0])
+
+    backend = FFmpegBackend()
+    backend.output_format = backend.plan_format(sources, timeline)
+    graph = _filter_graph(backend.build_command(sources, timeline, "out.mp4"))
+
+    assert graph[1] == "[1:v:0]setpts=PTS-STARTPTS,fps=30,scale=1920:1080,setsar=1,format=yuv420p[v1]"
+
+def test_ffmpeg_backend_loops_with_separate_inputs():
+    """Test each loop of the last clip decodes from its own input"""
+    sources = [_source("a.mp4"), _source("b.mp4")]
+    timeline = build_timeline([4.0, 4.0], 14.0)
+
+    command = FFmpegBackend().build_command(sources, timeline, "out.mp4")
+
+    assert [command[i + 1] for i, arg in enumerate(command) if arg == "-i"] == ["a.mp4", "b.mp4", "b.mp4", "b.mp4"]
+    # Inputs are cut to their entry, the output to the whole timeline
+    assert [command[i + 1] for i, arg in enumerate(command) if arg == "-t"] == [
+        "4.000000", "4.000000", "4.000000", "2.000000", "14.000000"
+    ]
+
+def test_ffmpeg_backend_splits_renditions_in_one_graph():
+    """Test renditions fan out from the concatenated frames to one encoder each"""
+    sources = [_source("a.mp4"), _source("b.mp4")]
+    timeline = build_timeline([4.0, 4.0])
+
+    command = FFmpegBackend().build_command(
+        sources, timeline, "out.mp4", renditions=[((1280, 720), "720.mp4"), ((854, 480), "480.mp4")]
+    )
+    graph = _filter_graph(command)
+
+    # Sources are still decoded once each
+    assert command.count("-i") == 2
+    assert graph[2] == "[v0][v1]concat=n=2:v=1:a=0,format=yuv420p,split=3[v][r0][r1]"
+    assert graph[3] == "[r0]scale=1280:720[o0]"
+    assert graph[4] == "[r1]crop=1920:1079:0:0,scale=854:480[o1]"
+    assert [command[i + 1] for i, arg in enumerate(command) if arg == "-map"] == ["[v]", "[o0]", "[o1]"]
+    assert command[-1] == "480.mp4"
+
+def test_encode_renditions_decodes_once(monkeypatch):
+    """Test renditions of a finished render come from one ffmpeg run"""
+    commands = []
+    monkeypatch.setattr(video_generation, "probe", lambda path: MediaInfo(duration=4.0, width=1920, height=1080))
+    monkeypatch.setattr(video_generation, "run_ffmpeg", lambda args, **kwargs: commands.append(args))
+
+    video_generation.encode_renditions(
+        "video.mp4", [((1280, 720), "720.mp4"), ((640, 360), "360.mp4")], FFmpegBackend().profile, 4.0
+    )
+
+    assert len(commands) == 1
+    assert commands[0].count("-i") == 1
+    assert _filter_graph(commands[0])[0] == "[0:v:0]split=2[s0][s1]"
+    assert commands[0][-1] == "360.mp4"
+
+def test_split_timeline_into_pieces():
+    """Test entries are cut into pieces of at most the segment length"""
+    timeline = build_timeline([4.0, 2.5])
+
+    assert split_timeline(timeline) == timeline
+    pieces = [(p.source_index, p.start, p.end) for p in split_timeline(timeline, 1.5)]
+    assert pieces == [(0, 0.0, 1.5), (0, 1.5, 3.0), (0, 3.0, 4.0), (1, 0.0, 1.5), (1, 1.5, 2.5)]
+
+def test_part_command_encodes_exact_frame_count():
+    """Test a part seeks to its start and stops after its share of frames"""
+    sources = [_source("a.mp4"), _source("b.mp4", width=1280, height=720)]
+    part = [TimelineEntry(1, 1.5, 3.0)]
+
+    command = FFmpegBackend().part_command(sources, part, OutputFormat(Fraction(30)), 45, "0001.mp4", threads=3)
+
+    assert command[command.index("-ss") + 1] == "1.500000"
+    assert command[command.index("-frames:v") + 1] == "45"
+    assert command[command.index("-threads") + 1] == "3"
+    assert "scale=1920:1080" in command[command.index("-filter_complex") + 1]
+    assert "-an" in command
+
+def test_split_parts_encodes_loop_once():
+    """Test loops of the last clip become repeated parts after a single head part"""
+    backend = FFmpegBackend()
+    spans = lambda parts: [[(e.source_index, e.start, e.end) for e in part] for part in parts]
+
+    assert len(backend.split_parts(build_timeline([4.0, 2.0], 5.0))) == 1
+    parts = backend.split_parts(build_timeline([4.0, 3.0, 2.0], 14.5))
+    assert spans(parts) == [
+        [(0, 0.0, 4.0), (1, 0.0, 3.0)],
+        [(2, 0.0, 2.0)], [(2, 0.0, 2.0)], [(2, 0.0, 2.0)],
+        [(2, 0.0, 1.5)]
+    ]
+
+def _touch(encoded, path):
+    encoded.append(path)
+    open(path, "w").close()
+
+def test_render_parts_reuses_repeated_encodes(monkeypatch, tmp_path):
+    """Test identical parts are encoded once and repeated in the concat list"""
+    encoded, joined = [], []
+    monkeypatch.setattr(video_generation, "run_ffmpeg", lambda args, **kwargs: _touch(encoded, args[-1]))
+    monkeypatch.setattr(video_generation, "concat_copy", lambda entries, *args: joined.extend(e[0] for e in entries))
+    sources = [_source("a.mp4"), _source("b.mp4", duration=2.0)]
+    backend = FFmpegBackend()
+
+    backend.render_parts(sources, backend.split_parts(build_timeline([4.0, 2.0], 13.0)), str(tmp_path / "out.mp4"))
+
+    # Head, one loop and the remainder
+    assert len(encoded) == 3
+    assert len(joined) == 6
+    assert len(set(joined[1:5])) == 1
+
+def test_render_parts_resumes_after_a_failure(monkeypatch, tmp_path):
+    """Test a retry only encodes the parts the failed attempt did not finish"""
+    encoded, failures = [], [RuntimeError("worker died")]
+
+    def run_ffmpeg(args, **kwargs):
+        if len(encoded) == 2 and failures:
+            raise failures.pop()
+        _touch(encoded, args[-1])
+
+    monkeypatch.setattr(video_generation, "run_ffmpeg", run_ffmpeg)
+    monkeypatch.setattr(video_generation, "concat_copy", lambda *args: None)
+    sources = [_source("a.mp4"), _source("b.mp4", duration=2.0)]
+    backend = FFmpegBackend()
+    parts = backend.split_parts(build_timeline([4.0, 2.0], 13.0))
+    output_path = str(tmp_path / "out.mp4")
+
+    with pytest.raises(RuntimeError):
+        backend.render_parts(sources, parts, output_path)
+    backend.render_parts(sources, parts, output_path)
+
+    # Two parts survived the failure, only the third is encoded again
+    assert len(encoded) == 3
+    assert not os.path.exists(output_path + ".parts")
+
+def test_render_parts_stops_in_every_thread(monkeypatch, tmp_path):
+    """Test the part encoders see the render's stop event and keep their work for a retry"""
+    stop = threading.Event()
+
+    def run_ffmpeg(args, **kwargs):
+        stop.set()
+        check_stopped()
+
+    monkeypatch.setattr(video_generation, "run_ffmpeg", run_ffmpeg)
+    backend = FFmpegBackend()
+    parts = backend.split_parts(build_timeline([4.0, 2.0], 13.0))
+    output_path = str(tmp_path / "out.mp4")
+
+    with stop_on(stop), pytest.raises(RenderCancelled):
+        backend.render_parts([_source("a.mp4"), _source("b.mp4", duration=2.0)], parts, output_path)
+    assert os.path.isdir(output_path + ".parts")
+
+@pytest.mark.parametrize("on_progress", [None, lambda fraction: None])
+def test_stop_kills_running_ffmpeg(on_progress):
+    """Test setting the stop event kills an ffmpeg run instead of waiting for it"""
+    stop = threading.Event()
+    threading.Timer(0.3, stop.set).start()
+    started = time.monotonic()
+
+    with stop_on(stop), pytest.raises(RenderCancelled):
+        run_ffmpeg(
+            ["-re", "-f", "lavfi", "-i", "testsrc=duration=60:size=64x64:rate=10", "-f", "null", "-"],
+            duration=60, on_progress=on_progress
+        )
+    assert time.monotonic() - started < 10
+
+def test_stage_timer_records_overlapping_stages():
+    """Test stages running side by side show overlapping start/end offsets"""
+    timer = StageTimer()
+    with timer.stage("video"):
+        with timer.stage("audio"):
+            time.sleep(0.01)
+        time.sleep(0.01)
+
+    summary = timer.summary()
+    assert summary["video"]["start"] <= summary["audio"]["start"]
+    assert summary["audio"]["end"] <= summary["video"]["end"]
+    assert summary["video"]["seconds"] >= 0.02
+    assert summary["total"]["seconds"] >= summary["video"]["end"]
@@ -0,0 +1,75 @@
+from fractions import Fraction
+import pytest
+from app.services.profiles import get_profile
+from app.services.smart_render import SmartPiece, plan_pieces, snap_timeline
+from app.services.timeline import SourceClip, build_timeline
+from app.services.video_generation import can_smart_render, smart_piece_command
+from app.utils.ffmpeg import MediaInfo
+
+FPS = Fraction(30)
+
+def _source(path="clip.mp4", duration=10.0, codec="h264", width=1280):
+    return SourceClip(path, MediaInfo(
+        duration=duration, width=width, height=720, fps="30/1", codec=codec,
+        profile="High", pix_fmt="yuv420p", time_base="1/15360"
+    ))
+
+def _pieces(pieces):
+    return [(piece.source_index, piece.start, piece.end, piece.copy) for piece in pieces]
+
+def test_plan_copies_whole_gops_and_encodes_cuts():
+    """Test only the partial GOP before each out point is re-encoded"""
+    # Keyframes every second; 10s and 8s clips shortened to 6.5s and 5.2s
+    cut_points = {0: [float(t) for t in range(10)] + [10.0], 1: [float(t) for t in range(8)] + [8.0]}
+    timeline = build_timeline([10.0, 8.0], 11.7)
+
+    assert _pieces(plan_pieces(timeline, FPS, cut_points)) == [
+        (0, 0, 180, True), (0, 180, 195, False),
+        (1, 0, 150, True), (1, 150, 156, False)
+    ]
+
+def test_plan_copies_clips_played_to_their_end():
+    """Test the end of a clip counts as a cut point"""
+    cut_points = {0: [0.0, 5.0, 10.0]}
+    assert _pieces(plan_pieces(build_timeline([10.0]), FPS, cut_points)) == [(0, 0, 300, True)]
+
+def test_plan_encodes_entries_without_whole_gop():
+    """Test an entry shorter than its first GOP is re-encoded entirely"""
+    cut_points = {0: [0.0, 8.0, 10.0]}
+    timeline = build_timeline([10.0], 4.0)
+
+    assert _pieces(plan_pieces(timeline, FPS, cut_points)) == [(0, 0, 120, False)]
+
+def test_snap_moves_cuts_within_reach():
+    """Test cuts move to the nearest keyframe only within the allowed shift"""
+    cut_points = {0: [0.0, 2.0, 4.0, 6.0, 10.0], 1: [0.0, 4.0, 8.0]}
+    timeline = build_timeline([10.0, 8.0], 11.7)
+
+    snapped = snap_timeline(timeline, cut_points, 0.6)
+
+    # 6.5s snaps to 6.0s, 5.2s has no keyframe within 0.6s
+    assert [(entry.start, entry.end) for entry in snapped] == [(0.0, 6.0), (0.0, pytest.approx(5.2))]
+
+def test_can_smart_render_needs_matching_h264():
+    """Test smart rendering needs clips in the montage's format and a supported codec"""
+    assert can_smart_render([_source(), _source()])
+    assert not can_smart_render([_source(), _source(width=1920)])
+    assert not can_smart_render([_source(codec="hevc"), _source(codec="hevc")])
+    # The draft profile's 24 fps cap means every frame is re-encoded anyway
+    assert not can_smart_render([_source(), _source()], get_profile("draft"))
+
+def test_smart_piece_commands():
+    """Test copies seek onto their keyframe and bridges use their own parameter sets"""
+    source = _source()
+    profile = get_profile("standard")
+
+    copy = smart_piece_command(source, SmartPiece(0, 30, 180, copy=True), FPS, profile, "copy.mp4")
+    assert copy[:2] == ["-ss", "1.000000"]
+    assert copy[copy.index("-c:v") + 1] == "copy"
+    assert copy[copy.index("-frames:v") + 1] == "150"
+
+    bridge = smart_piece_command(source, SmartPiece(0, 180, 195, copy=False), FPS, profile, "bridge.mp4")
+    assert bridge[:2] == ["-ss", "5.983333"]
+    assert bridge[bridge.index("-x264-params") + 1] == "sps-id=1:repeat-headers=1"
+    assert bridge[bridge.index("-video_track_timescale") + 1] == "15360"
+    assert bridge[bridge.index("-frames:v") + 1] == "15"
@@ -0,0 +1,53 @@
+import pytest
+from app.services import media_index
+from app.services.timeline import SourceClip, build_timeline
+from app.services.video_generation import can_stream_copy
+from app.utils.ffmpeg import MediaInfo
+
+def spans(timeline):
+    return [(entry.source_index, round(entry.start, 3), round(entry.end, 3)) for entry in timeline]
+
+def test_timeline_without_target_duration():
+    """Test that clips play in full and in order by default"""
+    assert spans(build_timeline([10, 15, 20])) == [(0, 0, 10), (1, 0, 15), (2, 0, 20)]
+
+def test_timeline_shorter_duration_scales_proportionally():
+    """Test the README example: 10s, 15s and 20s shortened to 30s"""
+    assert spans(build_timeline([10, 15, 20], 30)) == [(0, 0, 6.667), (1, 0, 10), (2, 0, 13.333)]
+
+def test_timeline_longer_duration_loops_last_clip():
+    """Test that the last clip loops, with a partial loop for the remainder"""
+    timeline = build_timeline([10, 15], 47)
+
+    assert spans(timeline) == [(0, 0, 10), (1, 0, 15), (1, 0, 15), (1, 0, 7)]
+    assert sum(entry.duration for entry in timeline) == pytest.approx(47)
+
+def _source(path="clip.mp4", duration=4.0, width=1920, height=1080, codec="h264", fps="25/1"):
+    return SourceClip(path, MediaInfo(
+        duration=duration, width=width, height=height, fps=fps, codec=codec,
+        profile="High", pix_fmt="yuv420p", time_base="1/12800"
+    ))
+
+@pytest.fixture
+def keyframes(monkeypatch):
+    """Keyframes every second"""
+    monkeypatch.setattr(media_index, "keyframe_times", lambda path: [float(t) for t in range(60)])
+
+def test_stream_copy_when_clips_match(keyframes):
+    """Test that matching clips played in full can be remuxed"""
+    sources = [_source(), _source(duration=6.0)]
+    assert can_stream_copy(sources, build_timeline([4.0, 6.0], 16))
+
+def test_stream_copy_rejects_mismatched_streams(keyframes):
+    """Test that any difference in stream parameters forces a re-encode"""
+    assert not can_stream_copy([_source(), _source(width=1280, height=720)], build_timeline([4.0, 4.0]))
+    assert not can_stream_copy([_source(), _source(fps="30/1")], build_timeline([4.0, 4.0]))
+    assert not can_stream_copy([_source(codec="vp9"), _source(codec="vp9")], build_timeline([4.0, 4.0]))
+
+def test_stream_copy_requires_cuts_on_keyframes(keyframes):
+    """Test that shortening is only remuxed when every cut lands on a keyframe"""
+    sources = [_source(), _source()]
+    # Halving 4s clips cuts at 2.0s, a keyframe
+    assert can_stream_copy(sources, build_timeline([4.0, 4.0], 4))
+    # 0.7 * 4s cuts at 2.8s, inside a GOP
+    assert not can_stream_copy(sources, build_timeline([4.0, 4.0], 5.6))
@@ -1,250 +1,163 @@
+import asyncio
+import os
+import shutil
+import subprocess
 import pytest
-from unittest.mock import patch, MagicMock
-from app.services.video_generation import VideoGenerationService
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.db.base import Base
+from app.models.user import User
 from app.models.video_task import VideoTask
+from app.services import media_index
+from app.services.video_generation import VideoGenerationService
+from app.utils.download import downloader
+from app.utils.ffmpeg import probe
 
 @pytest.fixture
-def video_service(db_session):
-    return VideoGenerationService(db_session)
+def media(tmp_path):
+    """Two short clips of different sizes and a background track, by file name"""
+    files = {
+        "video1.mp4": ["-f", "lavfi", "-i", "testsrc=duration=2:size=96x64:rate=10"],
+        "video2.mp4": ["-f", "lavfi", "-i", "testsrc=duration=2:size=64x64:rate=10"],
+        "background.m4a": ["-f", "lavfi", "-i", "sine=duration=2"],
+    }
+    for name, args in files.items():
+        subprocess.run(
+            [settings.FFMPEG_BINARY, "-v", "error", "-y", *args, str(tmp_path / name)],
+            check=True
+        )
+    return {name: tmp_path / name for name in files}
+
+@pytest.fixture
+def video_service(tmp_path, monkeypatch, media):
+    """A service on a SQLite database, rendering into tmp_path from local copies of media"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'tasks.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(media_index, "SessionLocal", factory)
+    monkeypatch.setattr(settings, "STORAGE_DIR", str(tmp_path / "storage"))
+    monkeypatch.setattr(settings, "DOWNLOAD_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "AUDIO_CACHE_ENABLED", False)
+    monkeypatch.chdir(tmp_path)
+
+    async def download(url, local_path, byte_limit=None):
+        source = media.get(url.rsplit("/", 1)[-1])
+        if source is None:
+            return None
+        shutil.copyfile(source, local_path)
+        return local_path
+
+    async def fetch_movie_index(url):
+        return None
+
+    monkeypatch.setattr(downloader, "download", download)
+    monkeypatch.setattr(downloader, "fetch_movie_index", fetch_movie_index)
+
+    db = factory()
+    db.add(User(id="user", email="test@example.com", api_key="key", monthly_quota=100))
+    db.commit()
+    yield VideoGenerationService(db)
+    db.close()
+
+def _create(service, media_list, duration=None, background="background.m4a", output_format=None):
+    return service.create_task(
+        user_id="user",
+        background_url=f"https://example.com/{background}",
+        media_list=[f"https://example.com/{name}" for name in media_list],
+        duration=duration,
+        output_format=output_format
+    )
 
-def test_create_task(video_service, test_user):
+def _render(service, media_list, duration=None, background="background.m4a"):
+    task = _create(service, media_list, duration, background)
+    asyncio.run(service.generate_video(task.id))
+    return service.get_task(task.id)
+
+def test_create_task(video_service):
     """Test task creation with valid parameters"""
     task = video_service.create_task(
-        user_id=test_user.id,
+        user_id="user",
         background_url="https://example.com/background.mp3",
         media_list=["https://example.com/video1.mp4"],
         duration=30
     )
-    
+
     assert isinstance(task, VideoTask)
-    assert task.user_id == test_user.id
+    assert task.user_id == "user"
     assert task.status == "pending"
     assert task.progress == 0.0
     assert task.background_url == "https://example.com/background.mp3"
     assert task.media_list == ["https://example.com/video1.mp4"]
     assert task.duration == 30
 
-def test_update_task_progress(video_service, test_user):
+def test_update_task_progress(video_service):
     """Test updating task progress"""
     task = video_service.create_task(
-        user_id=test_user.id,
+        user_id="user",
         background_url="https://example.com/background.mp3",
         media_list=["https://example.com/video1.mp4"]
     )
-    
+
     video_service.update_task_progress(
         task_id=task.id,
         progress=0.5,
         status="processing"
     )
-    
+
     updated_task = video_service.get_task(task.id)
     assert updated_task.progress == 0.5
     assert updated_task.status == "processing"
 
-@patch('app.utils.download.download_file')
-@patch('moviepy.editor.VideoFileClip')
-@patch('moviepy.editor.AudioFileClip')
-@patch('moviepy.editor.concatenate_videoclips')
-def test_generate_video_basic(
-    mock_concatenate, mock_audio, mock_video_clip, mock_download,
-    video_service, test_user, tmp_path
-):
-    """Test basic video generation with sequential arrangement"""
-    # Mock downloads
-    mock_download.side_effect = lambda url, _: str(tmp_path / "test_file.mp4")
-    
-    # Mock video clips
-    clip1 = MagicMock()
-    clip1.duration = 10
-    clip1.size = (1920, 1080)
-    clip1.without_audio.return_value = clip1
-    
-    clip2 = MagicMock()
-    clip2.duration = 15
-    clip2.size = (1280, 720)
-    clip2.without_audio.return_value = clip2
-    clip2.resize.return_value = clip2
-    clip2.crop.return_value = clip2
-    
-    mock_video_clip.side_effect = [clip1, clip2]
-    
-    # Mock audio
-    mock_audio_clip = MagicMock()
-    mock_audio_clip.duration = 30
-    mock_audio.return_value = mock_audio_clip
-    
-    # Mock final video
-    mock_final = MagicMock()
-    mock_concatenate.return_value = mock_final
-    
-    # Create and run task
-    task = video_service.create_task(
-        user_id=test_user.id,
-        background_url="https://example.com/background.mp3",
-        media_list=[
-            "https://example.com/video1.mp4",
-            "https://example.com/video2.mp4"
-        ]
-    )
-    
-    video_service.generate_video(task.id)
-    
-    # Verify aspect ratio handling
-    clip2.resize.assert_called_once()
-    clip2.crop.assert_called_once()
-    
-    # Verify concatenation
-    mock_concatenate.assert_called_once()
-    
-    # Verify final state
-    final_task = video_service.get_task(task.id)
-    assert final_task.status == "done"
-    assert final_task.progress == 1.0
-    assert final_task.output_url is not None
-
-@patch('app.utils.download.download_file')
-@patch('moviepy.editor.VideoFileClip')
-@patch('moviepy.editor.AudioFileClip')
-@patch('moviepy.editor.concatenate_videoclips')
-def test_generate_video_with_shorter_duration(
-    mock_concatenate, mock_audio, mock_video_clip, mock_download,
-    video_service, test_user, tmp_path
-):
-    """Test video generation with duration shorter than total length"""
-    # Mock downloads
-    mock_download.side_effect = lambda url, _: str(tmp_path / "test_file.mp4")
-    
-    # Mock video clips
-    clips = []
-    for duration in [10, 15, 20]:  # Total: 45 seconds
-        clip = MagicMock()
-        clip.duration = duration
-        clip.size = (1920, 1080)
-        clip.without_audio.return_value = clip
-        clip.subclip.return_value = clip
-        clips.append(clip)
-    
-    mock_video_clip.side_effect = clips
-    
-    # Mock audio
-    mock_audio_clip = MagicMock()
-    mock_audio_clip.duration = 60
-    mock_audio.return_value = mock_audio_clip
-    
-    # Create and run task with 30-second duration
-    task = video_service.create_task(
-        user_id=test_user.id,
-        background_url="https://example.com/background.mp3",
-        media_list=[
-            "https://example.com/video1.mp4",
-            "https://example.com/video2.mp4",
-            "https://example.com/video3.mp4"
-        ],
-        duration=30
-    )
-    
-    video_service.generate_video(task.id)
-    
-    # Verify clips were scaled
-    for clip in clips:
-        clip.subclip.assert_called_once()
-    
-    # Verify audio was trimmed
-    mock_audio_clip.subclip.assert_called_with(0, 30)
-    
-    # Verify final state
-    final_task = video_service.get_task(task.id)
-    assert final_task.status == "done"
-    assert final_task.progress == 1.0
-
-@patch('app.utils.download.download_file')
-@patch('moviepy.editor.VideoFileClip')
-@patch('moviepy.editor.AudioFileClip')
-@patch('moviepy.editor.concatenate_videoclips')
-def test_generate_video_with_longer_duration(
-    mock_concatenate, mock_audio, mock_video_clip, mock_download,
-    video_service, test_user, tmp_path
-):
-    """Test video generation with duration longer than total length"""
-    # Mock downloads
-    mock_download.side_effect = lambda url, _: str(tmp_path / "test_file.mp4")
-    
-    # Mock video clips
-    clips = []
-    for duration in [10, 15]:  # Total: 25 seconds
-        clip = MagicMock()
-        clip.duration = duration
-        clip.size = (1920, 1080)
-        clip.without_audio.return_value = clip
-        clips.append(clip)
-    
-    mock_video_clip.side_effect = clips
-    
-    # Mock audio
-    mock_audio_clip = MagicMock()
-    mock_audio_clip.duration = 20
-    mock_audio.return_value = mock_audio_clip
-    
-    # Create and run task with 40-second duration
-    task = video_service.create_task(
-        user_id=test_user.id,
-        background_url="https://example.com/background.mp3",
-        media_list=[
-            "https://example.com/video1.mp4",
-            "https://example.com/video2.mp4"
-        ],
-        duration=40
-    )
-    
-    video_service.generate_video(task.id)
-    
-    # Verify last clip was used for looping
-    assert mock_concatenate.call_args[0][0][-1] == clips[-1]
-    
-    # Verify audio was looped
-    mock_audio_clip.loop.assert_called_with(duration=40)
-    
-    # Verify final state
-    final_task = video_service.get_task(task.id)
-    assert final_task.status == "done"
-    assert final_task.progress == 1.0
-
-@patch('app.utils.download.download_file')
-def test_generate_video_download_errors(mock_download, video_service, test_user):
+@pytest.mark.parametrize("duration, expected", [(None, 4.0), (3, 3.0), (6, 6.0)])
+def test_generate_video(video_service, duration, expected):
+    """Test clips of different sizes play in order, shortened or looped to the requested duration"""
+    task = _render(video_service, ["video1.mp4", "video2.mp4"], duration)
+
+    assert task.status == "done"
+    assert task.progress == 1.0
+    assert task.output_url == f"/storage/videos/output_{task.id}.mp4"
+    info = probe(f"storage/videos/output_{task.id}.mp4")
+    # The first clip sets the size, the background track is fitted to the video
+    assert info.size == (96, 64)
+    assert info.audio_codec is not None
+    assert info.duration == pytest.approx(expected, abs=0.2)
+
+def test_resumed_hls_render_withdraws_the_old_playlist(video_service, monkeypatch):
+    """Test a resumed HLS render unpublishes the earlier playlist rather than rewinding it"""
+    task = _create(video_service, ["video1.mp4", "video2.mp4"], output_format="hls")
+    stale_url = f"/storage/videos/hls_{task.id}/playlist.m3u8"
+    hls_dir = f"storage/videos/hls_{task.id}"
+    # An earlier attempt published its playlist, then its worker died
+    os.makedirs(hls_dir)
+    with open(f"{hls_dir}/playlist.m3u8", "w") as f:
+        f.write("#EXTM3U\n#EXT-X-PLAYLIST-TYPE:EVENT\n#EXTINF:2.000000,\nsegment_00000.m4s\n")
+    with open(f"{hls_dir}/segment_00000.m4s", "wb") as f:
+        f.write(b"stale")
+    video_service.update_task_progress(task.id, 0.6, "processing", playlist_url=stale_url)
+
+    published = []
+    withdraw = video_service._withdraw_playlist
+    monkeypatch.setattr(video_service, "_withdraw_playlist", lambda task: (published.append(task.playlist_url), withdraw(task)))
+    asyncio.run(video_service.generate_video(task.id))
+
+    task = video_service.get_task(task.id)
+    assert published == [stale_url]
+    assert task.status == "done"
+    assert task.playlist_url == stale_url
+    with open(f"{hls_dir}/segment_00000.m4s", "rb") as f:
+        assert f.read() != b"stale"
+
+def test_generate_video_download_errors(video_service):
     """Test error handling for download failures"""
-    # Test audio download failure
-    mock_download.return_value = None
-    
-    task = video_service.create_task(
-        user_id=test_user.id,
-        background_url="https://example.com/background.mp3",
-        media_list=["https://example.com/video1.mp4"]
-    )
-    
     with pytest.raises(Exception) as exc_info:
-        video_service.generate_video(task.id)
-    
+        _render(video_service, ["video1.mp4"], background="missing.m4a")
     assert "Failed to download background audio" in str(exc_info.value)
-    
-    error_task = video_service.get_task(task.id)
-    assert error_task.status == "error"
-    assert error_task.error_message is not None
-    
-    # Test video download failure
-    mock_download.side_effect = lambda url, _: None if "video" in url else "audio.mp3"
-    
-    task = video_service.create_task(
-        user_id=test_user.id,
-        background_url="https://example.com/background.mp3",
-        media_list=["https://example.com/video1.mp4"]
-    )
-    
+
     with pytest.raises(Exception) as exc_info:
-        video_service.generate_video(task.id)
-    
-    assert "Failed to download video" in str(exc_info.value)
-    
-    error_task = video_service.get_task(task.id)
-    assert error_task.status == "error"
-    assert error_task.error_message is not None 
\ No newline at end of file
+        _render(video_service, ["missing.mp4"])
+    assert "Failed to download any media files" in str(exc_info.value)
+
+    tasks = video_service.db.query(VideoTask).all()
+    assert [task.status for task in tasks] == ["error", "error"]
+    assert all(task.error for task in tasks)
@@ -0,0 +1,174 @@
+import asyncio
+import time
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.db.base import Base
+from app.models.render_job import RenderJob
+from app.models.user import User
+from app.models.video_task import VideoTask
+from app.services import worker as worker_module
+from app.services.job_queue import JobQueue
+from app.services.worker import RenderWorker
+from app.utils.ffmpeg import RenderCancelled
+
+@pytest.fixture
+def sessions(tmp_path):
+    """A SQLite database with one user and three queued tasks"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'tasks.db'}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    with factory() as db:
+        db.add(User(id="user", email="user@example.com", api_key="key"))
+        for k in range(3):
+            db.add(VideoTask(
+                id=f"task-{k}", user_id="user", status="pending",
+                background_url="https://example.com/a.mp3", media_list=[]
+            ))
+            db.flush()
+            JobQueue.enqueue(db, db.get(VideoTask, f"task-{k}"))
+        db.commit()
+    return factory
+
+def test_claim_takes_each_task_once(sessions, monkeypatch):
+    """Test workers sharing a database never take the same task"""
+    monkeypatch.setattr(settings, "JOB_MAX_RUNNING_PER_USER", 0)
+    first, second = RenderWorker(session_factory=sessions), RenderWorker(session_factory=sessions)
+
+    claimed = [first.claim(), second.claim(), first.claim(), second.claim()]
+
+    assert sorted(claimed[:3]) == ["task-0", "task-1", "task-2"]
+    assert claimed[3] is None
+    with sessions() as db:
+        assert {task.status for task in db.query(VideoTask)} == {"processing"}
+
+def test_worker_renders_with_its_own_sessions(sessions, monkeypatch):
+    """Test every task is rendered with a session opened by the worker, up to the concurrency"""
+    rendered, running, peak = [], [], []
+
+    class FakeService:
+        def __init__(self, db):
+            self.db = db
+
+        async def generate_video(self, task_id, stop=None):
+            running.append(task_id)
+            peak.append(len(running))
+            rendered.append((task_id, self.db))
+            await asyncio.sleep(0.01)
+            running.remove(task_id)
+            if task_id == "task-1":
+                raise Exception("render failed")
+
+    monkeypatch.setattr(worker_module, "VideoGenerationService", FakeService)
+    worker = RenderWorker(concurrency=2, poll_seconds=0.01, session_factory=sessions)
+
+    async def main():
+        stop = asyncio.Event()
+        asyncio.get_running_loop().call_later(0.2, stop.set)
+        await worker.run(stop)
+
+    asyncio.run(main())
+
+    # A failed render does not stop the worker
+    assert sorted(task_id for task_id, _ in rendered) == ["task-0", "task-1", "task-2"]
+    assert len({id(db) for _, db in rendered}) == 3
+    assert max(peak) == 2
+    with sessions() as db:
+        assert {job.task_id: job.state for job in db.query(RenderJob)} == {
+            "task-0": "done", "task-1": "failed", "task-2": "done"
+        }
+
+def test_lost_lease_stops_render_before_session_closes(sessions, monkeypatch):
+    """Test a render whose lease is lost is stopped and waited for, and its job left to the new owner"""
+    events = []
+
+    class FakeSession:
+        def close(self):
+            events.append("closed")
+
+    class FakeService:
+        def __init__(self, db):
+            pass
+
+        async def generate_video(self, task_id, stop=None):
+            def render():
+                # Stands in for an ffmpeg run killed once stop is set
+                stop.wait(5)
+                time.sleep(0.05)
+                events.append("render exited")
+            await asyncio.to_thread(render)
+            raise RenderCancelled("Render stopped")
+
+    monkeypatch.setattr(worker_module, "VideoGenerationService", FakeService)
+    queue = JobQueue(sessions)
+    worker = RenderWorker(session_factory=FakeSession, queue=queue, heartbeat_seconds=0.01)
+    task_id = queue.claim("another worker")
+
+    started = time.monotonic()
+    asyncio.run(worker.run_task(task_id))
+
+    assert time.monotonic() - started < 5
+    assert events == ["render exited", "closed"]
+    with sessions() as db:
+        job = db.get(RenderJob, task_id)
+        assert (job.state, job.lease_owner) == ("leased", "another worker")
+
+def test_failing_heartbeat_stops_render_once_lease_runs_out(sessions, monkeypatch):
+    """Test heartbeat errors are retried, and the render stopped once the lease has run out"""
+    attempts, stopped = [], []
+
+    class FailingQueue(JobQueue):
+        def heartbeat(self, task_id, owner):
+            attempts.append(time.monotonic())
+            raise Exception("database unreachable")
+
+    class FakeService:
+        def __init__(self, db):
+            pass
+
+        async def generate_video(self, task_id, stop=None):
+            await asyncio.to_thread(stop.wait, 5)
+            stopped.append(time.monotonic())
+            raise RenderCancelled("Render stopped")
+
+    monkeypatch.setattr(worker_module, "VideoGenerationService", FakeService)
+    queue = FailingQueue(sessions, lease_seconds=0.2)
+    worker = RenderWorker(session_factory=sessions, queue=queue, heartbeat_seconds=0.01)
+    task_id = queue.claim(worker.worker_id)
+
+    started = time.monotonic()
+    asyncio.run(worker.run_task(task_id))
+
+    assert len(attempts) > 1
+    # Not stopped on the first error, only once the lease was past saving
+    assert stopped[0] - started >= 0.2
+    assert stopped[0] - started < 5
+
+def test_failed_finish_is_retried(sessions, monkeypatch):
+    """Test a job whose close fails on a database error is closed on a retry instead of staying leased"""
+    failures = [Exception("database unreachable")] * 2
+
+    class FlakyQueue(JobQueue):
+        def finish(self, task_id, owner, state="done"):
+            if failures:
+                raise failures.pop()
+            return super().finish(task_id, owner, state)
+
+    class FakeService:
+        def __init__(self, db):
+            pass
+
+        async def generate_video(self, task_id, stop=None):
+            pass
+
+    monkeypatch.setattr(worker_module, "VideoGenerationService", FakeService)
+    queue = FlakyQueue(sessions)
+    worker = RenderWorker(session_factory=sessions, queue=queue, heartbeat_seconds=0.01)
+    task_id = queue.claim(worker.worker_id)
+
+    asyncio.run(worker.run_task(task_id))
+
+    assert not failures
+    with sessions() as db:
+        assert db.get(RenderJob, task_id).state == "done"